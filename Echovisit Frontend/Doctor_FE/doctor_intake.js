@@ -3,6 +3,41 @@ document.addEventListener('DOMContentLoaded', () => {
   const API_BASE = 'http://127.0.0.1:5000'; // adjust if needed
   const form = document.getElementById('patientForm');
 
+  // Drug-name suggestions from /drugs/autocomplete, shown through a <datalist>
+  function attachDrugAutocomplete(input) {
+    if (!input) return;
+    const list = document.createElement('datalist');
+    list.id = `${input.id}-suggestions`;
+    input.after(list);
+    input.setAttribute('list', list.id);
+    input.setAttribute('autocomplete', 'off');
+
+    let timer = null;
+    let lastQuery = '';
+    input.addEventListener('input', () => {
+      clearTimeout(timer);
+      timer = setTimeout(async () => {
+        const q = input.value.trim();
+        if (q.length < 2 || q === lastQuery) return;
+        lastQuery = q;
+        try {
+          const r = await fetch(`${API_BASE}/drugs/autocomplete?q=${encodeURIComponent(q)}&limit=8`);
+          const { suggestions = [] } = await r.json();
+          if (q !== input.value.trim()) return; // user kept typing
+          list.innerHTML = '';
+          suggestions.forEach(s => {
+            const opt = document.createElement('option');
+            opt.value = s.name;
+            if (s.generic && s.generic.toLowerCase() !== s.name.toLowerCase()) opt.label = s.generic;
+            list.appendChild(opt);
+          });
+        } catch (e) {
+          console.warn('drug autocomplete failed', e);
+        }
+      }, 150);
+    });
+  }
+
   const welcomeEl = document.querySelector("h1");
   const doctorName = sessionStorage.getItem("doctor_name"); // or however you store it
   if (welcomeEl && doctorName) {
@@ -149,6 +184,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const entryRow  = document.getElementById('meds-entry');
 
     const nameIn = document.getElementById('med-name-input');
+    attachDrugAutocomplete(nameIn);
     const doseIn = document.getElementById('med-dose-input');
     const freqIn = document.getElementById('med-freq-input');
     const addBtn = document.getElementById('med-add-btn');
@@ -236,6 +272,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const entryRow  = document.getElementById('newmeds-entry');
 
     const nameIn = document.getElementById('newmed-name-input');
+    attachDrugAutocomplete(nameIn);
     const doseIn = document.getElementById('newmed-dose-input');
     const freqIn = document.getElementById('newmed-freq-input');
     const addBtn = document.getElementById('newmed-add-btn');
@@ -186,7 +186,7 @@ window.addEventListener('DOMContentLoaded', async () => {
       const key = 'simplified|en';
       if (cache.has(key)) return cache.get(key);
       const src = makeBaseSource();
-      const data = await postJSON(`${API_BASE}/simplify_all`, src);
+      const data = await postJSON(`${API_BASE}/simplify_all`, { ...src, visit_id: visitId });
       cache.set(key, data);
       return data;
     }
@@ -200,7 +200,8 @@ window.addEventListener('DOMContentLoaded', async () => {
         lang,
         mode,
         transcript: src.transcript,
-        summary: src.summary
+        summary: src.summary,
+        visit_id: visitId
       });
       cache.set(key, data);
       return data;
@@ -427,6 +428,28 @@ window.addEventListener('DOMContentLoaded', async () => {
     }
   });
 
+  // NDJSON events from /qa: {"event":"delta","data":{"text"}}... then {"event":"done","data":{answer, followups}}
+  async function readQaStream(res, onText){
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buf = "", done = null;
+    for (;;) {
+      const { value, done: finished } = await reader.read();
+      if (finished) break;
+      buf += decoder.decode(value, { stream: true });
+      let nl;
+      while ((nl = buf.indexOf("\n")) >= 0) {
+        const line = buf.slice(0, nl).trim();
+        buf = buf.slice(nl + 1);
+        if (!line) continue;
+        const { event, data } = JSON.parse(line);
+        if (event === "delta" && data && data.text) onText(data.text);
+        else if (event === "done") done = data;
+      }
+    }
+    return done;
+  }
+
   qaForm.addEventListener("submit", async (e) => {
     e.preventDefault();
 
@@ -440,19 +463,42 @@ window.addEventListener('DOMContentLoaded', async () => {
 
     const src = typeof makeBaseSource === "function" ? makeBaseSource() : { transcript:"", summary:{} };
     const url = `${API}/qa`;
-    const body = { question: q, context: src };
+    const body = { question: q, context: src, visit_id: visitId };
 
     try{
+      // Ask for token streaming: the answer is shown while it is generated
       const res = await fetch(url, {
         method: "POST",
-        headers: {"Content-Type":"application/json"},
+        headers: {"Content-Type":"application/json", "Accept":"application/x-ndjson"},
         body: JSON.stringify(body)
       });
-      const raw = await res.text();
-      let data; try { data = JSON.parse(raw); } catch { data = { answer: raw }; }
 
-      typing.remove();
-      qaAdd("bot", data.answer || "Sorry — I didn’t get that.");
+      let data, botMsg;
+      if ((res.headers.get("Content-Type") || "").includes("application/x-ndjson") && res.body){
+        let msgBody = null;
+        data = await readQaStream(res, (text) => {
+          if (!msgBody){
+            typing.remove();
+            msgBody = qaAdd("bot", "").lastElementChild;
+          }
+          msgBody.textContent += text;
+          qaStream.scrollTop = qaStream.scrollHeight;
+        });
+        data = data || {};
+        const answer = data.answer || (msgBody && msgBody.textContent) || "Sorry — I didn’t get that.";
+        if (msgBody) { msgBody.textContent = answer; botMsg = msgBody.parentElement; }
+        else { typing.remove(); botMsg = qaAdd("bot", answer); }
+      } else {
+        const raw = await res.text();
+        try { data = JSON.parse(raw); } catch { data = { answer: raw }; }
+        typing.remove();
+        botMsg = qaAdd("bot", data.answer || "Sorry — I didn’t get that.");
+      }
+
+      // answered from the common-questions list rather than from this visit
+      if (data.source === "faq") {
+        botMsg.querySelector(".qa-meta").textContent += " · Common question";
+      }
 
       if (Array.isArray(data.followups) && data.followups.length){
         const chips = document.createElement("div");
@@ -469,7 +515,7 @@ window.addEventListener('DOMContentLoaded', async () => {
           };
           chips.appendChild(btn);
         });
-        qaStream.lastElementChild.appendChild(chips);
+        botMsg.appendChild(chips);
         qaStream.scrollTop = qaStream.scrollHeight;
       }
     }catch(err){
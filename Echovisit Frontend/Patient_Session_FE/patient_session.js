@@ -68,41 +68,69 @@ document.addEventListener('DOMContentLoaded', async () => {
   try {
     const doctorsMap = await getDoctorsMap();
 
-    const resp = await fetch(`http://127.0.0.1:5000/visits/patient/${patientId}`);
-    const data = await resp.json();
-
-    const visits = data.visits || [];
     const grid = document.getElementById('grid');
     grid.innerHTML = '';
 
-    visits.forEach(v => {
-      const visitName = v["name of visit"] || "Unnamed Visit";
-      const clinicName = v.clinic || "Unknown Clinic";
-      const doctorName = doctorsMap[v.doctor_id] || "Unknown Doctor";
-
-      const dateObj = v.visit_date ? new Date(v.visit_date) : null;
-      const formattedDate = dateObj && !isNaN(dateObj)
-        ? dateObj.toLocaleDateString('en-US', { month: 'short', day: 'numeric', year: 'numeric' })
-        : "Invalid Date";
-
-      const card = document.createElement('article');
-      card.className = 'card';
-      card.dataset.date = v.visit_date || "";
-      card.dataset.provider = doctorName;
-      card.dataset.notes = visitName;
-
-      card.innerHTML = `
-        <div class="row">
-          <h3 class="title">${visitName}</h3>
-        </div>
-        <p class="meta">${formattedDate} • ${doctorName} • ${clinicName}</p>
-        <a class="btn" href="../Patient_FE/patient.html?visit_id=${v.id}">View Summary</a>
-      `;
-
-      grid.appendChild(card);
+    // Visits come newest first, a page at a time (list fields only; the
+    // summary page loads the full visit)
+    const moreBtn = document.createElement('button');
+    moreBtn.className = 'chip';
+    moreBtn.textContent = 'Load older visits';
+    moreBtn.hidden = true;
+    grid.after(moreBtn);
+
+    let nextCursor = null;
+    async function loadPage() {
+      const url = new URL(`http://127.0.0.1:5000/visits/patient/${patientId}`);
+      url.searchParams.set('limit', '20');
+      if (nextCursor) url.searchParams.set('cursor', nextCursor);
+      const resp = await fetch(url);
+      const data = await resp.json();
+      if (!resp.ok || data.success === false) throw new Error(data.error || `HTTP ${resp.status}`);
+
+      renderVisits(data.visits || []);
+      nextCursor = data.next_cursor || null;
+      moreBtn.hidden = !nextCursor;
+      applyFilters();
+    }
+
+    moreBtn.addEventListener('click', async () => {
+      moreBtn.disabled = true;
+      try { await loadPage(); }
+      catch (err) { console.error('Error loading visits:', err); }
+      finally { moreBtn.disabled = false; }
     });
 
-    applyFilters();
+    function renderVisits(visits) {
+      visits.forEach(v => {
+        const visitName = v["name of visit"] || "Unnamed Visit";
+        const clinicName = v.clinic || "Unknown Clinic";
+        const doctorName = doctorsMap[v.doctor_id] || "Unknown Doctor";
+
+        const dateObj = v.visit_date ? new Date(v.visit_date) : null;
+        const formattedDate = dateObj && !isNaN(dateObj)
+          ? dateObj.toLocaleDateString('en-US', { month: 'short', day: 'numeric', year: 'numeric' })
+          : "Invalid Date";
+
+        const card = document.createElement('article');
+        card.className = 'card';
+        card.dataset.date = v.visit_date || "";
+        card.dataset.provider = doctorName;
+        card.dataset.notes = visitName;
+
+        card.innerHTML = `
+          <div class="row">
+            <h3 class="title">${visitName}</h3>
+          </div>
+          <p class="meta">${formattedDate} • ${doctorName} • ${clinicName}</p>
+          <a class="btn" href="../Patient_FE/patient.html?visit_id=${v.id}">View Summary</a>
+        `;
+
+        grid.appendChild(card);
+      });
+    }
+
+    await loadPage();
   } catch (err) {
     console.error('Error loading visits:', err);
     alert('Could not load your visits. Please try again later.');
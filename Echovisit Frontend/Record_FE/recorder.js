@@ -9,6 +9,14 @@ const resultEl    = document.getElementById("result");
 const continueBtn = document.getElementById("continueBtn");
 
 const NEXT_PAGE_URL = "../Transcript_FE/review_transcript.html";
+const API_BASE = "http://127.0.0.1:5000";
+const CHUNK_MS = 5000;   // MediaRecorder timeslice uploaded while recording
+
+// Incremental upload state (if anything fails the review page sends the whole recording as a transcription job)
+let streamId = null;
+let chunkSeq = 0;
+let chunkUploads = Promise.resolve();
+let streamFailed = false;
 
 function setUI(recording) {
   isRecording = recording;
@@ -18,6 +26,37 @@ function setUI(recording) {
   if (recording) resultEl.textContent = "";
 }
 
+// ---- streaming upload: chunks are transcribed while the doctor is still talking
+async function openStream() {
+  streamId = null; chunkSeq = 0; streamFailed = false;
+  chunkUploads = Promise.resolve();
+  try {
+    const resp = await fetch(`${API_BASE}/transcribe_stream?filename=recording.webm`, { method: "POST" });
+    if (!resp.ok) throw new Error(`stream start failed (${resp.status})`);
+    streamId = (await resp.json()).session_id;
+  } catch (e) {
+    console.warn("Streaming transcription unavailable, will upload after stop:", e);
+    streamFailed = true;
+  }
+}
+
+function queueChunk(blob) {
+  if (!streamId || streamFailed) return;
+  const seq = chunkSeq++;
+  // upload in order; one failed chunk switches us to the full upload path
+  chunkUploads = chunkUploads.then(async () => {
+    if (streamFailed) return;
+    const form = new FormData();
+    form.append("chunk", blob, `chunk-${seq}.webm`);
+    form.append("seq", String(seq));
+    const resp = await fetch(`${API_BASE}/transcribe_stream/${streamId}/chunk`, { method: "POST", body: form });
+    if (!resp.ok) throw new Error(`chunk ${seq} failed (${resp.status})`);
+  }).catch((e) => {
+    console.warn("Chunk upload failed, falling back to full upload:", e);
+    streamFailed = true;
+  });
+}
+
 async function blobToDataURL(blob){
   return new Promise((resolve) => {
     const r = new FileReader();
@@ -31,6 +70,7 @@ async function start() {
     // start fresh
     sessionStorage.removeItem("echovisit-audio");
     sessionStorage.removeItem("echovisit-result");
+    sessionStorage.removeItem("echovisit-pending");
 
     stream = await navigator.mediaDevices.getUserMedia({ audio: true });
 
@@ -44,49 +84,34 @@ async function start() {
       : new MediaRecorder(stream);
 
     audioChunks = [];
-    mediaRecorder.ondataavailable = (e) => e.data && audioChunks.push(e.data);
+    await openStream();
+    mediaRecorder.ondataavailable = (e) => {
+      if (!e.data || !e.data.size) return;
+      audioChunks.push(e.data);
+      queueChunk(e.data);
+    };
 
     mediaRecorder.onstop = async () => {
       try {
         const type = canWebm ? "audio/webm" : (audioChunks[0]?.type || "audio/mp4");
         const audioBlob = new Blob(audioChunks, { type });
 
-        resultEl.textContent = "Uploading and processing audio…";
+        resultEl.textContent = "Uploading audio…";
         recordBtn.disabled = true; // prevent double clicks
 
-        const form = new FormData();
-        form.append("audio", audioBlob, "recording.webm");
-        form.append('new_meds_json', sessionStorage.getItem('new_meds_json') || '[]');
-        form.append('current_meds_json', sessionStorage.getItem('current_meds_json') || '[]');
-
-        const resp = await fetch("http://127.0.0.1:5000/transcribe", {
-          method: "POST",
-          body: form,
-        });
-
-        if (!resp.ok) {
-          resultEl.textContent = `❌ Upload failed (${resp.status}).`;
-          return;
-        }
-
-        let data;
-        try {
-          data = await resp.json();
-        } catch (e) {
-          console.error("JSON parse error:", e);
-          resultEl.textContent = "❌ Server returned invalid JSON.";
-          return;
-        }
-
-        resultEl.textContent = "✅ Uploaded. Transcript received.";
-
+        // The review page finishes the upload and renders each stage as the
+        // server streams it back, so we hand over as soon as the chunks are in.
+        await chunkUploads;
         const audioDataURL = await blobToDataURL(audioBlob);
         sessionStorage.setItem("echovisit-audio", audioDataURL);
-        sessionStorage.setItem("echovisit-result", JSON.stringify(data));
-        console.log("Saved echovisit-result:", data);
+        sessionStorage.setItem("echovisit-pending", JSON.stringify({
+          stream_id: streamFailed ? null : streamId,
+        }));
 
+        resultEl.textContent = "✅ Uploaded. Opening review…";
         continueBtn.hidden = false;
         continueBtn.onclick = () => { window.location.href = NEXT_PAGE_URL; };
+        window.location.href = NEXT_PAGE_URL;
 
       } catch (err) {
         console.error(err);
@@ -97,7 +122,7 @@ async function start() {
       }
     };
 
-    mediaRecorder.start();
+    mediaRecorder.start(streamFailed ? undefined : CHUNK_MS);
     setUI(true);
   } catch (err) {
     console.error("Mic error:", err);
@@ -91,13 +91,6 @@ window.addEventListener('DOMContentLoaded', () => {
       document.getElementById("playbackWrap").hidden = false;
     }
   
-    // Parse payload once
-    let payload = {};
-    try { payload = JSON.parse(resultRaw || "{}"); } catch(e){ console.error("Bad JSON in session:", e); }
-  
-    // ---------- DEBUG: show the real shape in console ----------
-    console.log("echovisit-result (parsed):", payload);
-  
     // Helpers
     const get  = (o,p)=>p.split('.').reduce((x,k)=>(x && x[k] != null) ? x[k] : undefined, o);
     const pick = (o,paths,fb="") => { for (const p of paths) { const v=get(o,p); if (v!=null && String(v).trim()!=="") return v; } return fb; };
@@ -122,19 +115,19 @@ window.addEventListener('DOMContentLoaded', () => {
       try { return JSON.stringify(first, null, 2); } catch { return String(first); }
     }
   
-    const summary = pick(payload, ["summary"], null) || payload;
-  
-    const data = {
-      transcript:  pick(payload, ["transcript","text","summary.transcript"]),
-      allergies:   pick(summary, ["allergies"], "")       || findByKeyLike(summary, /allerg/i),
-      symptoms:    pick(summary, ["symptoms"], "")        || findByKeyLike(summary, /symptom/i),
-      diagnosis:   pick(summary, ["diagnosis"], "")       || findByKeyLike(summary, /diagnos/i),
-      medications: pick(summary, ["medication","medications"], "") || findByKeyLike(summary, /medic(at|ine)|rx|meds/i),
-      instructions:pick(summary, ["follow-up-instructions","instructions","follow_up_instructions"], "") || findByKeyLike(summary, /instruct|follow[-_\s]?up/i),
-      notes:       pick(summary, ["notes","additional_notes"], "") || findByKeyLike(summary, /note/i),
-    };
+    function mapPayload(payload) {
+      const summary = pick(payload, ["summary"], null) || payload;
   
-    console.log("mapped (after fuzzy):", data);
+      return {
+        transcript:  pick(payload, ["transcript","text","summary.transcript"]),
+        allergies:   pick(summary, ["allergies"], "")       || findByKeyLike(summary, /allerg/i),
+        symptoms:    pick(summary, ["symptoms"], "")        || findByKeyLike(summary, /symptom/i),
+        diagnosis:   pick(summary, ["diagnosis"], "")       || findByKeyLike(summary, /diagnos/i),
+        medications: pick(summary, ["medication","medications"], "") || findByKeyLike(summary, /medic(at|ine)|rx|meds/i),
+        instructions:pick(summary, ["follow-up-instructions","instructions","follow_up_instructions"], "") || findByKeyLike(summary, /instruct|follow[-_\s]?up/i),
+        notes:       pick(summary, ["notes","additional_notes"], "") || findByKeyLike(summary, /note/i),
+      };
+    }
 
     // Try to turn a JSON-looking string into a real value
     function parseMaybeJSON(val) {
@@ -191,6 +184,7 @@ window.addEventListener('DOMContentLoaded', () => {
     function setVal(id, val) {
       const el = byId(id);
       if (!el || val == null || String(val).trim() === "") return;
+      if (el.dataset.userEdited) return; // results can arrive after the doctor started editing
 
       // Skip bullet formatting for transcript only
       if (id === "rawTranscript") {
@@ -201,25 +195,175 @@ window.addEventListener('DOMContentLoaded', () => {
     }
 
 
-    if (data.transcript) {
-      setVal("rawTranscript", data.transcript);
-      document.getElementById("transcriptionWrap").hidden = false;
+    ["allergiesTA","symptomsTA","diagnosisTA","medicationsTA","instructionsTA","notesTA"].forEach(id => {
+      byId(id)?.addEventListener('input', e => { e.target.dataset.userEdited = "1"; });
+    });
+
+    function render(payload) {
+      const data = mapPayload(payload);
+      console.log("mapped (after fuzzy):", data);
+
+      if (data.transcript) {
+        setVal("rawTranscript", data.transcript);
+        document.getElementById("transcriptionWrap").hidden = false;
+
+        const transcriptTA = document.getElementById("rawTranscript");
+        if (transcriptTA && transcriptTA.value.trim()) {
+          transcriptTA.readOnly = true;
+          transcriptTA.classList.add("ta-locked");
+        }
+      }
+      setVal("allergiesTA",    data.allergies);
+      setVal("symptomsTA",     data.symptoms);
+      setVal("diagnosisTA",    data.diagnosis);
+      setVal("medicationsTA",  data.medications);
+      setVal("instructionsTA", data.instructions);
+      setVal("notesTA",        data.notes);
+    }
+
+    // ===== Progressive results: the recorder hands over a pending upload =====
+    // The server streams one NDJSON event per stage (transcript, summary, ...,
+    // done), so the transcript shows up as soon as Whisper is finished.
+    const API_BASE = "http://127.0.0.1:5000";
+    const blurb = document.getElementById("reviewBlurb");
+    const blurbText = blurb.textContent;
+    const STAGE_TEXT = {
+      transcript: "Transcript ready. Summarizing visit…",
+      summary:    "Summary ready. Preparing patient-friendly versions…",
+    };
 
-      const transcriptTA = document.getElementById("rawTranscript");
-      if (transcriptTA && transcriptTA.value.trim()) {
-        transcriptTA.readOnly = true;
-        transcriptTA.classList.add("ta-locked");
+    async function readEvents(resp, onEvent) {
+      const reader = resp.body.getReader();
+      const decoder = new TextDecoder();
+      let buf = "";
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buf += decoder.decode(value, { stream: true });
+        let nl;
+        while ((nl = buf.indexOf("\n")) >= 0) {
+          const line = buf.slice(0, nl).trim();
+          buf = buf.slice(nl + 1);
+          if (line) onEvent(JSON.parse(line));
+        }
       }
     }
-    setVal("allergiesTA",    data.allergies);
-    setVal("symptomsTA",     data.symptoms);
-    setVal("diagnosisTA",    data.diagnosis);
-    setVal("medicationsTA",  data.medications);
-    setVal("instructionsTA", data.instructions);
-    setVal("notesTA",        data.notes);
+
+    function medsForm(form) {
+      form.append('new_meds_json', sessionStorage.getItem('new_meds_json') || '[]');
+      form.append('current_meds_json', sessionStorage.getItem('current_meds_json') || '[]');
+      return form;
+    }
+
+    // Finish the streaming session; null when it is gone (server restart,
+    // expired, a chunk upload failed) and the whole recording must be sent.
+    async function finishStream(pending) {
+      if (!pending.stream_id) return null;
+      const resp = await fetch(`${API_BASE}/transcribe_stream/${pending.stream_id}/finish`, {
+        method: "POST",
+        body: medsForm(new FormData()),
+        headers: { Accept: "application/x-ndjson" },
+      });
+      if (resp.ok && resp.body) return resp;
+      console.warn("Streaming session unavailable, uploading the full recording:", resp.status);
+      return null;
+    }
+
+    // ---- whole-recording upload through the transcription job queue
+    const JOB_POLL_MS = 1000;
+    const JOB_STATUS_TEXT = {
+      queued:       "Uploaded. Waiting for a transcription worker…",
+      transcribing: "Transcribing audio…",
+      processing:   "Transcript ready. Summarizing visit…",
+    };
+
+    // Poll the transcription job until it finishes; resolves with the /transcribe-shaped result
+    async function waitForJob(jobId) {
+      while (true) {
+        await new Promise(r => setTimeout(r, JOB_POLL_MS));
+        const resp = await fetch(`${API_BASE}/transcribe_jobs/${jobId}`);
+        if (!resp.ok) throw new Error(`Job lookup failed (${resp.status}).`);
+
+        const job = await resp.json();
+        if (job.status === "done") return job.result;
+        if (job.status === "error") throw new Error(job.error || "Processing failed.");
+        blurb.textContent = JOB_STATUS_TEXT[job.status] || "Processing audio…";
+      }
+    }
+
+    async function uploadAsJob() {
+      const form = medsForm(new FormData());
+      const audioBlob = await (await fetch(audioData)).blob();
+      form.append("audio", audioBlob, "recording.webm");
+
+      const resp = await fetch(`${API_BASE}/transcribe_jobs`, {
+        method: "POST",
+        body: form,
+      });
+
+      if (resp.status === 503) {
+        throw new Error("Server is busy transcribing other visits. Please try again shortly.");
+      }
+      if (!resp.ok) {
+        throw new Error(`Upload failed (${resp.status}).`);
+      }
+
+      const { job_id } = await resp.json();
+      return waitForJob(job_id);
+    }
+
+    function finish(data) {
+      sessionStorage.setItem("echovisit-result", JSON.stringify(data));
+      sessionStorage.removeItem("echovisit-pending");
+      render(data);
+      blurb.textContent = blurbText;
+    }
+
+    async function processPending(pending) {
+      blurb.textContent = "Transcribing your recording…";
+      const partial = {};
+      let finished = false;
+      try {
+        const resp = await finishStream(pending);
+        if (!resp) {
+          // no stage-by-stage results here: the job queue keeps the upload
+          // off the request thread and answers 503 when it is full
+          blurb.textContent = "Uploading full recording…";
+          finish(await uploadAsJob());
+          return;
+        }
+        await readEvents(resp, ({ event, data }) => {
+          if (event === "error") throw new Error(data?.error || "Processing failed.");
+          if (event === "done") {
+            finished = true;
+            finish(data);
+            return;
+          }
+          partial[event] = data;
+          render(partial);
+          if (STAGE_TEXT[event]) blurb.textContent = STAGE_TEXT[event];
+        });
+        if (!finished) throw new Error("Connection closed before processing finished.");
+      } catch (e) {
+        console.error("Transcription failed:", e);
+        blurb.textContent = `❌ ${e.message || "Processing failed."}`;
+      }
+    }
+
+    const pendingRaw = sessionStorage.getItem("echovisit-pending");
+    if (pendingRaw && audioData) {
+      let pending = {};
+      try { pending = JSON.parse(pendingRaw); } catch { /* treat as a plain upload */ }
+      processPending(pending);
+    } else {
+      let payload = {};
+      try { payload = JSON.parse(resultRaw || "{}"); } catch(e){ console.error("Bad JSON in session:", e); }
+      console.log("echovisit-result (parsed):", payload);
+      render(payload);
+    }
   
     if (!audioData && !resultRaw) {
-      document.getElementById("reviewBlurb").textContent = "No recording found. Please record a summary first.";
+      blurb.textContent = "No recording found. Please record a summary first.";
     }
 
     confirmYes.addEventListener('click', async () => {
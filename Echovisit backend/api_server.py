@@ -1,7 +1,27 @@
-from flask import Flask, request, jsonify, Response
-from watsonx_agent import simplify_summary, translation_summary, questions_suggestions, translation_summary_safe, interactive_qa, drug_interactions
+from flask import Flask, request, jsonify, Response, g
+from watsonx_agent import simplify_summary, translation_summary, questions_suggestions, translation_summary_safe, interactive_qa, interactive_qa_stream, drug_interactions
 import json
-from watsonx_agent import process_transcript
+import copy
+import base64
+from watsonx_agent import process_transcript, iter_process_transcript
+from transcription_jobs import TranscriptionJobs
+from streaming_transcription import StreamingTranscriber
+from werkzeug.utils import secure_filename
+from audio_decode import decode_upload, AudioDecodeError, FFmpegNotFound
+from silence_trim import prepare_for_whisper
+from visit_store import VisitStore, content_hash, VISIT_STORE_FALLBACK_TTL
+from interaction_index import InteractionIndex
+from drug_names import DrugNameIndex
+from faq_index import FaqIndex
+from glossary import glossary_prepass, glossary_fallback
+from visit_repository import create_repository, VISIT_COLUMNS
+import visit_export
+import metrics
+import visit_retrieval
+import time
+import hmac
+import threading
+from cachetools import TTLCache
 from flask_cors import CORS
 import whisper
 import os
@@ -13,7 +33,16 @@ from datetime import datetime
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
-whisper_model = whisper.load_model("base")
+# `python api_server.py` runs Flask's debug reloader: this first process only
+# watches the files and restarts the real server (WERKZEUG_RUN_MAIN set) on changes.
+RELOADER_PARENT = __name__ == "__main__" and not os.environ.get("WERKZEUG_RUN_MAIN")
+# Transcription job workers are spawned and re-run this file as __mp_main__; they
+# only need the worker functions in transcription_jobs.py (with their own model).
+# Neither process serves requests, so the model, clients, pools and indexes below
+# are only built in the one that does.
+SERVER_PROCESS = __name__ != "__mp_main__" and not RELOADER_PARENT
+
+whisper_model = whisper.load_model("base") if SERVER_PROCESS else None
 
 load_dotenv()  # or just load_dotenv() if you don't use a custom env file
 
@@ -21,21 +50,71 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
-supabase = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)           # for public reads
-supabase_admin = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)  # for inserts/updates
+if SERVER_PROCESS:
+    supabase = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)           # for public reads
+    supabase_admin = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)  # for inserts/updates
+    # hot patient/visit queries: Supabase REST, or pooled Postgres with DB_BACKEND=postgres
+    visits_repo = create_repository(supabase, supabase_admin)
+
+    visit_store = VisitStore()
+    drug_name_index = DrugNameIndex()
+    # brand names and misspellings share the generic's memoized verdicts
+    interaction_index = InteractionIndex(normalize=drug_name_index.canonical)
+    faq_index = FaqIndex()
 
 app = Flask("ECHOVisit")
 CORS(app, resources={r"/*": {"origins": ["http://127.0.0.1:5500"]}})
 app.config["JSON_AS_ASCII"] = False
 
 
-def transcribe_audio(file_path):
-    result = whisper_model.transcribe(file_path)
-    return result['text']
+@app.before_request
+def _start_request_metrics():
+    g.request_started = time.perf_counter()
+    metrics.begin_request()
+
+
+@app.after_request
+def _finish_request_metrics(response):
+    elapsed = time.perf_counter() - g.get("request_started", time.perf_counter())
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.REQUEST_SECONDS.observe(elapsed, method=request.method, endpoint=endpoint,
+                                    status=response.status_code)
+    metrics.REQUEST_BYTES.observe(request.content_length or 0, endpoint=endpoint)
+    if not response.is_streamed and response.content_length is not None:
+        metrics.RESPONSE_BYTES.observe(response.content_length, endpoint=endpoint)
+
+    response.headers["Server-Timing"] = metrics.server_timing_header(elapsed)
+    # let the (cross-origin) frontend read the breakdown too
+    response.headers["Timing-Allow-Origin"] = "http://127.0.0.1:5500"
+    return response
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus text exposition of request, stage, cache, retry and fallback metrics."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 
+def _whisper(audio, detail="", **kwargs):
+    """
+    whisper_model.transcribe() with long pauses cut out of decoded audio
+    first (silence_trim); segment times come back in recording time.
+    """
+    with metrics.timed("vad"):
+        audio, time_map = prepare_for_whisper(audio)
+    with metrics.timed("whisper", detail):
+        result = whisper_model.transcribe(audio, **kwargs)
+    time_map.remap_segments(result.get("segments"))
+    return result
+
+
+def transcribe_audio(audio):
+    """`audio`: a file path, or float32 samples at 16 kHz (see audio_decode)."""
+    return _whisper(audio)['text']
 
-def full_pipeline(audio_file_path):
-    transcript = transcribe_audio(audio_file_path)
+
+def full_pipeline(audio):
+    transcript = transcribe_audio(audio)
     result = process_transcript(transcript)
     return {
         "transcript": transcript,
@@ -123,93 +202,339 @@ def _simp_prompt(kind: str, text: str) -> str:
     )
 
 
+# ---- helpers to read & format intake meds ------------------------------
+def _parse_med_json(s):
+    try:
+        v = json.loads(s or "[]")
+        return v if isinstance(v, list) else []
+    except Exception:
+        return []
+
+def _format_meds_for_summary(meds):
+    """
+    meds: list of {name, dose, frequency} (any may be missing).
+    Returns a patient‑friendly bullet list as a string.
+    """
+    lines = []
+    for m in meds:
+        if not isinstance(m, dict): 
+            # allow simple strings fallback
+            txt = str(m).strip()
+            if txt:
+                lines.append(f"• {txt}")
+            continue
+        parts = [m.get("name"), m.get("dose"), m.get("frequency")]
+        txt = " — ".join([p for p in parts if p])
+        if txt:
+            lines.append(f"• {txt}")
+    return "\n".join(lines).strip()
+
+
+def _finalize_transcribe_result(result, new_meds_json, current_meds_json):
+    """
+    Post-processing shared by /transcribe and the transcription jobs:
+    patches missing medications from the intake form and tidies `simplified`.
+    """
+    # 2) See if the transcript/agent produced a medications section
+    summary = result.get("summary") or {}
+    meds_from_summary = summary.get("medications")
+    meds_is_blank = not meds_from_summary or str(meds_from_summary).strip() in ("", "[]", "{}")
+
+    # 3) Pull intake meds (optional) from the multipart form
+    new_meds_intake     = _parse_med_json(new_meds_json)
+    current_meds_intake = _parse_med_json(current_meds_json)
+
+    # prefer new prescriptions, otherwise current meds from intake
+    fallback_list = new_meds_intake if len(new_meds_intake) else current_meds_intake
+    fallback_str  = _format_meds_for_summary(fallback_list)
+
+    # 4) If extractor missed meds, patch with fallback; else, if both empty → N/A
+    if meds_is_blank:
+        if fallback_str:
+            summary["medications"] = fallback_str
+        else:
+            summary["medications"] = "N/A"
+
+    result["summary"] = summary
+
+    # Optional: also mirror into simplified if you show that directly (safe default)
+    if "simplified" in result and isinstance(result["simplified"], str):
+        result["simplified"] = result["simplified"].replace("\n", " ").strip()
+
+    return result
+
+
+# ---- progressive results ----------------------------------------------------
+# With `Accept: application/x-ndjson` (or `text/event-stream` for SSE),
+# /transcribe and /transcribe_stream/<id>/finish send one event per stage
+# instead of a single JSON body: "transcript" as soon as Whisper is done, then
+# "summary" / "simplified" / "translated" / "questions" in completion order,
+# then "done" with exactly the payload the JSON response has ("error" on failure).
+
+def _stream_format():
+    accept = request.headers.get("Accept", "")
+    if "text/event-stream" in accept:
+        return "sse"
+    if "application/x-ndjson" in accept:
+        return "ndjson"
+    return None
+
+
+def _format_event(fmt, event, data):
+    if fmt == "sse":
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return json.dumps({"event": event, "data": data}, ensure_ascii=False) + "\n"
+
+
+def _pipeline_events(get_transcript, new_meds_json, current_meds_json, fmt):
+    try:
+        transcript = get_transcript()
+        if transcript is None:
+            yield _format_event(fmt, "error", {"error": "Unknown session"})
+            return
+        yield _format_event(fmt, "transcript", transcript)
+
+        result = {"transcript": transcript}
+        for name, value in iter_process_transcript(transcript):
+            result[name] = value
+            # patched like the final payload; a copy, since later stages still read `value`
+            partial = _finalize_transcribe_result({name: copy.deepcopy(value)}, new_meds_json, current_meds_json)
+            yield _format_event(fmt, name, partial[name])
+
+        yield _format_event(fmt, "done", _finalize_transcribe_result(result, new_meds_json, current_meds_json))
+    except Exception as e:
+        yield _format_event(fmt, "error", {"error": str(e)})
+
+
+def _event_stream(events, fmt):
+    resp = Response(events, mimetype="text/event-stream" if fmt == "sse" else "application/x-ndjson")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # keep reverse proxies from buffering the events
+    return resp
+
+
 @app.route("/transcribe", methods=["POST"])
 def transcribe_and_summarize():
     if 'audio' not in request.files:
         return jsonify({"error": "No audio file uploaded"}), 400
 
+    # decoded in memory straight from the upload: no shared temp files to collide or leak
+    try:
+        with metrics.timed("audio_decode"):
+            samples = decode_upload(request.files['audio'])
+    except FFmpegNotFound as e:
+        print("ERROR in /transcribe:", str(e))
+        return jsonify({"error": f"Audio decoding is unavailable on this server ({e})"}), 500
+    except AudioDecodeError as e:
+        return jsonify({"error": str(e)}), 400
+
+    fmt = _stream_format()
+    if fmt:
+        events = _pipeline_events(lambda: transcribe_audio(samples),
+                                  request.form.get("new_meds_json"), request.form.get("current_meds_json"), fmt)
+        return _event_stream(events, fmt)
+
+    try:
+        # 1) Run the normal pipeline
+        result = full_pipeline(samples)
+        result = _finalize_transcribe_result(
+            result, request.form.get("new_meds_json"), request.form.get("current_meds_json")
+        )
+        return jsonify(result)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def _process_job_transcript(transcript, form):
+    result = {"transcript": transcript, **process_transcript(transcript)}
+    return _finalize_transcribe_result(result, form.get("new_meds_json"), form.get("current_meds_json"))
+
+
+transcription_jobs = TranscriptionJobs(postprocess=_process_job_transcript) if SERVER_PROCESS else None
+
+
+@app.post("/transcribe_jobs")
+def submit_transcription_job():
+    """
+    Multipart body: same as /transcribe (audio, new_meds_json, current_meds_json).
+    Returns 202 { job_id, status } immediately; poll GET /transcribe_jobs/<job_id>.
+    """
+    if 'audio' not in request.files:
+        return jsonify({"error": "No audio file uploaded"}), 400
+
     audio = request.files['audio']
-    os.makedirs("temp", exist_ok=True)
-    filepath = os.path.join("temp", audio.filename)
-    audio.save(filepath)
+    form = {
+        "new_meds_json": request.form.get("new_meds_json"),
+        "current_meds_json": request.form.get("current_meds_json"),
+    }
+    job_id = transcription_jobs.submit(audio, form)
+    if job_id is None:
+        return jsonify({"error": "Transcription queue is full, try again shortly"}), 503
 
-    # ---- helpers to read & format intake meds ------------------------------
-    def _parse_med_json(s):
-        try:
-            v = json.loads(s or "[]")
-            return v if isinstance(v, list) else []
-        except Exception:
-            return []
-
-    def _format_meds_for_summary(meds):
-        """
-        meds: list of {name, dose, frequency} (any may be missing).
-        Returns a patient‑friendly bullet list as a string.
-        """
-        lines = []
-        for m in meds:
-            if not isinstance(m, dict): 
-                # allow simple strings fallback
-                txt = str(m).strip()
-                if txt:
-                    lines.append(f"• {txt}")
-                continue
-            parts = [m.get("name"), m.get("dose"), m.get("frequency")]
-            txt = " — ".join([p for p in parts if p])
-            if txt:
-                lines.append(f"• {txt}")
-        return "\n".join(lines).strip()
+    return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+
+@app.get("/transcribe_jobs/<job_id>")
+def transcription_job_status(job_id):
+    """
+    Returns { job_id, status: queued|transcribing|processing|done|error,
+              result?: <same shape as /transcribe>, error?: str }
+    """
+    job = transcription_jobs.status(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job), 200
+
+
+def _batch_form(entry):
+    return {
+        "new_meds_json": entry.get("new_meds_json"),
+        "current_meds_json": entry.get("current_meds_json"),
+    }
 
+
+def _batch_items():
+    """Batch items from a multipart upload and/or a JSON body (see /batches)."""
+    if request.is_json:
+        data = request.get_json(force=True) or {}
+        transcripts = data.get("transcripts") or []
+        audio_meta = []
+    else:
+        transcripts = json.loads(request.form.get("transcripts") or "[]")
+        audio_meta = json.loads(request.form.get("meta") or "[]")
+
+    items = []
+    for i, audio in enumerate(request.files.getlist("audio")):
+        meta = audio_meta[i] if i < len(audio_meta) and isinstance(audio_meta[i], dict) else {}
+        items.append({"audio": audio, "name": meta.get("name"), "form": _batch_form(meta)})
+    for entry in transcripts:
+        if isinstance(entry, str):
+            entry = {"transcript": entry}
+        if (entry.get("transcript") or "").strip():
+            items.append({"transcript": entry["transcript"], "name": entry.get("name"), "form": _batch_form(entry)})
+    return items
+
+
+@app.post("/batches")
+def submit_batch():
+    """
+    Multipart: audio (repeatable), meta = JSON list with one
+               { name?, new_meds_json?, current_meds_json? } per audio file,
+               transcripts = JSON list (as below).
+    JSON:      { "transcripts": [str | { transcript, name?, new_meds_json?, current_meds_json? }] }
+    Returns 202 { batch_id, total }; follow GET /batches/<batch_id> or
+    GET /batches/<batch_id>/results.
+    """
     try:
-        # 1) Run the normal pipeline
-        result = full_pipeline(filepath)
+        items = _batch_items()
+    except (ValueError, AttributeError):
+        return jsonify({"error": "meta/transcripts must be JSON lists"}), 400
+    if not items:
+        return jsonify({"error": "No audio files or transcripts in batch"}), 400
+
+    batch_id = transcription_jobs.submit_batch(items)
+    if batch_id is None:
+        return jsonify({"error": f"Batch too large (max {transcription_jobs.batch_max_items} items)"}), 413
+    return jsonify({"batch_id": batch_id, "total": len(items)}), 202
 
-        # 2) See if the transcript/agent produced a medications section
-        summary = result.get("summary") or {}
-        meds_from_summary = summary.get("medications")
-        meds_is_blank = not meds_from_summary or str(meds_from_summary).strip() in ("", "[]", "{}")
 
-        # 3) Pull intake meds (optional) from the multipart form
-        new_meds_intake     = _parse_med_json(request.form.get("new_meds_json"))
-        current_meds_intake = _parse_med_json(request.form.get("current_meds_json"))
+@app.get("/batches/<batch_id>")
+def batch_status(batch_id):
+    """
+    Returns { batch_id, status: running|done, total, done, failed, pending,
+              items: [{ job_id, index, name, status, transcript?, result?, error? }] }
+    """
+    batch = transcription_jobs.batch_status(batch_id)
+    if batch is None:
+        return jsonify({"error": "Unknown batch"}), 404
+    return jsonify(batch), 200
+
+
+@app.get("/batches/<batch_id>/results")
+def batch_results(batch_id):
+    """NDJSON stream: one item line per finished item, in completion order."""
+    if transcription_jobs.batch_status(batch_id) is None:
+        return jsonify({"error": "Unknown batch"}), 404
+
+    def lines():
+        for item in transcription_jobs.iter_batch(batch_id):
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+
+    return Response(lines(), mimetype="application/x-ndjson")
+
+
+def _stream_transcribe(audio, **kwargs):
+    # segment ends are remapped, so the session's committed-sample bookkeeping stays in recording time
+    return _whisper(audio, "stream", **kwargs)
+
+
+streaming_transcriber = StreamingTranscriber(_stream_transcribe) if SERVER_PROCESS else None
+
+
+@app.post("/transcribe_stream")
+def start_transcription_stream():
+    """Opens an incremental transcription session. Returns { session_id }."""
+    suffix = os.path.splitext(secure_filename(request.args.get("filename") or ""))[1] or ".webm"
+    return jsonify({"session_id": streaming_transcriber.start(suffix=suffix)}), 201
+
+
+@app.post("/transcribe_stream/<session_id>/chunk")
+def upload_transcription_chunk(session_id):
+    """
+    Multipart body: chunk (audio blob from MediaRecorder timeslice), seq (0-based int).
+    Chunks are transcribed in the background with rolling context.
+    """
+    if 'chunk' not in request.files:
+        return jsonify({"error": "No audio chunk uploaded"}), 400
+    try:
+        seq = int(request.form.get("seq", ""))
+    except ValueError:
+        return jsonify({"error": "Missing or invalid seq"}), 400
 
-        # prefer new prescriptions, otherwise current meds from intake
-        fallback_list = new_meds_intake if len(new_meds_intake) else current_meds_intake
-        fallback_str  = _format_meds_for_summary(fallback_list)
+    session = streaming_transcriber.add_chunk(session_id, seq, request.files['chunk'].read())
+    if session is None:
+        return jsonify({"error": "Unknown session"}), 404
+    return jsonify({"received": seq, "transcribed_seconds": session.transcribed_seconds()}), 200
 
-        # 4) If extractor missed meds, patch with fallback; else, if both empty → N/A
-        if meds_is_blank:
-            if fallback_str:
-                summary["medications"] = fallback_str
-            else:
-                summary["medications"] = "N/A"
 
-        result["summary"] = summary
+@app.post("/transcribe_stream/<session_id>/finish")
+def finish_transcription_stream(session_id):
+    """
+    Form body: new_meds_json, current_meds_json (as for /transcribe).
+    Transcribes only the remaining tail, then returns the same payload as /transcribe
+    (or streams it stage by stage, see _pipeline_events).
+    """
+    fmt = _stream_format()
+    if fmt:
+        if streaming_transcriber.get(session_id) is None:
+            return jsonify({"error": "Unknown session"}), 404
+        events = _pipeline_events(lambda: streaming_transcriber.finish(session_id),
+                                  request.form.get("new_meds_json"), request.form.get("current_meds_json"), fmt)
+        return _event_stream(events, fmt)
 
-        # Optional: also mirror into simplified if you show that directly (safe default)
-        if "simplified" in result and isinstance(result["simplified"], str):
-            result["simplified"] = result["simplified"].replace("\n", " ").strip()
+    try:
+        transcript = streaming_transcriber.finish(session_id)
+        if transcript is None:
+            return jsonify({"error": "Unknown session"}), 404
 
+        result = {"transcript": transcript, **process_transcript(transcript)}
+        result = _finalize_transcribe_result(
+            result, request.form.get("new_meds_json"), request.form.get("current_meds_json")
+        )
         return jsonify(result)
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-    
 
-@app.route("/simplify_all", methods=["POST"])
-def simplify_all():
-    """
-    Body: { transcript: str, summary: {allergies, symptoms, diagnosis,
-            medications, instructions, notes} }
-    Returns: { transcript: str, summary: {...} }
-    """
-    data = request.get_json(force=True) or {}
+
+def _visit_payload(data):
+    """Single compact JSON of the visit that the agents rewrite field by field."""
     transcript = data.get("transcript", "") or ""
     summary_in = data.get("summary", {}) or {}
 
-    # Build a single compact JSON the model can rewrite
-    payload_in = {
+    return {
         "transcript": transcript or "",
         "summary": {
             "allergies":    _norm(summary_in.get("allergies")    or ""),
@@ -222,6 +547,7 @@ def simplify_all():
     }
 
 
+def _simplify_all_prompt(payload_in):
     # Strong instruction: return JSON only, concise, bullets for sections
     instruct = (
         "You are a medical simplification assistant. Rewrite EVERY field in the JSON below "
@@ -232,45 +558,84 @@ def simplify_all():
         "Return ONLY valid JSON with the SAME keys and structure. Do not add commentary."
     )
 
-    # Call your existing simplify_summary ONCE with the whole JSON string + instructions
     text_in = json.dumps(payload_in, ensure_ascii=False)
-    out_text = simplify_summary(f"{instruct}\n\n{text_in}")
+    return f"{instruct}\n\n{text_in}"
+
 
+def _agent_visit_result(out_text, payload_in, label):
+    """
+    Parses the agent's rewritten visit JSON.
+    Returns (result, ok); on a parse failure the input is returned unchanged.
+    """
     try:
         out = json.loads(out_text)
         out.setdefault("transcript", payload_in["transcript"])
         out["summary"] = _normalize_summary_keys(out.get("summary", {}))
-        return jsonify(out)
+        return out, True
     except Exception as e:
-        print("simplify_all parse error:", e, "\nRAW:", out_text[:800])
-        return jsonify(payload_in)
+        print(f"{label} parse error:", e, "\nRAW:", out_text[:800])
+        return payload_in, False
 
 
+def _glossary_visit_fallback(payload_in):
+    # Agent down or unparseable: annotate the jargon locally (stored only for
+    # VISIT_STORE_FALLBACK_TTL, then the agent is tried again)
+    metrics.FALLBACKS.inc(agent="simplify_all", reason="glossary")
+    return {**glossary_fallback(payload_in), "source": "glossary"}
 
-@app.route("/translate_all", methods=["POST"])
-def translate_all():
+
+def _stored_output(data, lang, mode, payload_in):
     """
-    Body: { lang, mode, transcript, summary:{...} }
-    Returns: { transcript, summary:{...} } translated.
+    Looks up a saved translation/simplification when the body carries a visit_id.
+    Returns (result or None, store key or None).
+    """
+    visit_id = data.get("visit_id")
+    if not visit_id:
+        return None, None
+    key = (visit_id, lang, mode, content_hash(payload_in))
+    try:
+        return visit_store.get(*key), key
+    except Exception as e:
+        print("visit_store read error:", repr(e))
+        return None, key
+
+
+def _store_output(key, result, fallback=False):
+    if key is None:
+        return
+    try:
+        visit_store.put(*key, result, ttl=VISIT_STORE_FALLBACK_TTL if fallback else None)
+    except Exception as e:
+        print("visit_store write error:", repr(e))
+
+
+@app.route("/simplify_all", methods=["POST"])
+def simplify_all():
+    """
+    Body: { transcript: str, summary: {allergies, symptoms, diagnosis,
+            medications, instructions, notes}, visit_id?: int }
+    Returns: { transcript: str, summary: {...} }
+    With a visit_id, results are read from / written to the visit store.
     """
     data = request.get_json(force=True) or {}
-    lang_code  = (data.get("lang") or "es").lower()
-    transcript = data.get("transcript", "") or ""
-    summary_in = data.get("summary", {}) or {}
+    payload_in = _visit_payload(data)
 
-    payload_in = {
-        "transcript": transcript or "",
-        "summary": {
-            "allergies":    _norm(summary_in.get("allergies")    or ""),
-            "symptoms":     _norm(summary_in.get("symptoms")     or ""),
-            "diagnosis":    _norm(summary_in.get("diagnosis")    or ""),
-            "medications":  _norm(summary_in.get("medications")  or ""),
-            "instructions": _norm(summary_in.get("instructions") or ""),
-            "notes":        _norm(summary_in.get("notes")        or "")
-        }
-    }
+    stored, key = _stored_output(data, "en", "simplified", payload_in)
+    if stored is not None:
+        return jsonify(stored)
 
+    # Call your existing simplify_summary ONCE with the whole JSON string + instructions;
+    # the glossary has already swapped the jargon it knows for plain wording
+    out_text = simplify_summary(_simplify_all_prompt(glossary_prepass(payload_in)))
+    out, ok = _agent_visit_result(out_text, payload_in, "simplify_all")
+    if not ok:
+        out = _glossary_visit_fallback(payload_in)
+    _store_output(key, out, fallback=not ok)
+    return jsonify(out)
 
+
+def _translate_all_prompt(lang_code, payload_in):
+    """Returns (prompt, target language name)."""
     LANG_MAP = {
         "en": "English","es":"Spanish","fr":"French","de":"German",
         "zh":"Chinese","ar":"Arabic","hi":"Hindi"
@@ -284,16 +649,30 @@ def translate_all():
         "Return ONLY valid JSON with the SAME keys/structure."
     )
     text_in = json.dumps(payload_in, ensure_ascii=False)
-    out_text = translation_summary(f"{instruct}\n\n{text_in}", target_lang=target)
+    return f"{instruct}\n\n{text_in}", target
 
-    try:
-        out = json.loads(out_text)
-        out.setdefault("transcript", payload_in["transcript"])
-        out["summary"] = _normalize_summary_keys(out.get("summary", {}))
-        return jsonify(out)
-    except Exception as e:
-        print("translate_all parse error:", e, "\nRAW:", out_text[:800])
-        return jsonify(payload_in)
+
+@app.route("/translate_all", methods=["POST"])
+def translate_all():
+    """
+    Body: { lang, mode, transcript, summary:{...}, visit_id? }
+    Returns: { transcript, summary:{...} } translated.
+    With a visit_id, results are read from / written to the visit store.
+    """
+    data = request.get_json(force=True) or {}
+    lang_code  = (data.get("lang") or "es").lower()
+    payload_in = _visit_payload(data)
+
+    stored, key = _stored_output(data, lang_code, data.get("mode") or "original", payload_in)
+    if stored is not None:
+        return jsonify(stored)
+
+    prompt, target = _translate_all_prompt(lang_code, payload_in)
+    out_text = translation_summary(prompt, target_lang=target)
+    out, ok = _agent_visit_result(out_text, payload_in, "translate_all")
+    # untranslated when the agent failed: kept briefly like the simplify fallback
+    _store_output(key, out, fallback=not ok)
+    return jsonify(out)
 
 @app.route("/follow_up", methods=["POST"])
 def follow_up():
@@ -387,11 +766,36 @@ def translate_follow_up():
 
     return jsonify({"questions": out}), 200
 
+def _faq_answer(question):
+    # Generic, high-confidence questions are answered from the local FAQ index
+    # (skipped while its dataset is empty; FaqIndex said so once at startup)
+    res = None
+    if len(faq_index):
+        try:
+            with metrics.timed("faq"):
+                res = faq_index.answer(question)
+        except Exception as e:
+            print("FAQ lookup error:", repr(e))
+    metrics.QA_ROUTE.inc(route="faq" if res else "agent")
+    return res
+
+
+def _qa_context(question, ctx, visit_id):
+    # Long visits: only the passages relevant to the question go to the agent
+    try:
+        with metrics.timed("retrieval"):
+            return visit_retrieval.qa_context(question, ctx, visit_id=visit_id)
+    except Exception as e:
+        print("QA retrieval error, sending full context:", repr(e))
+        return ctx
+
+
 @app.post("/qa")
 def qa_endpoint():
     """
     Body: {
       "question": str,
+      "visit_id": optional, caches the visit's retrieval index,
       "context": {
         "transcript": str,
         "summary": {
@@ -408,8 +812,30 @@ def qa_endpoint():
     if not q:
         return jsonify({"answer": "Please enter a question.", "followups": []}), 200
 
+    # Accept: application/x-ndjson / text/event-stream -> "delta" events with
+    # answer text as it is generated, then "done" with {answer, followups, source}
+    fmt = _stream_format()
+
+    local = _faq_answer(q)
+    if local:
+        if fmt:
+            return _event_stream(iter([_format_event(fmt, "delta", {"text": local["answer"]}),
+                                       _format_event(fmt, "done", local)]), fmt)
+        return jsonify(local), 200
+
+    ctx = _qa_context(q, ctx, data.get("visit_id"))
+
+    if fmt:
+        events = (_format_event(fmt, event, {**data, "source": "agent"} if event == "done" else {"text": data})
+                  for event, data in interactive_qa_stream(q, ctx))
+        return _event_stream(events, fmt)
+
     res = interactive_qa(q, ctx)
-    return jsonify(res), 200
+    return jsonify({**res, "source": "agent"}), 200
+
+
+def _med_names(data, key):
+    return [str(x).strip() for x in (data.get(key) or []) if str(x).strip()]
 
 @app.post("/check_interactions")
 def check_interactions():
@@ -418,12 +844,28 @@ def check_interactions():
     Returns: { "has_issue": bool, "interactions": [...], "raw": ... }
     """
     data = request.get_json(force=True) or {}
-    current_meds = [str(x).strip() for x in (data.get("current_meds") or []) if str(x).strip()]
-    new_meds     = [str(x).strip() for x in (data.get("new_meds") or [])     if str(x).strip()]
+    current_meds = _med_names(data, "current_meds")
+    new_meds     = _med_names(data, "new_meds")
 
-    res = drug_interactions(current_meds, new_meds)
+    # Known pairs come from the local index; only unseen pairs reach the agent
+    res = interaction_index.check(current_meds, new_meds, drug_interactions)
     return jsonify(res), 200
 
+
+@app.get("/drugs/autocomplete")
+def drugs_autocomplete():
+    """
+    Query: ?q=<partial name>&limit=<n, default 10>
+    Returns: { "suggestions": [{ "name": str, "generic": str }] }
+    """
+    q = (request.args.get("q") or "").strip()
+    try:
+        limit = max(1, min(int(request.args.get("limit", 10)), 50))
+    except ValueError:
+        limit = 10
+    return jsonify({"suggestions": drug_name_index.autocomplete(q, limit)}), 200
+
+
 @app.route("/signup/doctor", methods=["POST"])
 def signup_doctor():
     try:
@@ -448,7 +890,8 @@ def login_doctor():
     email = data.get("email")
     password = data.get("password")
 
-    result = supabase.table("doctors").select("*").eq("email", email).execute()
+    with metrics.timed("supabase", "doctors_select"):
+        result = supabase.table("doctors").select("*").eq("email", email).execute()
     if not result.data:
         return jsonify({"success": False, "error": "Doctor not found"}), 401
 
@@ -483,6 +926,35 @@ def signup_patient():
 
 from datetime import datetime
 
+# (lowercased email, birthday) -> patients.id for /save_visit. Only found
+# patients are cached, so someone who signs up a minute later is still found.
+PATIENT_ID_CACHE_SIZE = int(os.getenv("PATIENT_ID_CACHE_SIZE", "4096"))
+PATIENT_ID_CACHE_TTL = int(os.getenv("PATIENT_ID_CACHE_TTL", "600"))
+_patient_ids = TTLCache(maxsize=PATIENT_ID_CACHE_SIZE, ttl=PATIENT_ID_CACHE_TTL)
+_patient_ids_lock = threading.Lock()
+
+
+def _resolve_patient_id(email, birthday):
+    key = (email.lower(), birthday)
+    with _patient_ids_lock:
+        patient_id = _patient_ids.get(key)
+    metrics.LOOKUP_CACHE.inc(cache="patient_id", result="miss" if patient_id is None else "hit")
+    if patient_id is not None:
+        return patient_id
+
+    patient_id = visits_repo.find_patient_id(email, birthday)
+    if patient_id is None:
+        return None
+    with _patient_ids_lock:
+        _patient_ids[key] = patient_id
+    return patient_id
+
+
+def _forget_patient_id(email, birthday):
+    with _patient_ids_lock:
+        _patient_ids.pop((email.lower(), birthday), None)
+
+
 @app.route("/save_visit", methods=["POST"])
 def save_visit():
     data = request.get_json()
@@ -501,20 +973,11 @@ def save_visit():
     except ValueError:
         return jsonify({"success": False, "error": "Invalid date format"}), 400
 
-    # --- Look up patient in Supabase ---
-    result = (
-        supabase.table("patients")
-        .select("id")
-        .ilike("email", patient_email)
-        .eq("birthday", patient_birthday)
-        .execute()
-    )
-
-    if not result.data:
+    # --- Look up patient (cached; the database on a miss) ---
+    patient_id = _resolve_patient_id(patient_email, patient_birthday)
+    if patient_id is None:
         return jsonify({"success": False, "error": "Patient not found"}), 404
 
-    patient_id = result.data[0]["id"]
-
     # --- Vitals parsing helpers ---
     def _float(v):
         try:
@@ -557,26 +1020,220 @@ def save_visit():
         "diastolic": diastolic,
     }
 
-    # Remove empty/None values
-    visit_data = {k: v for k, v in visit_data.items() if v is not None}
-
-    # --- Save to Supabase ---
-    insert_result = supabase.table("visits").insert(visit_data).execute()
-    if insert_result.data:
-        return jsonify({"success": True, "visit_id": insert_result.data[0]["id"]})
+    # --- Save (empty/None values are left to the column defaults) ---
+    try:
+        new_visit_id = visits_repo.insert_visit(visit_data)
+    except Exception:
+        # e.g. the cached patient was deleted in the meantime
+        _forget_patient_id(patient_email, patient_birthday)
+        raise
+    if new_visit_id is not None:
+        return jsonify({"success": True, "visit_id": new_visit_id})
     else:
         return jsonify({"success": False, "error": "Failed to save visit"}), 500
 
 
+# body key -> visits column, for fields a doctor may edit after saving
+VISIT_EDITABLE_FIELDS = {
+    "transcription": "transcription",
+    "allergies": "allergies",
+    "symptoms": "symptoms",
+    "diagnosis": "diagnosis",
+    "medications": "medications",
+    "current_medications": "current medications",
+    "instructions": "instructions",
+    "additional_notes": "additional notes",
+    "name_of_visit": "name of visit",
+}
+
+@app.route("/visits/<int:visit_id>", methods=["PATCH"])
+def update_visit(visit_id):
+    """
+    Body: any of the VISIT_EDITABLE_FIELDS keys.
+    Updates the visit and drops its stored translations/simplifications.
+    """
+    data = request.get_json(force=True) or {}
+    changes = {col: data[key] for key, col in VISIT_EDITABLE_FIELDS.items() if key in data}
+    if not changes:
+        return jsonify({"success": False, "error": "No editable fields in body"}), 400
+
+    try:
+        updated = visits_repo.update_visit(visit_id, changes)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+    if not updated:
+        return jsonify({"success": False, "error": "Visit not found"}), 404
+
+    visit_store.invalidate(visit_id)
+    return jsonify({"success": True, "visit_id": visit_id})
+
+
+# ---- visit history -----------------------------------------------------------
+# Lists are paged newest first with a keyset cursor on (visit_date, id) and
+# only carry the columns a list view needs; transcripts and summaries are read
+# per visit from GET /visits/<id>. Both answer If-None-Match with 304.
+
+VISIT_LIST_FIELDS = ("id", "visit_date", "name of visit", "doctor_id", "patient_id")
+VISIT_PAGE_SIZE = int(os.getenv("VISIT_PAGE_SIZE", "20"))
+VISIT_PAGE_MAX = int(os.getenv("VISIT_PAGE_MAX", "100"))
+
+
+def _visit_fields(fields, default):
+    """
+    ?fields=a,b (or *) -> column names; the repository always adds id and
+    visit_date for the cursor. ValueError for a name that is not a visits column.
+    """
+    columns = [f.strip() for f in (fields or "").split(",") if f.strip()] or list(default)
+    unknown = [c for c in columns if c != "*" and c not in VISIT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown visit field(s): {', '.join(unknown)}")
+    return columns
+
+
+def _encode_cursor(row):
+    raw = json.dumps([row.get("visit_date"), row.get("id")], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor):
+    """(visit_date, id) of the last row of the previous page; ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        visit_date, visit_id = json.loads(raw)
+        # goes into a PostgREST filter string: only a real timestamp is accepted
+        return datetime.fromisoformat(str(visit_date)).isoformat(), int(visit_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _conditional_json(payload):
+    # ETag over the body: an unchanged page/visit comes back as an empty 304
+    resp = jsonify(payload)
+    resp.add_etag()
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp.make_conditional(request)
+
+
+@app.route("/visits/patient/<int:patient_id>", methods=["GET"])
 @app.route("/get_visits/<int:patient_id>", methods=["GET"])
 def get_visits(patient_id):
+    """
+    Query: limit (default VISIT_PAGE_SIZE), cursor (next_cursor of the previous
+    page), fields (comma-separated columns or *; default VISIT_LIST_FIELDS).
+    Returns: { success, visits: [...], next_cursor: str | null }
+    """
+    try:
+        limit = min(max(int(request.args.get("limit", VISIT_PAGE_SIZE)), 1), VISIT_PAGE_MAX)
+        after = _decode_cursor(request.args["cursor"]) if request.args.get("cursor") else None
+        fields = _visit_fields(request.args.get("fields"), VISIT_LIST_FIELDS)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
     try:
-        res = supabase_admin.table("visits").select("*").eq("patient_id", patient_id).order("visit_date", desc=True).execute()
-        return jsonify({"success": True, "visits": res.data}), 200
+        # one extra row tells us whether there is a next page
+        rows = visits_repo.visit_history(patient_id, fields, after, limit + 1)
     except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+        print("ERROR in get_visits:", repr(e))
+        return jsonify({"success": False, "error": "Could not load visits"}), 500
+
+    visits = rows[:limit]
+    next_cursor = _encode_cursor(visits[-1]) if len(rows) > limit else None
+    return _conditional_json({"success": True, "visits": visits, "next_cursor": next_cursor})
+
+
+@app.route("/visits/<int:visit_id>", methods=["GET"])
+def get_visit(visit_id):
+    """
+    One visit with every column (or ?fields=...), plus doctor_name and patient_name.
+    Returns: { success, visit: {...} }
+    """
+    try:
+        fields = _visit_fields(request.args.get("fields"), ["*"])
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    try:
+        visit = visits_repo.get_visit(visit_id, fields)
+    except Exception as e:
+        print("ERROR in get_visit:", repr(e))
+        return jsonify({"success": False, "error": "Could not load visit"}), 500
+    if visit is None:
+        return jsonify({"success": False, "error": "Visit not found"}), 404
+
+    return _conditional_json({"success": True, "visit": visit})
+
+
 
+# Shared secret for exporting every doctor's visits (Authorization: Bearer <token>).
+# Unset: only signed-in doctors can export, and only their own visits.
+EXPORT_ADMIN_TOKEN = os.getenv("EXPORT_ADMIN_TOKEN")
+
+
+def _export_scope():
+    """
+    Who may export what, from the Authorization header:
+    ("admin", None) for EXPORT_ADMIN_TOKEN, ("doctor", doctor_id) for a
+    Supabase access token of a signed-up doctor, or None.
+    """
+    auth = request.headers.get("Authorization") or ""
+    if not auth.lower().startswith("bearer "):
+        return None
+    token = auth[7:].strip()
+    if EXPORT_ADMIN_TOKEN and hmac.compare_digest(token.encode("utf-8"), EXPORT_ADMIN_TOKEN.encode("utf-8")):
+        return "admin", None
 
+    try:
+        with metrics.timed("supabase", "auth_get_user"):
+            user = supabase.auth.get_user(token)
+    except Exception as e:
+        print("export: token rejected:", repr(e))
+        return None
+    if not getattr(user, "user", None):
+        return None
+    # the doctors row, not the user-editable role metadata, is what makes a doctor
+    with metrics.timed("supabase", "doctors_select"):
+        res = supabase_admin.table("doctors").select("id").eq("user_id", user.user.id).limit(1).execute()
+    if not res.data:
+        return None
+    return "doctor", res.data[0]["id"]
+
+
+@app.route("/export/visits", methods=["GET"])
+def export_visits():
+    """
+    Query: format (ndjson | parquet, default ndjson), from / to (YYYY-MM-DD,
+    inclusive), doctor_id.
+    Header: Authorization: Bearer <doctor's Supabase access token | EXPORT_ADMIN_TOKEN>.
+    Doctors get their own visits only; the admin token may export any doctor_id, or all.
+    Streams every matching visit oldest first, one batch at a time, as a download.
+    """
+    scope = _export_scope()
+    if scope is None:
+        return jsonify({"success": False, "error": "A doctor or admin token is required"}), 401
+
+    fmt = (request.args.get("format") or "ndjson").lower()
+    if fmt not in visit_export.EXPORT_FORMATS:
+        return jsonify({"success": False, "error": "format must be ndjson or parquet"}), 400
+    if fmt == "parquet" and not visit_export.parquet_available():
+        return jsonify({"success": False, "error": "Parquet export is not available on this server"}), 501
+    try:
+        since, until = visit_export.date_range(request.args.get("from"), request.args.get("to"))
+        doctor_id = int(request.args["doctor_id"]) if request.args.get("doctor_id") else None
+    except ValueError:
+        return jsonify({"success": False, "error": "from/to must be YYYY-MM-DD and doctor_id an integer"}), 400
+
+    role, own_id = scope
+    if role == "doctor":
+        if doctor_id is not None and doctor_id != own_id:
+            return jsonify({"success": False, "error": "Doctors can only export their own visits"}), 403
+        doctor_id = own_id
+
+    chunks = visit_export.export_chunks(visits_repo, fmt, since, until, doctor_id)
+    filename = f"visits.{'parquet' if fmt == 'parquet' else 'ndjson'}"
+    return Response(
+        chunks,
+        mimetype=visit_export.EXPORT_MIMETYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "X-Accel-Buffering": "no"},
+    )
 
 if __name__ == "__main__":
     app.run(debug=True, port=5000)
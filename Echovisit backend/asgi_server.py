@@ -0,0 +1,169 @@
+import asyncio
+import json
+import time
+
+from asgiref.wsgi import WsgiToAsgi
+
+import api_server
+import metrics
+import watsonx_agent_async as agents
+from api_server import (
+    _agent_visit_result, _faq_answer, _glossary_visit_fallback, _med_names, _qa_context,
+    _simplify_all_prompt, _store_output, _stored_output, _translate_all_prompt, _visit_payload,
+    glossary_prepass, interaction_index,
+)
+from watsonx_client import close_async_http_client
+
+# ASGI entry point: `uvicorn asgi_server:app --port 5000`.
+# The agent-bound routes below are coroutines on one event loop sharing one
+# httpx.AsyncClient, so a request waiting up to 90 s on watsonx holds no
+# thread. Every other request (including streamed /qa answers and CORS
+# preflights) goes to the Flask app, which asgiref runs on a thread pool.
+
+# Where the frontend is served from (the CORS origin api_server allows)
+FRONTEND_ORIGIN = "http://127.0.0.1:5500"
+
+flask_app = WsgiToAsgi(api_server.app)
+
+
+async def qa(data):
+    """Same body and response as POST /qa (non-streaming)."""
+    q = (data.get("question") or "").strip()
+    ctx = data.get("context") or {}
+    if not q:
+        return {"answer": "Please enter a question.", "followups": []}
+
+    local = await asyncio.to_thread(_faq_answer, q)
+    if local:
+        return local
+
+    ctx = await asyncio.to_thread(_qa_context, q, ctx, data.get("visit_id"))
+    res = await agents.interactive_qa(q, ctx)
+    return {**res, "source": "agent"}
+
+
+async def translate_all(data):
+    """Same body and response as POST /translate_all."""
+    lang_code = (data.get("lang") or "es").lower()
+    payload_in = _visit_payload(data)
+
+    stored, key = await asyncio.to_thread(_stored_output, data, lang_code, data.get("mode") or "original", payload_in)
+    if stored is not None:
+        return stored
+
+    prompt, target = _translate_all_prompt(lang_code, payload_in)
+    out_text = await agents.translation_summary(prompt, target_lang=target)
+    out, ok = _agent_visit_result(out_text, payload_in, "translate_all")
+    await asyncio.to_thread(_store_output, key, out, not ok)
+    return out
+
+
+async def simplify_all(data):
+    """Same body and response as POST /simplify_all."""
+    payload_in = _visit_payload(data)
+
+    stored, key = await asyncio.to_thread(_stored_output, data, "en", "simplified", payload_in)
+    if stored is not None:
+        return stored
+
+    out_text = await agents.simplify_summary(_simplify_all_prompt(glossary_prepass(payload_in)))
+    out, ok = _agent_visit_result(out_text, payload_in, "simplify_all")
+    if not ok:
+        out = _glossary_visit_fallback(payload_in)
+    await asyncio.to_thread(_store_output, key, out, not ok)
+    return out
+
+
+async def check_interactions(data):
+    """Same body and response as POST /check_interactions."""
+    return await interaction_index.check_async(
+        _med_names(data, "current_meds"), _med_names(data, "new_meds"), agents.drug_interactions)
+
+
+ROUTES = {
+    "/qa": qa,
+    "/translate_all": translate_all,
+    "/simplify_all": simplify_all,
+    "/check_interactions": check_interactions,
+}
+
+
+def _header(scope, name):
+    for key, value in scope.get("headers") or []:
+        if key == name:
+            return value.decode("latin-1")
+    return ""
+
+
+def _wants_stream(scope):
+    accept = _header(scope, b"accept")
+    return "application/x-ndjson" in accept or "text/event-stream" in accept
+
+
+async def _read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return bytes(body)
+
+
+async def _serve(handler, scope, receive, send):
+    started = time.perf_counter()
+    metrics.begin_request()
+    path = scope["path"]
+
+    body = await _read_body(receive)
+    try:
+        data = json.loads(body or b"{}") or {}
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        status, payload = 400, {"error": "Body must be a JSON object"}
+    else:
+        try:
+            status, payload = 200, await handler(data)
+        except Exception as e:
+            print(f"ERROR in async {path}:", repr(e))
+            status, payload = 500, {"error": "Internal server error"}
+
+    out = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    elapsed = time.perf_counter() - started
+    metrics.REQUEST_SECONDS.observe(elapsed, method="POST", endpoint=path, status=status)
+    metrics.REQUEST_BYTES.observe(len(body), endpoint=path)
+    metrics.RESPONSE_BYTES.observe(len(out), endpoint=path)
+
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(out)).encode("ascii")),
+        (b"server-timing", metrics.server_timing_header(elapsed).encode("latin-1")),
+        (b"timing-allow-origin", FRONTEND_ORIGIN.encode("latin-1")),
+        (b"vary", b"Origin"),
+    ]
+    if _header(scope, b"origin") == FRONTEND_ORIGIN:
+        headers.append((b"access-control-allow-origin", FRONTEND_ORIGIN.encode("latin-1")))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": out})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_async_http_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    handler = ROUTES.get(scope.get("path")) if scope["type"] == "http" and scope.get("method") == "POST" else None
+    if handler is None or _wants_stream(scope):
+        await flask_app(scope, receive, send)
+        return
+    await _serve(handler, scope, receive, send)
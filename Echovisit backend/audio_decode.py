@@ -0,0 +1,140 @@
+import os
+import subprocess
+import tempfile
+import threading
+
+import numpy as np
+
+SAMPLE_RATE = 16000  # whisper.audio.SAMPLE_RATE
+
+FFMPEG = os.getenv("FFMPEG_BINARY", "ffmpeg")
+# Bytes copied from the upload into ffmpeg per write
+DECODE_CHUNK_BYTES = int(os.getenv("AUDIO_DECODE_CHUNK_BYTES", str(256 * 1024)))
+
+
+class AudioDecodeError(Exception):
+    """The upload is not audio ffmpeg can decode (or ffmpeg is missing)."""
+
+
+class FFmpegNotFound(AudioDecodeError):
+    """FFMPEG_BINARY cannot be run: a server problem, not a bad upload."""
+
+
+def _ffmpeg_command(source, start=0.0):
+    # the same conversion whisper.audio.load_audio does, but ffmpeg emits
+    # float32 directly, so no int16 -> float32 copy is needed afterwards
+    seek = ["-ss", f"{start:.3f}"] if start > 0 else []
+    return [FFMPEG, "-nostdin", "-hide_banner", "-loglevel", "error", "-threads", "0", *seek, "-i", source,
+            "-f", "f32le", "-ac", "1", "-acodec", "pcm_f32le", "-ar", str(SAMPLE_RATE), "-"]
+
+
+def _samples(raw):
+    # a view on ffmpeg's output buffer, not a copy (bytearray keeps it writable for torch)
+    return np.frombuffer(raw, dtype=np.float32, count=len(raw) // 4)
+
+
+def decode_stream(stream, chunk_size=DECODE_CHUNK_BYTES):
+    """
+    Decodes a readable binary stream (e.g. a Flask upload's .stream) into a
+    mono 16 kHz float32 array, piping it through ffmpeg: the upload is never
+    written to disk. Raises AudioDecodeError if ffmpeg cannot decode it.
+    """
+    try:
+        proc = subprocess.Popen(_ffmpeg_command("pipe:0"), stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise FFmpegNotFound(f"{FFMPEG} not found")
+
+    # feed stdin from a thread so a full stdout pipe can't deadlock us
+    def feed():
+        try:
+            while True:
+                data = stream.read(chunk_size)
+                if not data:
+                    break
+                proc.stdin.write(data)
+        except (BrokenPipeError, OSError):
+            pass  # ffmpeg gave up early; its exit status says why
+        finally:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+    errors = bytearray()
+
+    def drain_stderr():
+        errors.extend(proc.stderr.read())
+
+    threads = [threading.Thread(target=feed, daemon=True), threading.Thread(target=drain_stderr, daemon=True)]
+    for t in threads:
+        t.start()
+    raw = bytearray()
+    while True:
+        data = proc.stdout.read(chunk_size)
+        if not data:
+            break
+        raw += data
+    proc.wait()
+    for t in threads:
+        t.join()
+
+    if proc.returncode != 0:
+        raise AudioDecodeError(f"Failed to decode audio: {errors.decode('utf-8', 'replace').strip()[-300:]}")
+    return _samples(raw)
+
+
+def decode_file(path, start=0.0):
+    """
+    Decodes an audio file on disk from `start` seconds to the end. ffmpeg
+    seeks to `start` first, so the audio before it is not decoded again.
+    """
+    try:
+        proc = subprocess.run(_ffmpeg_command(path, start), capture_output=True)
+    except FileNotFoundError:
+        raise FFmpegNotFound(f"{FFMPEG} not found")
+    if proc.returncode != 0:
+        raise AudioDecodeError(f"Failed to decode audio: {proc.stderr.decode('utf-8', 'replace').strip()[-300:]}")
+    raw = bytearray(proc.stdout)
+    return _samples(raw)
+
+
+def decode_seekable(stream):
+    """
+    Fallback for containers that cannot be read from a pipe (e.g. .m4a with
+    its index at the end): the bytes go to a private temp file that is
+    removed as soon as ffmpeg is done.
+    """
+    fd, path = tempfile.mkstemp(suffix=".audio")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                data = stream.read(DECODE_CHUNK_BYTES)
+                if not data:
+                    break
+                f.write(data)
+        return decode_file(path)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def decode_upload(upload):
+    """
+    werkzeug FileStorage (or a binary stream) -> float32 samples at
+    SAMPLE_RATE, ready for whisper_model.transcribe(). Piped when the format
+    allows it; seekable uploads that fail from a pipe are retried via
+    decode_seekable.
+    """
+    stream = getattr(upload, "stream", upload)
+    try:
+        return decode_stream(stream)
+    except FFmpegNotFound:
+        raise
+    except AudioDecodeError:
+        if not (hasattr(stream, "seekable") and stream.seekable()):
+            raise
+        stream.seek(0)
+        return decode_seekable(stream)
@@ -2,6 +2,7 @@ from supabase import create_client
 from supa_client import supabase, supabase_admin
 import os
 from dotenv import load_dotenv
+import metrics
 
 load_dotenv()
 
@@ -15,13 +16,14 @@ def sign_up_user(email: str, password: str, role: str, name: str, clinic=None, b
     email = (email or "").strip().lower()
 
     # Step 1: Create user in Supabase Auth with role in metadata
-    response = supabase.auth.sign_up({
-        "email": email,
-        "password": password,
-        "options": {
-            "data": {"role": role}
-        }
-    })
+    with metrics.timed("supabase", "auth_sign_up"):
+        response = supabase.auth.sign_up({
+            "email": email,
+            "password": password,
+            "options": {
+                "data": {"role": role}
+            }
+        })
 
     if not getattr(response, "user", None):
         return {"error": "Sign-up failed", "details": response}
@@ -30,19 +32,21 @@ def sign_up_user(email: str, password: str, role: str, name: str, clinic=None, b
 
     # Step 2: Insert into the correct table
     if role == "doctor":
-        supabase.table("doctors").insert({
-            "user_id": user_id,
-            "name": name,
-            "clinic": clinic,
-            "email": email
-        }).execute()
+        with metrics.timed("supabase", "doctors_insert"):
+            supabase.table("doctors").insert({
+                "user_id": user_id,
+                "name": name,
+                "clinic": clinic,
+                "email": email
+            }).execute()
     elif role == "patient":
-        supabase.table("patients").insert({
-            "user_id": user_id,
-            "name": name,
-            "birthday": birthday,
-            "email": email
-        }).execute()
+        with metrics.timed("supabase", "patients_insert"):
+            supabase.table("patients").insert({
+                "user_id": user_id,
+                "name": name,
+                "birthday": birthday,
+                "email": email
+            }).execute()
 
     return {"success": True, "user_id": user_id}
 
@@ -1,30 +1,92 @@
+import argparse
 import psycopg2
 import os
 from dotenv import load_dotenv
-from models import CREATE_DOCTOR_TABLE, CREATE_PATIENT_TABLE, CREATE_VISIT_TABLE
+from models import CREATE_MIGRATIONS_TABLE, MIGRATIONS
 
 load_dotenv("pass.env")
 
-connection = psycopg2.connect(
-    dbname=os.getenv("DB_NAME"),
-    user=os.getenv("DB_USER"),
-    password=os.getenv("DB_PASSWORD"),
-    host=os.getenv("DB_HOST"),
-    port=os.getenv("DB_PORT")
-)
+# Any constant works; it only has to be the same for every process that migrates
+MIGRATION_LOCK_ID = 724_001
 
-cursor = connection.cursor()
 
-# Run table creation queries
-cursor.execute(CREATE_DOCTOR_TABLE)
-cursor.execute(CREATE_PATIENT_TABLE)
-cursor.execute(CREATE_VISIT_TABLE)
+def connection_kwargs():
+    """psycopg2.connect() arguments: DATABASE_URL if set (e.g. a local Postgres), else the DB_* variables."""
+    if os.getenv("DATABASE_URL"):
+        return {"dsn": os.getenv("DATABASE_URL")}
+    return {
+        "dbname": os.getenv("DB_NAME"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+        "host": os.getenv("DB_HOST"),
+        "port": os.getenv("DB_PORT"),
+    }
 
-connection.commit()
 
-cursor.close()
-connection.close()
+def get_connection():
+    return psycopg2.connect(**connection_kwargs())
 
 
+def applied_versions(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(CREATE_MIGRATIONS_TABLE)
+        cursor.execute("SELECT version FROM schema_migrations")
+        versions = {row[0] for row in cursor.fetchall()}
+    connection.commit()
+    return versions
 
 
+def run_migrations(connection, target=None):
+    """
+    Applies every migration in models.MIGRATIONS newer than what the database
+    has (up to `target`), each in its own transaction. An advisory lock keeps
+    two servers starting at once from running the same migration twice.
+    Returns the versions applied.
+    """
+    applied = []
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+    try:
+        done = applied_versions(connection)
+        for version, name, statements in sorted(MIGRATIONS):
+            if version in done or (target is not None and version > target):
+                continue
+            try:
+                with connection.cursor() as cursor:
+                    for statement in statements:
+                        cursor.execute(statement)
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name)
+                    )
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                print(f"Migration {version} ({name}) failed; rolled back")
+                raise
+            print(f"Applied migration {version}: {name}")
+            applied.append(version)
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+        connection.commit()
+    return applied
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bring the database schema up to date.")
+    parser.add_argument("--target", type=int, help="stop after this migration version")
+    parser.add_argument("--status", action="store_true", help="list migrations without applying any")
+    args = parser.parse_args()
+
+    connection = get_connection()
+    try:
+        if args.status:
+            done = applied_versions(connection)
+            for version, name, _ in sorted(MIGRATIONS):
+                print(f"{version:>4}  {'applied' if version in done else 'pending'}  {name}")
+        else:
+            applied = run_migrations(connection, args.target)
+            if not applied:
+                print("Schema is up to date")
+    finally:
+        connection.close()
@@ -0,0 +1,133 @@
+import bisect
+import csv
+import heapq
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from itertools import chain
+
+# name,generic rows; `generic` is blank when the name already is the generic
+DRUG_NAMES_PATH = os.getenv(
+    "DRUG_NAMES_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Echovisit Datasets", "drug_names.csv"),
+)
+# Minimum trigram similarity (0-1) for a misspelled name to be suggested by
+# autocomplete. Suggestions only: different drugs are often this close
+# (sodium/potassium chloride, ofloxacin/ciprofloxacin), so fuzzy hits are never
+# used as the key interaction verdicts are stored under.
+DRUG_FUZZY_THRESHOLD = float(os.getenv("DRUG_FUZZY_THRESHOLD", "0.45"))
+
+
+def normalize_name(name):
+    return " ".join(re.sub(r"[^\w\s\-]", " ", str(name or "").lower()).split())
+
+
+def _trigrams(s):
+    s = f"  {s} "
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+class DrugNameIndex:
+    """
+    In-memory drug name index.
+
+    - `sorted keys + bisect` for prefix autocomplete (O(log n) per lookup)
+    - character-trigram postings for typo-tolerant matching
+    - brand -> generic synonym map used by canonical() (exact names only)
+    """
+
+    def __init__(self, path=DRUG_NAMES_PATH):
+        self._generic = {}               # normalized name -> normalized generic
+        self._display = {}               # normalized name -> name as listed
+        self._keys = []                  # sorted normalized names
+        self._grams = defaultdict(set)   # trigram -> normalized names
+        self._gram_count = {}            # normalized name -> number of distinct trigrams
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def load(self, path):
+        with open(path, newline="", encoding="utf-8") as f:
+            self.add_many((row["name"], row.get("generic") or None) for row in csv.DictReader(f))
+
+    def add_many(self, rows):
+        with self._lock:
+            for name, generic in rows:
+                key = normalize_name(name)
+                if not key:
+                    continue
+                self._generic[key] = normalize_name(generic) if generic else key
+                self._display.setdefault(key, str(name).strip())
+                grams = _trigrams(key)
+                self._gram_count[key] = len(grams)
+                for g in grams:
+                    self._grams[g].add(key)
+            self._keys = sorted(self._generic)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _fuzzy(self, key, limit):
+        """Known names ranked by trigram Jaccard similarity to `key`."""
+        grams = _trigrams(key)
+        n = len(grams)
+        # Counter over the chained postings does the overlap counting in C
+        shared = Counter(chain.from_iterable(self._grams.get(g, ()) for g in grams))
+        gram_count = self._gram_count
+        return heapq.nsmallest(
+            limit,
+            ((-(c / (n + gram_count[cand] - c)), cand) for cand, c in shared.items()
+             if c >= DRUG_FUZZY_THRESHOLD * n),
+        )
+
+    def resolve(self, name, fuzzy=False):
+        """Known normalized name for `name` (exact; closest misspelling too with fuzzy=True), or None."""
+        key = normalize_name(name)
+        if not key:
+            return None
+        if key in self._generic:
+            return key
+        if not fuzzy:
+            return None
+        best = self._fuzzy(key, 1)
+        if best and -best[0][0] >= DRUG_FUZZY_THRESHOLD:
+            return best[0][1]
+        return None
+
+    def canonical(self, name):
+        """
+        Generic name for a listed brand or generic name. Anything not listed,
+        misspellings included, comes back normalized as typed: a near miss is
+        never merged into a different drug.
+        """
+        known = self.resolve(name)
+        if known is None:
+            return normalize_name(name)
+        return self._generic[known]
+
+    def autocomplete(self, prefix, limit=10):
+        """
+        Up to `limit` suggestions [{name, generic}] for a partially typed name:
+        prefix matches first, then close misspellings.
+        """
+        key = normalize_name(prefix)
+        if not key:
+            return []
+
+        hits = []
+        i = bisect.bisect_left(self._keys, key)
+        while i < len(self._keys) and self._keys[i].startswith(key) and len(hits) < limit:
+            hits.append(self._keys[i])
+            i += 1
+        if len(hits) < limit and len(key) >= 3:
+            for neg_score, cand in self._fuzzy(key, limit):
+                if -neg_score >= DRUG_FUZZY_THRESHOLD and cand not in hits:
+                    hits.append(cand)
+                if len(hits) >= limit:
+                    break
+
+        return [
+            {"name": self._display[k], "generic": self._display.get(self._generic[k], self._generic[k])}
+            for k in hits
+        ]
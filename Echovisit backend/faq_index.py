@@ -0,0 +1,157 @@
+import csv
+import math
+import os
+import re
+import sys
+import threading
+from collections import Counter, defaultdict
+
+import numpy as np
+
+# Common patient questions with vetted answers (question,answer rows; header
+# names are matched loosely, see _column). Empty or missing -> nothing is
+# answered locally and every question goes to the Q&A agent.
+FAQ_DATASET_PATH = os.getenv(
+    "FAQ_DATASET_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Echovisit Datasets", "cleaned_Q&A.csv"),
+)
+# Cosine similarity (0-1) a stored question needs before its answer is used
+FAQ_MIN_SCORE = float(os.getenv("FAQ_MIN_SCORE", "0.8"))
+
+# Questions about the patient's own visit need the visit context -> agent
+_PERSONAL = re.compile(
+    r"\b(my|me|mine|myself|i|i'm|im|i've|ive|we|our|us|doctor said|prescribed|today|tonight|tomorrow)\b",
+    re.I,
+)
+
+_QUESTION_COLUMNS = ("question", "questions", "q", "query", "patient_question", "input")
+_ANSWER_COLUMNS = ("answer", "answers", "a", "response", "doctor_answer", "output")
+
+
+def _tokens(text):
+    words = re.findall(r"[a-z0-9]+", str(text or "").lower())
+    # unigrams + bigrams: "what is X" and "what causes X" should not look alike
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def _column(fieldnames, candidates):
+    lookup = {re.sub(r"[^a-z]+", "_", (name or "").strip().lower()).strip("_"): name for name in fieldnames or []}
+    for candidate in candidates:
+        if candidate in lookup:
+            return lookup[candidate]
+    return None
+
+
+def is_visit_specific(question):
+    return bool(_PERSONAL.search(question or ""))
+
+
+class FaqIndex:
+    """
+    TF-IDF nearest-neighbour index over FAQ questions.
+
+    Document vectors are L2-normalized and stored as per-term postings
+    (doc ids + weights as NumPy arrays), so a lookup only touches the
+    documents that share a term with the question.
+    """
+
+    def __init__(self, path=FAQ_DATASET_PATH, min_score=FAQ_MIN_SCORE):
+        self.min_score = min_score
+        self._questions = []
+        self._answers = []
+        self._idf = {}
+        self._postings = {}   # term -> (doc ids, weights)
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load(path)
+        elif path:
+            print(f"FAQ dataset {path} not found; local FAQ answers disabled")
+
+    def load(self, path):
+        csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))  # long answers
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.DictReader(f)
+            if not reader.fieldnames:
+                print(f"FAQ dataset {path} is empty; local FAQ answers disabled")
+                return
+            q_col = _column(reader.fieldnames, _QUESTION_COLUMNS)
+            a_col = _column(reader.fieldnames, _ANSWER_COLUMNS)
+            if not q_col or not a_col:
+                print(f"FAQ dataset {path} has no question/answer columns; local FAQ answers disabled")
+                return
+            self.build((row.get(q_col), row.get(a_col)) for row in reader)
+        print(f"FAQ index: {len(self)} questions loaded from {path}")
+
+    def build(self, pairs):
+        questions, answers = [], []
+        for q, a in pairs:
+            q, a = str(q or "").strip(), str(a or "").strip()
+            if q and a:
+                questions.append(q)
+                answers.append(a)
+
+        counts = [Counter(_tokens(q)) for q in questions]
+        df = Counter(term for c in counts for term in c)
+        n = len(questions)
+        idf = {term: math.log((1 + n) / (1 + d)) + 1 for term, d in df.items()}
+
+        postings = defaultdict(lambda: ([], []))
+        for doc, c in enumerate(counts):
+            weights = {t: (1 + math.log(tf)) * idf[t] for t, tf in c.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for t, w in weights.items():
+                ids, ws = postings[t]
+                ids.append(doc)
+                ws.append(w / norm)
+
+        with self._lock:
+            self._questions, self._answers, self._idf = questions, answers, idf
+            self._postings = {t: (np.array(ids, dtype=np.int32), np.array(ws, dtype=np.float32))
+                              for t, (ids, ws) in postings.items()}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._questions)
+
+    def nearest(self, question):
+        """(score, stored question, answer) of the closest FAQ entry, or None."""
+        with self._lock:
+            questions, answers, idf, postings = self._questions, self._answers, self._idf, self._postings
+        if not questions:
+            return None
+
+        c = Counter(_tokens(question))
+        if not any(t in idf for t in c):
+            return None
+        # words the dataset never uses still count against the match (rarest possible idf)
+        unseen = math.log(1 + len(questions)) + 1
+        weights = {t: (1 + math.log(tf)) * idf.get(t, unseen) for t, tf in c.items()}
+        norm = math.sqrt(sum(w * w for w in weights.values()))
+
+        scores = np.zeros(len(questions), dtype=np.float32)
+        for t, w in weights.items():
+            if t in postings:
+                ids, ws = postings[t]
+                scores[ids] += ws * (w / norm)
+        best = int(scores.argmax())
+        return min(float(scores[best]), 1.0), questions[best], answers[best]
+
+    def answer(self, question):
+        """
+        Local answer for a generic question:
+        {"answer", "followups", "source": "faq", "confidence", "matched_question"},
+        or None when the question is about the visit or no entry is close enough.
+        """
+        if is_visit_specific(question):
+            return None
+        hit = self.nearest(question)
+        if hit is None or hit[0] < self.min_score:
+            return None
+        score, matched, answer = hit
+        return {
+            "answer": answer,
+            "followups": [],
+            "source": "faq",
+            "confidence": round(score, 3),
+            "matched_question": matched,
+        }
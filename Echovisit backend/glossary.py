@@ -0,0 +1,186 @@
+import csv
+import os
+import threading
+from collections import deque
+
+# term,plain rows: medical jargon -> patient-friendly wording. Only terms with
+# one meaning in a visit belong here: abbreviations like PE (physical exam or
+# pulmonary embolism), MI, IM, IV or PO are deliberately left out.
+GLOSSARY_PATH = os.getenv(
+    "GLOSSARY_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Echovisit Datasets", "medical_glossary.csv"),
+)
+
+
+# Pre-pass over text before the Simplification agent sees it: "annotate"
+# (plain wording in parentheses, the original term kept for the agent),
+# "replace" (jargon -> plain wording) or "off"
+GLOSSARY_PREPASS = os.getenv("GLOSSARY_PREPASS", "annotate").lower()
+
+
+def _lower(text):
+    # str.lower() can change the length of a few characters (e.g. "İ"); match
+    # positions must line up with the original text, so fall back per character.
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+
+def _is_word_char(c):
+    return c.isalnum() or c == "_"
+
+
+class Glossary:
+    """
+    Aho-Corasick automaton over the glossary terms: one pass over the text
+    finds every term, whatever the number of terms.
+
+    Matching ignores case, except for all-caps abbreviations ("BID", "TIA") that
+    would otherwise hit ordinary words. Only whole words match, and
+    overlapping hits resolve to the leftmost, then longest, term.
+    """
+
+    def __init__(self, path=GLOSSARY_PATH):
+        self._goto = [{}]     # state -> {char: next state}
+        self._fail = [0]
+        self._out = [[]]      # state -> terms (lowercased) ending here
+        self._terms = {}      # lowercased term -> (term as listed, plain wording)
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def load(self, path):
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            self.build((row["term"], row["plain"]) for row in csv.DictReader(f))
+
+    def build(self, pairs):
+        goto, out, terms = [{}], [[]], {}
+        for term, plain in pairs:
+            term, plain = str(term or "").strip(), str(plain or "").strip()
+            key = _lower(term)
+            if not key or not plain:
+                continue
+            terms[key] = (term, plain)
+            state = 0
+            for c in key:
+                nxt = goto[state].get(c)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][c] = nxt
+                    goto.append({})
+                    out.append([])
+                state = nxt
+            out[state].append(key)
+
+        # failure links, breadth first: the longest proper suffix that is also a trie path
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for c, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and c not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(c, 0)
+                out[nxt] = out[nxt] + out[fail[nxt]]
+
+        with self._lock:
+            self._goto, self._fail, self._out, self._terms = goto, fail, out, terms
+
+    def __len__(self):
+        with self._lock:
+            return len(self._terms)
+
+    def find(self, text):
+        """[(start, end, term as listed, plain wording)] in text order, non-overlapping."""
+        text = str(text or "")
+        with self._lock:
+            goto, fail, out, terms = self._goto, self._fail, self._out, self._terms
+        if not terms or not text:
+            return []
+
+        lowered = _lower(text)
+        hits = []
+        state = 0
+        for i, c in enumerate(lowered):
+            while state and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+            for key in out[state]:
+                start, end = i + 1 - len(key), i + 1
+                if start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                if end < len(text) and _is_word_char(text[end]):
+                    continue
+                term, plain = terms[key]
+                if term.isupper() and text[start:end] != term:
+                    continue
+                hits.append((start, end, term, plain))
+
+        hits.sort(key=lambda h: (h[0], -(h[1] - h[0])))
+        chosen, last_end = [], 0
+        for hit in hits:
+            if hit[0] >= last_end:
+                chosen.append(hit)
+                last_end = hit[1]
+        return chosen
+
+    def _rewrite(self, text, render):
+        text = str(text or "")
+        parts, pos = [], 0
+        for start, end, _, plain in self.find(text):
+            parts.append(text[pos:start])
+            parts.append(render(text[start:end], plain))
+            pos = end
+        parts.append(text[pos:])
+        return "".join(parts)
+
+    def replace(self, text):
+        """Jargon swapped for the plain wording: "Hypertension, BID" -> "High blood pressure, twice a day"."""
+        def render(found, plain):
+            if found[:1].isupper() and not found.isupper():
+                return plain[:1].upper() + plain[1:]
+            return plain
+        return self._rewrite(text, render)
+
+    def annotate(self, text):
+        """Jargon kept, with the plain wording after it: "hypertension (high blood pressure)"."""
+        return self._rewrite(text, lambda found, plain: f"{found} ({plain})")
+
+    def apply(self, value, mode="replace"):
+        """replace()/annotate() over a string, or every string inside a list/dict (e.g. a visit payload)."""
+        if isinstance(value, str):
+            return self.annotate(value) if mode == "annotate" else self.replace(value)
+        if isinstance(value, list):
+            return [self.apply(v, mode) for v in value]
+        if isinstance(value, dict):
+            return {k: self.apply(v, mode) for k, v in value.items()}
+        return value
+
+
+_glossary = None
+_glossary_lock = threading.Lock()
+
+
+def get_glossary():
+    """Process-wide glossary, loaded from GLOSSARY_PATH on first use."""
+    global _glossary
+    if _glossary is None:
+        with _glossary_lock:
+            if _glossary is None:
+                _glossary = Glossary()
+    return _glossary
+
+
+def glossary_prepass(value):
+    """What the Simplification agent gets instead of `value` (see GLOSSARY_PREPASS)."""
+    if GLOSSARY_PREPASS == "off":
+        return value
+    return get_glossary().apply(value, GLOSSARY_PREPASS)
+
+
+def glossary_fallback(value):
+    """Instant simplification when the agent is unavailable: jargon annotated in place."""
+    return get_glossary().apply(value, "annotate")
@@ -0,0 +1,199 @@
+import csv
+import os
+import threading
+import time
+from itertools import combinations
+
+# Known interacting pairs shipped with the repo (drug_a, drug_b, severity, note)
+INTERACTION_SEED_PATH = os.getenv(
+    "INTERACTION_SEED_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Echovisit Datasets", "drug_interactions_seed.csv"),
+)
+
+# How long (seconds) a "checked, no interaction" verdict from the agent is
+# trusted before the pair is asked again. Interacting pairs never expire.
+INTERACTION_NEGATIVE_TTL = int(os.getenv("INTERACTION_NEGATIVE_TTL", str(7 * 24 * 3600)))
+
+
+def normalize_drug(name):
+    return " ".join(str(name or "").lower().split())
+
+
+def pair_key(a, b, normalize=normalize_drug):
+    """Order-independent key for a drug pair."""
+    return tuple(sorted((normalize(a), normalize(b))))
+
+
+def _valid_pair(pair):
+    return isinstance(pair, list) and len(pair) == 2 and all(isinstance(x, str) and x.strip() for x in pair)
+
+
+def agent_cleared(agent_result):
+    """
+    True only for a reply that can vouch for the pairs it did not flag: it
+    parsed into the agent's JSON schema, carried no error, said has_issue is
+    False and listed no interactions (or only well-formed ones). Anything
+    garbled or oddly shaped proves nothing and must not be remembered as safe.
+    """
+    if not isinstance(agent_result, dict) or agent_result.get("has_issue") is not False:
+        return False
+    raw = agent_result.get("raw")
+    if not isinstance(raw, dict) or "error" in raw:
+        return False
+    schema = raw.get("DrugInteractions") if isinstance(raw.get("DrugInteractions"), dict) else raw
+    if raw.get("has_issue", schema.get("has_issue", schema.get("interactions_found"))) is not False:
+        return False
+    interactions = schema.get("interactions", [])
+    if not isinstance(interactions, list):
+        return False
+    return all(isinstance(i, dict) and _valid_pair(i.get("pair")) for i in interactions)
+
+
+def pairs_to_check(current_meds, new_meds, normalize=normalize_drug):
+    """Every new drug against every current drug, plus new drugs against each other."""
+    current = {normalize(m): m for m in current_meds if normalize(m)}
+    new = {normalize(m): m for m in new_meds if normalize(m)}
+
+    pairs = {}
+    for n_key, n in new.items():
+        for c_key, c in current.items():
+            if n_key != c_key:
+                pairs[tuple(sorted((n_key, c_key)))] = (n, c)
+    for (a_key, a), (b_key, b) in combinations(new.items(), 2):
+        if a_key != b_key:
+            pairs[tuple(sorted((a_key, b_key)))] = (a, b)
+    return pairs
+
+
+class InteractionIndex:
+    """
+    Memo of drug-pair verdicts: a pair maps to {"severity", "note"} when the
+    drugs interact, or None when they were checked and found not to.
+
+    Seeded from INTERACTION_SEED_PATH and filled in from agent results, so a
+    growing med list only sends never-seen pairs to the agent.
+    `normalize` maps a drug name to its key (e.g. brand -> generic).
+    """
+
+    def __init__(self, seed_path=INTERACTION_SEED_PATH, normalize=normalize_drug,
+                 negative_ttl=INTERACTION_NEGATIVE_TTL):
+        self.normalize = normalize
+        self.negative_ttl = negative_ttl
+        self._pairs = {}
+        self._expires = {}    # key -> monotonic deadline, for "no interaction" verdicts
+        self._lock = threading.Lock()
+        if seed_path and os.path.exists(seed_path):
+            self.load_seed(seed_path)
+
+    def load_seed(self, path):
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                self.record(row["drug_a"], row["drug_b"], {
+                    "severity": row.get("severity") or "unknown",
+                    "note": row.get("note") or "",
+                })
+
+    def record(self, a, b, verdict):
+        """Stores a verdict; None ("no interaction") expires after negative_ttl seconds."""
+        key = pair_key(a, b, self.normalize)
+        if key[0] == key[1]:
+            return
+        with self._lock:
+            self._pairs[key] = verdict
+            if verdict is None:
+                self._expires[key] = time.monotonic() + self.negative_ttl
+            else:
+                self._expires.pop(key, None)
+
+    def lookup(self, a, b):
+        """(known, verdict) for a pair."""
+        key = pair_key(a, b, self.normalize)
+        with self._lock:
+            if key in self._pairs:
+                deadline = self._expires.get(key)
+                if deadline is None or time.monotonic() < deadline:
+                    return True, self._pairs[key]
+                del self._pairs[key], self._expires[key]
+        return False, None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pairs)
+
+    # ---- check flow: plan -> (agent call on the unknowns) -> merge ----------
+
+    def plan(self, current_meds, new_meds):
+        """
+        Splits the pairs of a check into answered and unknown ones.
+        Returns (known_interactions, unknown_pairs, agent_current, agent_new, display);
+        agent_current/agent_new are the normalized meds the agent still has to
+        see, and `display` maps them back to the names the caller sent.
+        """
+        known, unknown = [], {}
+        for key, (a, b) in pairs_to_check(current_meds, new_meds, self.normalize).items():
+            found, verdict = self.lookup(a, b)
+            if not found:
+                unknown[key] = (a, b)
+            elif verdict is not None:
+                known.append({"pair": [a, b], **verdict})
+
+        display = {}
+        for key, (a, b) in unknown.items():
+            display.setdefault(self.normalize(a), a)
+            display.setdefault(self.normalize(b), b)
+
+        new_keys = {self.normalize(m) for m in new_meds}
+        # sorted so the same question always produces the same (cacheable) agent payload
+        involved = sorted({k for key in unknown for k in key})
+        agent_new = [k for k in involved if k in new_keys]
+        agent_current = [k for k in involved if k not in new_keys]
+        return known, unknown, agent_current, agent_new, display
+
+    def merge(self, known, unknown, agent_result, display=None):
+        """Memoizes the agent's verdicts and returns the usual {has_issue, interactions} shape."""
+        cleared = agent_cleared(agent_result)
+        agent_result = agent_result or {"has_issue": False, "interactions": []}
+        display = display or {}
+
+        reported = {}
+        for i in agent_result.get("interactions") or []:
+            if isinstance(i, dict) and _valid_pair(i.get("pair")):
+                reported[pair_key(*i["pair"], normalize=self.normalize)] = i
+
+        interactions = list(known)
+        known_keys = {pair_key(*i["pair"], normalize=self.normalize) for i in known}
+        for key, i in reported.items():
+            if key in known_keys:
+                continue
+            # report pairs under the names the caller used (the UI matches chips on them)
+            interactions.append({**i, "pair": [display.get(self.normalize(x), x) for x in i["pair"]]})
+            self.record(*key, {"severity": i.get("severity", "unknown"), "note": i.get("note", "")})
+
+        # Pairs are remembered as safe only on a clean, well-formed "no issue" reply
+        if cleared:
+            for key in unknown:
+                if key not in reported:
+                    self.record(*key, None)
+
+        out = {
+            "has_issue": bool(interactions) or bool(agent_result.get("has_issue")),
+            "interactions": interactions,
+        }
+        if "raw" in agent_result:
+            out["raw"] = agent_result["raw"]
+        return out
+
+    def check(self, current_meds, new_meds, agent_fn):
+        """
+        Answers known pairs locally and calls `agent_fn(current, new)` only with
+        the meds involved in unknown pairs.
+        """
+        known, unknown, agent_current, agent_new, display = self.plan(current_meds, new_meds)
+        agent_result = agent_fn(agent_current, agent_new) if unknown else None
+        return self.merge(known, unknown, agent_result, display)
+
+    async def check_async(self, current_meds, new_meds, agent_fn):
+        """check() with a coroutine agent_fn (asgi_server.py)."""
+        known, unknown, agent_current, agent_new, display = self.plan(current_meds, new_meds)
+        agent_result = await agent_fn(agent_current, agent_new) if unknown else None
+        return self.merge(known, unknown, agent_result, display)
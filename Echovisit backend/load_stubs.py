@@ -0,0 +1,315 @@
+import json
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qsl
+
+# Local stand-ins for the services api_server.py talks to, used by loadtest.py:
+#   - IBM IAM token endpoint            POST /identity/token
+#   - watsonx ai_service deployments    POST /ml/v4/deployments/<id>/ai_service(_stream)
+#   - Supabase PostgREST tables         GET/POST/PATCH /rest/v1/<table>
+# Everything lives in memory; nothing here is meant for production use.
+
+
+class AgentProfile:
+    """Latency and error behaviour of the stub watsonx deployments."""
+
+    def __init__(self, latency_ms=800, jitter_ms=200, error_rate=0.0, error_statuses=(503,), retry_after=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.retry_after = retry_after
+
+    def delay(self):
+        return max(0.0, random.gauss(self.latency_ms, self.jitter_ms) / 1000)
+
+
+def _agent_content(deployment_id, content):
+    """Plausible answer for each EchoVisit agent (deployment ids are the agent names)."""
+    if deployment_id == "summarize":
+        return json.dumps({
+            "allergies": "None reported",
+            "symptoms": "Cough and mild fever for three days",
+            "diagnosis": "Acute bronchitis",
+            "medications": "",
+            "instructions": "Rest, fluids, return if symptoms worsen",
+            "notes": "",
+        })
+    if deployment_id == "followup":
+        return json.dumps(["How long will the cough last?", "When should I come back?", "Can I go to work?"])
+    if deployment_id == "qa":
+        return json.dumps({"answer": "Bronchitis is an irritation of the airways.", "followups": []})
+    if deployment_id == "drug":
+        return json.dumps({"has_issue": False, "interactions": []})
+
+    # simplify / translation: echo the visit JSON back when the prompt carries one
+    start, end = content.find("{"), content.rfind("}")
+    if start != -1 and end > start:
+        return content[start:end + 1]
+    return "In simple words: " + content[:400]
+
+
+class StubState:
+    def __init__(self, profile, patients=50):
+        self.profile = profile
+        self.lock = threading.Lock()
+        self.counts = {"iam": 0, "agent": 0, "agent_errors": 0, "rest": 0}
+        self.tables = {
+            "doctors": [{"id": 1, "user_id": "stub-doctor", "name": "Stub", "clinic": "Load Test",
+                         "email": "doctor@example.com"}],
+            "patients": [{"id": i, "user_id": f"stub-patient-{i}", "name": f"Patient {i}",
+                          "birthday": "1980-01-01", "email": f"patient{i}@example.com"}
+                         for i in range(1, patients + 1)],
+            "visits": [],
+        }
+        self.next_id = {"doctors": 2, "patients": patients + 1, "visits": 1}
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+
+# ---- PostgREST filter subset ------------------------------------------------
+
+def _match(row, column, expr):
+    op, _, raw = expr.partition(".")
+    value = row.get(column)
+    if op == "in":
+        options = [v.strip().strip('"') for v in raw.strip("()").split(",")]
+        return str(value) in options
+    if op in ("like", "ilike"):
+        pattern = "^" + re.escape(raw).replace(r"\*", ".*").replace("%", ".*") + "$"
+        return re.match(pattern, str(value or ""), re.I if op == "ilike" else 0) is not None
+    if op == "is":
+        return value is None if raw == "null" else str(value).lower() == raw
+    compare = {
+        "eq": lambda a, b: a == b, "neq": lambda a, b: a != b,
+        "gt": lambda a, b: a > b, "gte": lambda a, b: a >= b,
+        "lt": lambda a, b: a < b, "lte": lambda a, b: a <= b,
+    }.get(op)
+    if compare is None:
+        return True
+    raw = raw.strip('"')
+    if isinstance(value, (int, float)):
+        try:
+            return compare(value, float(raw))
+        except ValueError:
+            return False
+    return compare(str(value), raw)
+
+
+def _split_top(expr):
+    """`a.eq.1,and(b.eq.2,c.eq.3)` -> ["a.eq.1", "and(b.eq.2,c.eq.3)"]"""
+    parts, depth, quoted, current = [], 0, False, ""
+    for c in expr:
+        if c == '"':
+            quoted = not quoted
+        elif not quoted and c == "(":
+            depth += 1
+        elif not quoted and c == ")":
+            depth -= 1
+        elif not quoted and c == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        current += c
+    return parts + [current] if current else parts
+
+
+def _match_logic(row, op, expr):
+    """or=(...) / and=(...) filters, possibly nested."""
+    results = []
+    for part in _split_top(expr.strip()[1:-1]):
+        if part.startswith(("or(", "and(")):
+            inner_op, _, inner = part.partition("(")
+            results.append(_match_logic(row, inner_op, "(" + inner))
+        else:
+            column, _, cond = part.partition(".")
+            results.append(_match(row, column, cond))
+    return any(results) if op == "or" else all(results)
+
+
+def _sort_key(column):
+    def key(row):
+        value = row.get(column)
+        return value is not None, value if isinstance(value, (int, float)) else str(value or "")
+    return key
+
+
+def _select(rows, columns):
+    if columns == "*":
+        return [dict(r) for r in rows]
+    names = [c.strip().strip('"') for c in columns.split(",")]
+    return [{n: r.get(n) for n in names} for r in rows]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None  # set per server
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status, obj, headers=None):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    # IAM + watsonx
+    def _iam(self):
+        self._body()
+        self.state.count("iam")
+        self._send(200, {"access_token": "stub-token", "expires_in": 3600, "token_type": "Bearer"})
+
+    def _agent(self, deployment_id, stream=False):
+        payload = json.loads(self._body() or b"{}")
+        state, profile = self.state, self.state.profile
+        state.count("agent")
+        # a stream starts after roughly the time to the first token
+        time.sleep(profile.delay() / (4 if stream else 1))
+
+        if profile.error_rate and random.random() < profile.error_rate:
+            state.count("agent_errors")
+            status = random.choice(profile.error_statuses)
+            headers = {"Retry-After": str(profile.retry_after)} if status == 429 and profile.retry_after else None
+            self._send(status, {"errors": [{"code": "stub_error", "message": "injected failure"}]}, headers)
+            return
+
+        content = ""
+        messages = payload.get("messages") or []
+        if messages:
+            content = messages[-1].get("content") or ""
+        answer = _agent_content(deployment_id, content)
+        if stream:
+            return self._send_stream(answer, profile)
+        self._send(200, {"choices": [{"index": 0, "message": {"role": "assistant", "content": answer}}]})
+
+    def _send_stream(self, answer, profile):
+        # SSE, a few characters per event, spread over the rest of the latency
+        pieces = [answer[i:i + 4] for i in range(0, len(answer), 4)] or [""]
+        pause = profile.delay() * 0.75 / len(pieces)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for piece in pieces:
+            chunk = {"choices": [{"index": 0, "delta": {"role": "assistant", "content": piece}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(pause)
+        self.close_connection = True
+
+    # Supabase REST
+    def _rest(self, method):
+        state = self.state
+        state.count("rest")
+        url = urlparse(self.path)
+        table = url.path.rsplit("/", 1)[-1]
+        params = parse_qsl(url.query, keep_blank_values=True)  # a column may be filtered twice (gte + lt)
+        body = self._body()
+
+        with state.lock:
+            status, out = self._apply(state, method, table, params, body)
+        self._send(status, out)
+
+    @staticmethod
+    def _apply(state, method, table, params, body):
+        rows = state.tables.setdefault(table, [])
+        filters = [(k, v) for k, v in params if k not in ("select", "order", "limit", "offset")]
+        params = dict(params)
+
+        if method == "POST":
+            new = json.loads(body or b"[]")
+            inserted = []
+            for row in new if isinstance(new, list) else [new]:
+                row = dict(row)
+                row.setdefault("id", state.next_id.get(table, 1))
+                state.next_id[table] = row["id"] + 1
+                rows.append(row)
+                inserted.append(dict(row))
+            return 201, inserted
+
+        matched = [r for r in rows if all(_match_logic(r, c, e) if c in ("or", "and") else _match(r, c, e)
+                                          for c, e in filters)]
+        if method == "PATCH":
+            changes = json.loads(body or b"{}")
+            for r in matched:
+                r.update(changes)
+            return 200, [dict(r) for r in matched]
+
+        for term in reversed((params.get("order") or "").split(",")):
+            if not term:
+                continue
+            column, _, direction = term.partition(".")
+            matched.sort(key=_sort_key(column), reverse=direction.startswith("desc"))
+        offset = int(params.get("offset") or 0)
+        limit = int(params["limit"]) if params.get("limit") else None
+        matched = matched[offset:offset + limit if limit is not None else None]
+        return 200, _select(matched, params.get("select", "*"))
+
+    def do_GET(self):
+        if self.path.startswith("/rest/v1/"):
+            return self._rest("GET")
+        self._send(404, {"error": "not found"})
+
+    def do_PATCH(self):
+        if self.path.startswith("/rest/v1/"):
+            return self._rest("PATCH")
+        self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        if path == "/identity/token":
+            return self._iam()
+        m = re.match(r"^/ml/v4/deployments/([^/]+)/ai_service(_stream)?$", path)
+        if m:
+            return self._agent(m.group(1), stream=bool(m.group(2)))
+        if path.startswith("/rest/v1/"):
+            return self._rest("POST")
+        self._body()  # drain it so the kept-alive connection stays usable
+        self._send(404, {"error": "not found"})
+
+
+def start_stubs(profile=None, host="127.0.0.1", port=0):
+    """
+    Starts one threaded HTTP server answering IAM, watsonx and Supabase calls.
+    Returns (server, state); the base URL is http://host:server.server_port.
+    """
+    state = StubState(profile or AgentProfile())
+    handler = type("StubHandler", (_Handler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="load-stubs", daemon=True).start()
+    return server, state
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the IAM / watsonx / Supabase stand-ins on their own.")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--agent-latency-ms", type=float, default=800)
+    parser.add_argument("--agent-jitter-ms", type=float, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, _ = start_stubs(AgentProfile(args.agent_latency_ms, args.agent_jitter_ms, args.error_rate),
+                            port=args.port)
+    print(f"stubs listening on http://127.0.0.1:{server.server_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
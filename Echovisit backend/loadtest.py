@@ -0,0 +1,386 @@
+"""
+End-to-end load test: starts api_server.py against the local stand-ins in
+load_stubs.py and drives its endpoints at rising concurrency.
+
+    python loadtest.py                                   # defaults
+    python loadtest.py --levels 1,8,32 --duration 20 --endpoints qa,translate_all
+    python loadtest.py --json run.json --baseline last.json --max-regression 0.2
+
+Reports throughput, p50/p95/p99 latency, error count and peak server RSS per
+endpoint and concurrency level. With --baseline, exits 1 when p95 latency or
+throughput regressed by more than --max-regression against that run.
+"""
+import argparse
+import io
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+import httpx
+
+from load_stubs import AgentProfile, start_stubs
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SUMMARY = {
+    "allergies": "Penicillin",
+    "symptoms": "Cough and mild fever for three days",
+    "diagnosis": "Acute bronchitis",
+    "medications": "Albuterol inhaler — 2 puffs — every 6 hours as needed",
+    "instructions": "Rest, fluids, return if symptoms worsen",
+    "notes": "",
+}
+MEDS = ["lisinopril", "metformin", "atorvastatin", "warfarin", "aspirin", "omeprazole",
+        "amlodipine", "levothyroxine", "ibuprofen", "sertraline", "Zestril", "Glucophage"]
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _tone_wav(seconds=5.0, rate=16000):
+    """A short 16 kHz mono WAV (tone + noise) so /transcribe has something to decode."""
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        frames = bytearray()
+        for i in range(int(seconds * rate)):
+            v = 0.2 * math.sin(2 * math.pi * 220 * i / rate) + random.uniform(-0.02, 0.02)
+            frames += int(v * 32767).to_bytes(2, "little", signed=True)
+        w.writeframes(bytes(frames))
+    return buf.getvalue()
+
+
+# ---- request builders: (method, path, kwargs) per call ----------------------
+# `n` makes payloads unique so the agent response cache doesn't flatter the
+# numbers; --cache-friendly reuses them instead.
+
+def _req_transcribe(n, audio):
+    meds = json.dumps([{"name": "Amoxicillin", "dose": "500 mg", "freq": "3x daily"}])
+    return "POST", "/transcribe", {
+        "files": {"audio": (f"load_{n}.wav", audio, "audio/wav")},
+        "data": {"new_meds_json": meds, "current_meds_json": "[]"},
+    }
+
+
+def _req_translate_all(n, audio):
+    return "POST", "/translate_all", {"json": {
+        "lang": random.choice(["es", "fr", "de"]), "mode": "original",
+        "transcript": f"Patient reports cough for three days. (visit {n})", "summary": SUMMARY,
+    }}
+
+
+def _req_qa(n, audio):
+    return "POST", "/qa", {"json": {
+        "question": f"What does acute bronchitis mean for me? ({n})",
+        "context": {"transcript": "Patient reports cough for three days.", "summary": SUMMARY},
+    }}
+
+
+def _req_check_interactions(n, audio):
+    meds = random.sample(MEDS, 4)
+    return "POST", "/check_interactions", {"json": {"current_meds": meds[:3], "new_meds": meds[3:]}}
+
+
+def _req_save_visit(n, audio):
+    return "POST", "/save_visit", {"json": {
+        "doctor_id": 1,
+        "patient_email": f"patient{random.randint(1, 50)}@example.com",
+        "patient_birthday": "1980-01-01",
+        "transcription": f"Patient reports cough for three days. (visit {n})",
+        "symptoms": SUMMARY["symptoms"], "diagnosis": SUMMARY["diagnosis"],
+        "height_in": 68, "weight_lb": 160, "systolic": 120, "diastolic": 80,
+    }}
+
+
+ENDPOINTS = {
+    "transcribe": _req_transcribe,
+    "translate_all": _req_translate_all,
+    "qa": _req_qa,
+    "check_interactions": _req_check_interactions,
+    "save_visit": _req_save_visit,
+}
+
+
+# ---- server process ---------------------------------------------------------
+
+def _server_env(stub_url, visit_store_path, args):
+    env = dict(os.environ)
+    env.update({
+        "WATSONX_ENDPOINT": stub_url,
+        "WATSONX_IAM_URL": f"{stub_url}/identity/token",
+        "WATSONX_API_KEY": "stub",
+        "SUPABASE_URL": stub_url,
+        # supabase-py only accepts JWT-shaped keys
+        "SUPABASE_ANON_KEY": "stub.stub.stub",
+        "SUPABASE_SERVICE_KEY": "stub.stub.stub",
+        "VISIT_STORE_PATH": visit_store_path,
+        "TRANSCRIBE_WORKERS": str(args.transcribe_workers),
+    })
+    for agent in ("SUMMARIZE", "SIMPLIFY", "TRANSLATION", "FOLLOWUP", "QA", "DRUG"):
+        env[f"{agent}_DEPLOYMENT_ID"] = "translation" if agent == "TRANSLATION" else agent.lower()
+    return env
+
+
+def start_server(port, env, server_cmd=None):
+    if server_cmd:
+        cmd = server_cmd.format(port=port).split()
+    else:
+        cmd = [sys.executable, "-c",
+               f"import api_server; api_server.app.run(host='127.0.0.1', port={port}, threaded=True, debug=False)"]
+    return subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env,
+                            stdout=subprocess.DEVNULL if not os.getenv("LOAD_TEST_VERBOSE") else None,
+                            stderr=subprocess.STDOUT if not os.getenv("LOAD_TEST_VERBOSE") else None)
+
+
+def wait_ready(base_url, proc, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"api_server exited with code {proc.returncode} (rerun with LOAD_TEST_VERBOSE=1)")
+        try:
+            if httpx.get(f"{base_url}/metrics", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"api_server not ready after {timeout}s")
+
+
+def _rss_bytes(pid):
+    """Resident memory of the server and its worker processes (psutil if installed, else /proc)."""
+    try:
+        import psutil
+        proc = psutil.Process(pid)
+        return sum(p.memory_info().rss for p in [proc, *proc.children(recursive=True)])
+    except ImportError:
+        pass
+    except Exception:
+        return 0
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+class MemorySampler(threading.Thread):
+    def __init__(self, pid, interval=0.25):
+        super().__init__(daemon=True)
+        self.pid, self.interval = pid, interval
+        self.peak = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.peak = max(self.peak, _rss_bytes(self.pid))
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return self.peak
+
+
+# ---- load generation --------------------------------------------------------
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    rank = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+def run_level(client, base_url, endpoint, concurrency, duration, audio, pid, timeout, unique=True):
+    build = ENDPOINTS[endpoint]
+    latencies, errors = [], []
+    lock = threading.Lock()
+    counter = iter(range(10 ** 9))
+    stop_at = time.perf_counter() + duration
+
+    def worker():
+        while time.perf_counter() < stop_at:
+            with lock:
+                n = next(counter) if unique else 0
+            method, path, kwargs = build(n, audio)
+            start = time.perf_counter()
+            try:
+                resp = client.request(method, f"{base_url}{path}", timeout=timeout, **kwargs)
+                ok = resp.status_code < 400
+                error = None if ok else f"HTTP {resp.status_code}"
+            except httpx.HTTPError as e:
+                ok, error = False, type(e).__name__
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors.append(error)
+
+    sampler = MemorySampler(pid)
+    sampler.start()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    peak_rss = sampler.stop()
+
+    latencies.sort()
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "error_kinds": sorted(set(errors)),
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "p50_ms": (percentile(latencies, 50) or 0) * 1000,
+        "p95_ms": (percentile(latencies, 95) or 0) * 1000,
+        "p99_ms": (percentile(latencies, 99) or 0) * 1000,
+        "peak_rss_mb": peak_rss / 2 ** 20,
+    }
+
+
+def print_table(rows):
+    header = f"{'endpoint':<20}{'conc':>5}{'reqs':>7}{'errs':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rss MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['endpoint']:<20}{r['concurrency']:>5}{r['requests']:>7}{r['errors']:>6}"
+              f"{r['throughput_rps']:>9.1f}{r['p50_ms']:>10.0f}{r['p95_ms']:>10.0f}{r['p99_ms']:>10.0f}"
+              f"{r['peak_rss_mb']:>9.0f}")
+
+
+def compare(rows, baseline_rows, max_regression):
+    """Regressions of p95 latency / throughput beyond max_regression (fraction) vs a previous run."""
+    base = {(r["endpoint"], r["concurrency"]): r for r in baseline_rows}
+    problems = []
+    for r in rows:
+        b = base.get((r["endpoint"], r["concurrency"]))
+        if not b:
+            continue
+        if b["p95_ms"] and r["p95_ms"] > b["p95_ms"] * (1 + max_regression):
+            problems.append(f"{r['endpoint']}@{r['concurrency']}: p95 {b['p95_ms']:.0f} -> {r['p95_ms']:.0f} ms")
+        if b["throughput_rps"] and r["throughput_rps"] < b["throughput_rps"] * (1 - max_regression):
+            problems.append(f"{r['endpoint']}@{r['concurrency']}: throughput "
+                            f"{b['throughput_rps']:.1f} -> {r['throughput_rps']:.1f} rps")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        help="comma-separated subset of: " + ", ".join(ENDPOINTS))
+    parser.add_argument("--levels", default="1,4,16", help="concurrency levels, e.g. 1,4,16")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per endpoint and level")
+    parser.add_argument("--timeout", type=float, default=300, help="per-request timeout (seconds)")
+    parser.add_argument("--audio", help="audio file for /transcribe (default: generated 5 s WAV)")
+    parser.add_argument("--agent-latency-ms", type=float, default=800)
+    parser.add_argument("--agent-jitter-ms", type=float, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of agent calls that fail")
+    parser.add_argument("--error-statuses", default="503", help="statuses used for injected failures, e.g. 429,503")
+    parser.add_argument("--retry-after", type=float, help="Retry-After seconds sent with injected 429s")
+    parser.add_argument("--cache-friendly", action="store_true",
+                        help="repeat identical payloads so the agent response cache answers them")
+    parser.add_argument("--transcribe-workers", type=int, default=1)
+    parser.add_argument("--server-cmd", help="custom server command, {port} is substituted "
+                                             "(e.g. 'gunicorn -w 2 -b 127.0.0.1:{port} api_server:app')")
+    parser.add_argument("--server-url", help="drive an already running server instead of starting one")
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file of a previous run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = [e for e in endpoints if e not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoints: {unknown}")
+    levels = [int(x) for x in args.levels.split(",")]
+
+    if "transcribe" in endpoints and not shutil.which("ffmpeg"):
+        print("ffmpeg not found: Whisper cannot decode audio, skipping /transcribe")
+        endpoints.remove("transcribe")
+    audio = open(args.audio, "rb").read() if args.audio else _tone_wav()
+
+    profile = AgentProfile(args.agent_latency_ms, args.agent_jitter_ms, args.error_rate,
+                           [int(s) for s in args.error_statuses.split(",")], args.retry_after)
+    stubs, stub_state = start_stubs(profile)
+    stub_url = f"http://127.0.0.1:{stubs.server_port}"
+
+    proc = None
+    tmpdir = tempfile.mkdtemp(prefix="echovisit-load-")
+    try:
+        if args.server_url:
+            base_url, pid = args.server_url.rstrip("/"), os.getpid()
+            print(f"driving {base_url} (stubs at {stub_url}; memory column shows this process)")
+        else:
+            port = _free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            env = _server_env(stub_url, os.path.join(tmpdir, "visit_store.sqlite3"), args)
+            proc = start_server(port, env, args.server_cmd)
+            pid = proc.pid
+            print(f"starting api_server on {base_url} (stubs at {stub_url}) ...")
+            wait_ready(base_url, proc, args.startup_timeout)
+
+        print(f"agent stub: {args.agent_latency_ms:.0f}±{args.agent_jitter_ms:.0f} ms, "
+              f"error rate {args.error_rate:.0%}; idle server RSS {_rss_bytes(pid) / 2 ** 20:.0f} MB\n")
+
+        rows = []
+        limits = httpx.Limits(max_connections=max(levels) * 2, max_keepalive_connections=max(levels) * 2)
+        with httpx.Client(limits=limits) as client:
+            for endpoint in endpoints:
+                for level in levels:
+                    row = run_level(client, base_url, endpoint, level, args.duration, audio, pid, args.timeout,
+                                    unique=not args.cache_friendly)
+                    rows.append(row)
+                    print(f"  {endpoint} @ {level}: {row['requests']} reqs, {row['throughput_rps']:.1f} rps, "
+                          f"p95 {row['p95_ms']:.0f} ms, {row['errors']} errors")
+
+        print()
+        print_table(rows)
+        print(f"\nstub traffic: {stub_state.counts}")
+
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({"args": vars(args), "results": rows}, f, indent=2)
+
+        if args.baseline:
+            with open(args.baseline) as f:
+                problems = compare(rows, json.load(f)["results"], args.max_regression)
+            if problems:
+                print("\nREGRESSIONS:")
+                for p in problems:
+                    print("  " + p)
+                sys.exit(1)
+            print(f"\nno regressions beyond {args.max_regression:.0%} vs {args.baseline}")
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        stubs.shutdown()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
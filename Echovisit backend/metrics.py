@@ -0,0 +1,174 @@
+import contextvars
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Minimal in-process metrics with Prometheus text exposition (no extra
+# dependency), plus per-request stage timings for the Server-Timing header.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+_registry = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, v in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(v)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._values = {}   # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self):
+        with self._lock:
+            values = {k: list(v) for k, v in self._values.items()}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, row in sorted(values.items()):
+            for bound, count in zip(self.buckets, row):
+                le = _labels(self.labelnames, key, [("le", _number(bound))])
+                lines.append(f"{self.name}_bucket{le} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(row[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {row[-1]}")
+        return lines
+
+
+def register_collector(fn):
+    """
+    `fn()` is called on every scrape and returns
+    [(name, type, help, [(labels_dict, value), ...]), ...]
+    for values that already live elsewhere (cache stats, breaker state...).
+    """
+    _collectors.append(fn)
+    return fn
+
+
+def render():
+    """All metrics in Prometheus text format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for fn in _collectors:
+        try:
+            families = fn()
+        except Exception as e:
+            print("metrics collector failed:", repr(e))
+            continue
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                names = tuple(labels)
+                lines.append(f"{name}{_labels(names, [labels[n] for n in names])} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+REQUEST_SECONDS = Histogram(
+    "echovisit_request_duration_seconds", "HTTP request latency.", ["method", "endpoint", "status"])
+REQUEST_BYTES = Histogram(
+    "echovisit_request_size_bytes", "HTTP request body size.", ["endpoint"], buckets=SIZE_BUCKETS)
+RESPONSE_BYTES = Histogram(
+    "echovisit_response_size_bytes", "HTTP response body size (non-streamed).", ["endpoint"], buckets=SIZE_BUCKETS)
+STAGE_SECONDS = Histogram(
+    "echovisit_stage_duration_seconds", "Time spent per stage (audio save, whisper, agent, supabase).",
+    ["stage", "detail"])
+AGENT_CACHE = Counter(
+    "echovisit_agent_cache_total", "Agent response cache lookups.", ["agent", "result"])
+FALLBACKS = Counter(
+    "echovisit_agent_fallbacks_total", "Agent calls answered with a fallback value.", ["agent", "reason"])
+LOOKUP_CACHE = Counter(
+    "echovisit_lookup_cache_total", "In-process lookup cache results (e.g. patient id resolution).", ["cache", "result"])
+QA_ROUTE = Counter(
+    "echovisit_qa_route_total", "Patient questions answered from the local FAQ index vs the Q&A agent.", ["route"])
+
+
+# ---- per-request stage timings (Server-Timing) ------------------------------
+# The list is shared (not copied) by contexts copied into worker threads,
+# so stages timed on the stage executor still land on the request.
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def begin_request():
+    _request_timings.set([])
+
+
+def _timing_name(stage, detail):
+    name = f"{stage}_{detail}" if detail else stage
+    return re.sub(r"[^A-Za-z0-9_\-]", "_", name)
+
+
+def record_stage(stage, seconds, detail=""):
+    STAGE_SECONDS.observe(seconds, stage=stage, detail=detail)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((_timing_name(stage, detail), seconds))
+
+
+@contextmanager
+def timed(stage, detail=""):
+    """Times a block into STAGE_SECONDS and the current request's Server-Timing."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start, detail)
+
+
+def server_timing_header(total_seconds=None):
+    """Server-Timing value for the current request, e.g. `whisper;dur=812.4, total;dur=950.1`."""
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in (_request_timings.get() or [])]
+    if total_seconds is not None:
+        entries.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(entries)
@@ -3,7 +3,7 @@
 CREATE_DOCTOR_TABLE = """
 CREATE TABLE IF NOT EXISTS doctors (
 id SERIAL PRIMARY KEY,
-user_id UUID REFERENCES auth.users(id) ON DELETE CASCADE,  -- Supabase Auth link,
+user_id UUID,  -- Supabase Auth link (foreign key added by migration 5 on Supabase)
 name VARCHAR(255),
 office VARCHAR(255),
 email VARCHAR(255) UNIQUE NOT NULL,
@@ -14,7 +14,7 @@ password TEXT
 CREATE_PATIENT_TABLE = """
 CREATE TABLE IF NOT EXISTS patients(
 id SERIAL PRIMARY KEY,
-user_id UUID REFERENCES auth.users(id) ON DELETE CASCADE,  -- Supabase Auth link,
+user_id UUID,  -- Supabase Auth link (foreign key added by migration 5 on Supabase)
 name VARCHAR(255),
 email VARCHAR(255) UNIQUE NOT NULL,
 password TEXT
@@ -34,5 +34,89 @@ audio_url TEXT
 """
 
 
+# ---- versioned migrations ------------------------------------------------------
+# Applied in order by connections.run_migrations(); each version runs once, in
+# its own transaction, and is recorded in schema_migrations. Never edit a
+# released migration -- append a new version instead.
 
+CREATE_MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations(
+version INT PRIMARY KEY,
+name TEXT NOT NULL,
+applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+# Columns the API actually reads and writes (auth_route.sign_up_user,
+# /save_visit, PATCH /visits/<id>) but the original tables never had.
+# The old visits.summary / transcript / audio_url columns are left in place.
+ADD_APP_COLUMNS = """
+ALTER TABLE doctors ADD COLUMN IF NOT EXISTS clinic VARCHAR(255);
+
+ALTER TABLE patients ADD COLUMN IF NOT EXISTS birthday DATE;
+
+ALTER TABLE visits
+  ADD COLUMN IF NOT EXISTS transcription TEXT,
+  ADD COLUMN IF NOT EXISTS allergies TEXT,
+  ADD COLUMN IF NOT EXISTS symptoms TEXT,
+  ADD COLUMN IF NOT EXISTS diagnosis TEXT,
+  ADD COLUMN IF NOT EXISTS medications TEXT,
+  ADD COLUMN IF NOT EXISTS "current medications" TEXT,
+  ADD COLUMN IF NOT EXISTS instructions TEXT,
+  ADD COLUMN IF NOT EXISTS "additional notes" TEXT,
+  ADD COLUMN IF NOT EXISTS "name of visit" VARCHAR(255),
+  ADD COLUMN IF NOT EXISTS height_in INT,
+  ADD COLUMN IF NOT EXISTS weight_lb INT,
+  ADD COLUMN IF NOT EXISTS "BMI" NUMERIC(6, 2),
+  ADD COLUMN IF NOT EXISTS systolic INT,
+  ADD COLUMN IF NOT EXISTS diastolic INT;
+"""
+
+# Indexes for the hot queries:
+# - /save_visit resolves a patient by birthday + case-insensitive email
+# - visit history is filtered by patient and paged on (visit_date, id) newest first
+# - doctor lookups: a doctor's visits, and auth user -> doctor/patient row
+CREATE_HOT_QUERY_INDEXES = """
+CREATE INDEX IF NOT EXISTS patients_birthday_email_idx ON patients (birthday, lower(email));
+CREATE INDEX IF NOT EXISTS patients_user_id_idx ON patients (user_id);
+CREATE INDEX IF NOT EXISTS visits_patient_date_idx ON visits (patient_id, visit_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS visits_doctor_date_idx ON visits (doctor_id, visit_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS doctors_email_lower_idx ON doctors (lower(email));
+CREATE INDEX IF NOT EXISTS doctors_user_id_idx ON doctors (user_id);
+"""
+
+# Bulk export (visit_export.py) walks every visit in a date range oldest
+# first on (visit_date, id); with a doctor filter it reads visits_doctor_date_idx backwards
+CREATE_EXPORT_INDEX = """
+CREATE INDEX IF NOT EXISTS visits_date_idx ON visits (visit_date, id);
+"""
+
+# Supabase only: link doctors/patients to their Supabase Auth account. Skipped
+# where there is no auth.users table (a plain Postgres with DB_BACKEND=postgres),
+# and a no-op where the constraint already exists.
+ADD_AUTH_USER_FOREIGN_KEYS = """
+DO $$
+BEGIN
+  IF to_regclass('auth.users') IS NULL THEN
+    RETURN;
+  END IF;
+  IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = 'doctors'::regclass AND conname = 'doctors_user_id_fkey') THEN
+    ALTER TABLE doctors ADD CONSTRAINT doctors_user_id_fkey
+      FOREIGN KEY (user_id) REFERENCES auth.users(id) ON DELETE CASCADE;
+  END IF;
+  IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = 'patients'::regclass AND conname = 'patients_user_id_fkey') THEN
+    ALTER TABLE patients ADD CONSTRAINT patients_user_id_fkey
+      FOREIGN KEY (user_id) REFERENCES auth.users(id) ON DELETE CASCADE;
+  END IF;
+END
+$$;
+"""
 
+# (version, name, statements)
+MIGRATIONS = [
+    (1, "initial tables", [CREATE_DOCTOR_TABLE, CREATE_PATIENT_TABLE, CREATE_VISIT_TABLE]),
+    (2, "columns used by the app", [ADD_APP_COLUMNS]),
+    (3, "indexes for hot queries", [CREATE_HOT_QUERY_INDEXES]),
+    (4, "index for visit export", [CREATE_EXPORT_INDEX]),
+    (5, "Supabase Auth foreign keys", [ADD_AUTH_USER_FOREIGN_KEYS]),
+]
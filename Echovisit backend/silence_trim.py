@@ -0,0 +1,156 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+SAMPLE_RATE = 16000  # whisper.audio.SAMPLE_RATE
+
+# Drop long pauses from recordings before Whisper sees them ("0" to send audio untouched)
+VAD_ENABLED = os.getenv("VAD_ENABLED", "1").lower() not in ("0", "false", "no", "off")
+# Analysis frame length
+VAD_FRAME_MS = int(os.getenv("VAD_FRAME_MS", "30"))
+# A frame is speech when it is this many dB above the recording's noise floor
+# (its 10th-percentile frame energy), and in any case louder than VAD_MIN_DBFS
+VAD_MARGIN_DB = float(os.getenv("VAD_MARGIN_DB", "12"))
+VAD_MIN_DBFS = float(os.getenv("VAD_MIN_DBFS", "-55"))
+# Only pauses at least this long are cut; shorter ones are part of normal speech
+VAD_MIN_SILENCE_MS = int(os.getenv("VAD_MIN_SILENCE_MS", "800"))
+# Audio kept on each side of speech, so word onsets and tails are not clipped
+VAD_PAD_MS = int(os.getenv("VAD_PAD_MS", "250"))
+
+
+class TimeMap:
+    """
+    Maps times in the trimmed audio back to the original recording.
+    Kept span i starts at trimmed[i] seconds in the trimmed audio and at
+    original[i] seconds in the recording.
+    """
+
+    def __init__(self, trimmed_starts, original_starts, sample_rate=SAMPLE_RATE):
+        self.trimmed = np.asarray(trimmed_starts, dtype=np.float64) / sample_rate
+        self.original = np.asarray(original_starts, dtype=np.float64) / sample_rate
+
+    @classmethod
+    def identity(cls):
+        return cls([0], [0])
+
+    def to_original(self, t):
+        """Trimmed-audio time(s) in seconds -> recording time(s); works on scalars and arrays."""
+        t = np.asarray(t, dtype=np.float64)
+        span = np.clip(np.searchsorted(self.trimmed, t, side="right") - 1, 0, None)
+        out = self.original[span] + (t - self.trimmed[span])
+        return float(out) if out.ndim == 0 else out
+
+    def remap_segments(self, segments):
+        """Rewrites Whisper segment (and word) start/end times in place to recording time."""
+        for seg in segments or []:
+            for item in [seg, *(seg.get("words") or [])]:
+                for key in ("start", "end"):
+                    if key in item:
+                        item[key] = round(self.to_original(item[key]), 3)
+        return segments
+
+
+def speech_mask(samples, sample_rate=SAMPLE_RATE, frame_ms=VAD_FRAME_MS, margin_db=VAD_MARGIN_DB,
+                min_dbfs=VAD_MIN_DBFS, min_silence_ms=VAD_MIN_SILENCE_MS, pad_ms=VAD_PAD_MS):
+    """Per-frame keep/drop decision (bool array, one entry per frame_ms of audio)."""
+    frame = max(int(sample_rate * frame_ms / 1000), 1)
+    n = len(samples) // frame
+    if n == 0:
+        return np.ones(1 if len(samples) else 0, dtype=bool)
+
+    frames = samples[:n * frame].reshape(n, frame)
+    energy = np.einsum("ij,ij->i", frames, frames, dtype=np.float64) / frame
+    db = 10 * np.log10(energy + 1e-12)
+    threshold = max(np.percentile(db, 10) + margin_db, min_dbfs)
+    speech = db > threshold
+    if len(samples) > n * frame:
+        # the ragged tail is too short to judge: kept, unless there is no speech at all
+        # (then nothing is, and trim_silence returns the recording whole)
+        speech = np.append(speech, speech.any())
+        n += 1
+
+    # grow speech by the pad on both sides (a moving max over the mask)
+    pad = int(round(pad_ms / frame_ms))
+    if pad:
+        counts = np.convolve(speech.astype(np.int32), np.ones(2 * pad + 1, dtype=np.int32), mode="same")
+        speech = counts > 0
+
+    # refill pauses shorter than min_silence_ms
+    edges = np.flatnonzero(np.diff(np.concatenate(([1], speech.astype(np.int8), [1]))))
+    starts, ends = edges[::2], edges[1::2]     # silent runs [start, end)
+    short = (ends - starts) * frame_ms < min_silence_ms
+    fill = np.zeros(n + 1, dtype=np.int32)
+    np.add.at(fill, starts[short], 1)
+    np.add.at(fill, ends[short], -1)
+    return speech | (np.cumsum(fill[:n]) > 0)
+
+
+def trim_silence(samples, sample_rate=SAMPLE_RATE, **options):
+    """
+    (trimmed samples, TimeMap). Long pauses are cut out of float32 `samples`;
+    the TimeMap turns times in the trimmed audio back into recording times.
+    Recordings with no detectable speech are returned whole.
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    frame = max(int(sample_rate * options.get("frame_ms", VAD_FRAME_MS) / 1000), 1)
+    keep = speech_mask(samples, sample_rate, **options)
+    if keep.all() or not keep.any():
+        return samples, TimeMap.identity()
+
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], keep.astype(np.int8), [0]))))
+    starts = edges[::2] * frame
+    ends = np.minimum(edges[1::2] * frame, len(samples))
+    lengths = ends - starts
+    trimmed_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+    # one gather instead of a list of slices + concatenate
+    index = np.repeat(starts - trimmed_starts, lengths) + np.arange(lengths.sum())
+    return samples[index], TimeMap(trimmed_starts, starts, sample_rate)
+
+
+def prepare_for_whisper(samples):
+    """trim_silence() when VAD_ENABLED, else the audio untouched with an identity map."""
+    if not VAD_ENABLED or not isinstance(samples, np.ndarray):
+        return samples, TimeMap.identity()
+    return trim_silence(samples)
+
+
+if __name__ == "__main__":
+    # Benchmark on real recordings: how much audio is cut, how long the VAD
+    # pass takes, how many 30 s windows Whisper has to decode before and after
+    # (model independent) and, with --whisper, Whisper wall time with and without it.
+    parser = argparse.ArgumentParser(description="Measure silence trimming on recordings.")
+    parser.add_argument("files", nargs="+", help="audio files (anything ffmpeg decodes)")
+    parser.add_argument("--whisper", metavar="MODEL", help="also time whisper transcription with this model, e.g. base")
+    args = parser.parse_args()
+
+    from audio_decode import decode_stream
+
+    model = None
+    if args.whisper:
+        import whisper
+        model = whisper.load_model(args.whisper)
+
+    print(f"{'file':<32} {'audio s':>8} {'kept s':>8} {'cut':>6} {'vad ms':>7} {'windows':>9}"
+          + (f" {'whisper s':>10} {'trimmed s':>10} {'speedup':>8}" if model else ""))
+    for path in args.files:
+        with open(path, "rb") as f:
+            samples = decode_stream(f)
+        start = time.perf_counter()
+        trimmed, _ = trim_silence(samples)
+        vad_ms = (time.perf_counter() - start) * 1000
+        full_s, kept_s = len(samples) / SAMPLE_RATE, len(trimmed) / SAMPLE_RATE
+        windows = f"{-(-len(samples) // (30 * SAMPLE_RATE))}->{-(-len(trimmed) // (30 * SAMPLE_RATE))}"
+        line = (f"{os.path.basename(path)[:32]:<32} {full_s:>8.1f} {kept_s:>8.1f} "
+                f"{1 - kept_s / full_s if full_s else 0:>6.0%} {vad_ms:>7.1f} {windows:>9}")
+        if model:
+            start = time.perf_counter()
+            model.transcribe(samples)
+            base = time.perf_counter() - start
+            start = time.perf_counter()
+            model.transcribe(trimmed)
+            cut = time.perf_counter() - start
+            line += f" {base:>10.1f} {cut:>10.1f} {base / cut if cut else 0:>7.2f}x"
+        print(line)
@@ -0,0 +1,78 @@
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Agent calls are network-bound, so threads are enough to overlap them.
+PIPELINE_MAX_WORKERS = int(os.getenv("PIPELINE_MAX_WORKERS", "8"))
+
+_executor = ThreadPoolExecutor(max_workers=PIPELINE_MAX_WORKERS, thread_name_prefix="stage")
+
+
+class Stage:
+    """
+    One step of a pipeline.
+    `fn` is called with the results of `inputs` (by name, in order), and its
+    return value is stored under `name` for downstream stages.
+    """
+
+    def __init__(self, name, fn, inputs=()):
+        self.name = name
+        self.fn = fn
+        self.inputs = tuple(inputs)
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, inputs={self.inputs!r})"
+
+
+def iter_stages(stages, initial=None, executor=None):
+    """
+    Runs `stages` as a dependency graph: every stage starts as soon as all of
+    its inputs are available, so independent stages run concurrently.
+
+    `initial` seeds the results (e.g. {"transcript": "..."}).
+    Yields (name, result) for each stage as soon as it finishes. If a stage
+    raises, pending stages are cancelled and the exception propagates.
+    """
+    executor = executor or _executor
+    results = dict(initial or {})
+    pending = {s.name: s for s in stages}
+
+    known = set(results) | set(pending)
+    for s in stages:
+        missing = [i for i in s.inputs if i not in known]
+        if missing:
+            raise ValueError(f"{s!r} depends on unknown inputs {missing}")
+
+    running = {}
+    while pending or running:
+        ready = [s for s in pending.values() if all(i in results for i in s.inputs)]
+        for s in ready:
+            del pending[s.name]
+            args = [results[i] for i in s.inputs]
+            # copy the context so request-scoped state (e.g. Server-Timing) follows the stage
+            ctx = contextvars.copy_context()
+            running[executor.submit(ctx.run, s.fn, *args)] = s.name
+
+        if not running:
+            raise ValueError(f"Cycle in stage graph: {sorted(pending)}")
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for fut in done:
+            name = running.pop(fut)
+            try:
+                results[name] = fut.result()
+            except Exception:
+                for other in running:
+                    other.cancel()
+                raise
+            yield name, results[name]
+
+
+def run_stages(stages, initial=None, executor=None):
+    """
+    Same as iter_stages(), but waits for every stage.
+    Returns a dict of every result by name (including `initial`).
+    """
+    results = dict(initial or {})
+    results.update(iter_stages(stages, initial, executor))
+    return results
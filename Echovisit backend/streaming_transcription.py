@@ -0,0 +1,208 @@
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+SAMPLE_RATE = 16000  # whisper.audio.SAMPLE_RATE
+
+# Transcribe once this many seconds of new audio are buffered.
+STREAM_MIN_NEW_SECONDS = float(os.getenv("STREAM_MIN_NEW_SECONDS", "10"))
+# The last N seconds of each pass stay uncommitted (a word may be cut off there)
+# and are re-transcribed with the next chunk.
+STREAM_HOLDBACK_SECONDS = float(os.getenv("STREAM_HOLDBACK_SECONDS", "3"))
+# Tail of the committed transcript passed to Whisper as `initial_prompt`.
+STREAM_PROMPT_CHARS = int(os.getenv("STREAM_PROMPT_CHARS", "400"))
+# Sessions idle longer than this (seconds) are dropped.
+STREAM_SESSION_TTL = int(os.getenv("STREAM_SESSION_TTL", "3600"))
+STREAM_WORKERS = int(os.getenv("STREAM_WORKERS", "2"))
+
+
+def _default_decode(path, start=0.0):
+    from audio_decode import decode_file
+    return decode_file(path, start)
+
+
+class StreamingSession:
+    """
+    One recording being uploaded in timesliced chunks.
+
+    MediaRecorder chunks are not decodable on their own (only the first one
+    carries the container header), so chunks are appended to one file. Each
+    pass decodes that file from the committed point on (`decode_fn(path,
+    start_seconds)` seeks there), so earlier audio is not decoded again.
+
+    `lock` only guards the session state and is never held while decoding or
+    transcribing, so chunk uploads don't wait for a Whisper pass; `_pass_lock`
+    keeps passes one at a time.
+    """
+
+    def __init__(self, transcribe_fn, decode_fn=_default_decode, temp_dir="temp", suffix=".webm"):
+        self.transcribe_fn = transcribe_fn
+        self.decode_fn = decode_fn
+
+        os.makedirs(temp_dir, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(suffix=suffix, dir=temp_dir)
+        os.close(fd)
+
+        self.lock = threading.Lock()
+        self._pass_lock = threading.Lock()
+        self.next_seq = 0
+        self._out_of_order = {}
+        self.size = 0            # bytes appended to the file so far
+        self.committed = 0       # samples already turned into text
+        self.texts = []
+        self.touched = time.time()
+
+    def add_chunk(self, seq, data):
+        """Appends chunk `seq`; chunks that arrive early wait for their predecessors."""
+        with self.lock:
+            self.touched = time.time()
+            if seq < self.next_seq:
+                return
+            self._out_of_order[seq] = data
+            with open(self.path, "ab") as f:
+                while self.next_seq in self._out_of_order:
+                    chunk = self._out_of_order.pop(self.next_seq)
+                    f.write(chunk)
+                    self.size += len(chunk)
+                    self.next_seq += 1
+
+    def _prompt(self):
+        tail = " ".join(self.texts)[-STREAM_PROMPT_CHARS:]
+        return tail or None
+
+    def advance(self, final=False):
+        """
+        Transcribes buffered audio past the committed point.
+        Non-final passes wait for STREAM_MIN_NEW_SECONDS of new audio and keep
+        the last STREAM_HOLDBACK_SECONDS uncommitted.
+        """
+        with self._pass_lock:
+            # only passes move `committed` and `texts`, so they are stable until this one ends
+            with self.lock:
+                if not self.size:
+                    return
+                committed, prompt = self.committed, self._prompt()
+
+            try:
+                pending = self.decode_fn(self.path, committed / SAMPLE_RATE)
+            except Exception as e:
+                if final:
+                    raise
+                # a partially written container can fail to decode; retry on the next chunk
+                print("stream decode skipped:", repr(e))
+                return
+
+            pending_sec = len(pending) / SAMPLE_RATE
+            if not final and pending_sec < STREAM_MIN_NEW_SECONDS + STREAM_HOLDBACK_SECONDS:
+                return
+            if pending_sec <= 0:
+                return
+
+            result = self.transcribe_fn(pending, initial_prompt=prompt)
+            if final:
+                text = (result.get("text") or "").strip()
+                with self.lock:
+                    if text:
+                        self.texts.append(text)
+                    self.committed = committed + len(pending)
+                return
+
+            segments = result.get("segments") or []
+            cutoff = pending_sec - STREAM_HOLDBACK_SECONDS
+            committed_to = 0.0
+            texts = []
+            for seg in segments:
+                if seg["end"] > cutoff:
+                    break
+                text = (seg.get("text") or "").strip()
+                if text:
+                    texts.append(text)
+                committed_to = seg["end"]
+            with self.lock:
+                self.texts.extend(texts)
+                self.committed = committed + int(committed_to * SAMPLE_RATE)
+
+    def transcript(self):
+        with self.lock:
+            return " ".join(self.texts).strip()
+
+    def transcribed_seconds(self):
+        return self.committed / SAMPLE_RATE
+
+    def close(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class StreamingTranscriber:
+    """Owns the live sessions and runs their incremental passes in the background."""
+
+    def __init__(self, transcribe_fn, decode_fn=_default_decode, workers=STREAM_WORKERS,
+                 session_ttl=STREAM_SESSION_TTL, temp_dir="temp"):
+        self.transcribe_fn = transcribe_fn
+        self.decode_fn = decode_fn
+        self.session_ttl = session_ttl
+        self.temp_dir = temp_dir
+
+        self._sessions = {}
+        self._scheduled = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stream-transcribe")
+
+    def start(self, suffix=".webm"):
+        self._prune()
+        session_id = uuid.uuid4().hex
+        session = StreamingSession(self.transcribe_fn, self.decode_fn, self.temp_dir, suffix)
+        with self._lock:
+            self._sessions[session_id] = session
+        return session_id
+
+    def get(self, session_id):
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def add_chunk(self, session_id, seq, data):
+        session = self.get(session_id)
+        if session is None:
+            return None
+        session.add_chunk(seq, data)
+
+        # At most one background pass queued per session; it picks up every chunk so far
+        with self._lock:
+            if session_id in self._scheduled:
+                return session
+            self._scheduled.add(session_id)
+        self._executor.submit(self._background_advance, session_id, session)
+        return session
+
+    def _background_advance(self, session_id, session):
+        with self._lock:
+            self._scheduled.discard(session_id)
+        try:
+            session.advance()
+        except Exception as e:
+            print("stream transcription pass failed:", repr(e))
+
+    def finish(self, session_id):
+        """Transcribes the remaining tail and returns the full transcript (None if unknown)."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return None
+        try:
+            session.advance(final=True)
+            return session.transcript()
+        finally:
+            session.close()
+
+    def _prune(self):
+        cutoff = time.time() - self.session_ttl
+        with self._lock:
+            stale = [sid for sid, s in self._sessions.items() if s.touched < cutoff]
+            for sid in stale:
+                self._sessions.pop(sid).close()
@@ -0,0 +1,91 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+# the backend modules are flat files next to this directory, imported by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class _ScriptedHandler(BaseHTTPRequestHandler):
+    """Answers each POST with the next (delay, status, headers[, body]) of the server's script."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        with self.server.lock:
+            delay, status, headers, *body = self.server.script.pop(0) if self.server.script else (0, 200, {})
+            self.server.hits += 1
+            self.server.auth.append(self.headers.get("Authorization"))
+        time.sleep(delay)
+        body = body[0] if body else json.dumps({"status": status}).encode("utf-8")
+        try:
+            self.send_response(status)
+            if "Content-Type" not in headers:
+                self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # a losing hedge whose client has already gone
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # clients closing kept-alive connections at teardown
+
+
+@pytest.fixture
+def stub():
+    server = _QuietServer(("127.0.0.1", 0), _ScriptedHandler)
+    server.script, server.hits, server.auth, server.lock = [], 0, [], threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/ml/v4/deployments/test/ai_service"
+    with httpx.Client(timeout=5) as client:
+        yield server, url, lambda: client.post(url, json={})
+    server.shutdown()
+
+
+class _NoWorkers:
+    """Stands in for the Whisper process pool: route tests never transcribe."""
+
+    def __init__(self, **kwargs):
+        pass
+
+    def submit(self, fn, *args):
+        return None
+
+
+@pytest.fixture(scope="session")
+def api_server(tmp_path_factory):
+    """
+    The Flask app module, imported once. The Whisper model and worker pool are
+    replaced (no weights are downloaded), and the Supabase clients point at a
+    closed local port.
+    """
+    whisper = pytest.importorskip("whisper")
+    import transcription_jobs
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("SUPABASE_URL", "http://127.0.0.1:9")
+        mp.setenv("SUPABASE_ANON_KEY", "anon")
+        mp.setenv("SUPABASE_SERVICE_KEY", "service")
+        mp.setenv("DB_BACKEND", "supabase")
+        mp.setenv("VISIT_STORE_PATH", str(tmp_path_factory.mktemp("api") / "visit_store.sqlite3"))
+        mp.setattr(whisper, "load_model", lambda name: None)
+        mp.setattr(transcription_jobs, "ProcessPoolExecutor", _NoWorkers)
+        import api_server
+    return api_server
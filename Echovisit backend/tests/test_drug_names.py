@@ -0,0 +1,37 @@
+from drug_names import DrugNameIndex
+from interaction_index import InteractionIndex
+
+
+def _names():
+    index = DrugNameIndex(path=None)
+    index.add_many([
+        ("potassium chloride", None), ("ciprofloxacin", None), ("amoxicillin", None),
+        ("prednisone", None), ("lisinopril", None), ("zestril", "lisinopril"),
+    ])
+    return index
+
+
+def test_canonical_resolves_listed_names_and_synonyms():
+    names = _names()
+    assert names.canonical("Zestril") == "lisinopril"
+    assert names.canonical("  LISINOPRIL ") == "lisinopril"
+
+
+def test_canonical_never_merges_near_misses():
+    names = _names()
+    for typed in ("sodium chloride", "ofloxacin", "ampicillin", "prednisolone"):
+        assert names.canonical(typed) == typed
+
+
+def test_fuzzy_matches_stay_in_autocomplete():
+    names = _names()
+    assert "amoxicillin" in [s["name"] for s in names.autocomplete("amoxicilin")]
+    assert names.resolve("amoxicilin") is None
+    assert names.resolve("amoxicilin", fuzzy=True) == "amoxicillin"
+
+
+def test_interaction_verdict_does_not_leak_to_a_similar_drug():
+    names = _names()
+    index = InteractionIndex(seed_path=None, normalize=names.canonical)
+    index.record("lisinopril", "potassium chloride", {"severity": "major", "note": "hyperkalemia"})
+    assert index.lookup("lisinopril", "sodium chloride") == (False, None)
@@ -0,0 +1,61 @@
+import pytest
+
+from faq_index import FaqIndex
+
+FAQ_CSV = """Question,Answer
+What is hypertension?,Hypertension is blood pressure that stays too high.
+What causes hypertension?,"Age, salt, weight and family history all raise blood pressure."
+How long does the flu last?,Most people feel better within a week.
+Is ibuprofen safe with lisinopril?,It can raise blood pressure and strain the kidneys; ask your pharmacist.
+"""
+
+
+@pytest.fixture
+def faq(tmp_path):
+    path = tmp_path / "faq.csv"
+    path.write_text(FAQ_CSV, encoding="utf-8")
+    return FaqIndex(path=str(path), min_score=0.8)
+
+
+def test_close_generic_question_is_answered_locally(faq):
+    res = faq.answer("what is hypertension")
+    assert res["source"] == "faq"
+    assert res["matched_question"] == "What is hypertension?"
+    assert res["answer"].startswith("Hypertension is")
+    assert res["confidence"] >= 0.8
+
+
+def test_similar_but_different_question_misses(faq):
+    # shares "hypertension" with two entries but asks something else
+    assert faq.answer("what medicines treat hypertension") is None
+    score, matched, _ = faq.nearest("what medicines treat hypertension")
+    assert score < 0.8
+
+
+def test_threshold_decides(faq):
+    question = "how long does flu last"
+    score, matched, _ = faq.nearest(question)
+    assert matched == "How long does the flu last?"
+    assert 0 < score < 1
+
+    faq.min_score = score
+    assert faq.answer(question)["matched_question"] == matched
+    faq.min_score = score + 0.01
+    assert faq.answer(question) is None
+
+
+def test_visit_questions_and_unknown_words_go_to_the_agent(faq):
+    assert faq.answer("What is my hypertension?") is None
+    assert faq.answer("zzz qqq") is None
+
+
+@pytest.mark.parametrize("content", [None, "", "title,body\nx,y\n"])
+def test_missing_or_empty_dataset_is_skipped_with_one_message(tmp_path, capsys, content):
+    path = tmp_path / "faq.csv"
+    if content is not None:
+        path.write_text(content, encoding="utf-8")
+    index = FaqIndex(path=str(path))
+    assert len(index) == 0
+    assert index.answer("what is hypertension") is None
+    assert len(capsys.readouterr().out.strip().splitlines()) == 1
+
@@ -0,0 +1,22 @@
+import glossary
+from glossary import Glossary
+
+
+def test_default_prepass_keeps_the_original_terms():
+    assert glossary.GLOSSARY_PREPASS == "annotate"
+    text = glossary.get_glossary().annotate("History of hypertension.")
+    assert text == "History of hypertension (high blood pressure)."
+
+
+def test_ambiguous_abbreviations_are_left_alone():
+    g = glossary.get_glossary()
+    for text in ("PE was unremarkable.", "MI ruled out.", "Give 1 g IM.", "Stage IV disease.", "Take PO."):
+        assert g.replace(text) == text
+        assert g.annotate(text) == text
+
+
+def test_whole_words_and_case_rules():
+    g = Glossary(path=None)
+    g.build([("BID", "twice a day"), ("edema", "swelling")])
+    assert g.replace("Take bid, no edema; edemas") == "Take bid, no swelling; edemas"
+    assert g.replace("Take BID") == "Take twice a day"
@@ -0,0 +1,58 @@
+from interaction_index import InteractionIndex
+
+
+def _index(**kwargs):
+    return InteractionIndex(seed_path=None, **kwargs)
+
+
+def _check(index, reply):
+    return index.check(["lisinopril"], ["ibuprofen"], lambda current, new: reply)
+
+
+def test_unparseable_reply_caches_nothing():
+    index = _index()
+    # what _drug_result returns when the agent's content is not JSON
+    _check(index, {"has_issue": False, "interactions": [], "raw": {"raw": "Sorry, I can't help with that"}})
+    assert len(index) == 0
+    assert index.lookup("lisinopril", "ibuprofen") == (False, None)
+
+
+def test_error_reply_caches_nothing():
+    index = _index()
+    _check(index, {"has_issue": False, "interactions": [], "raw": {"error": "ReadTimeout()"}})
+    assert len(index) == 0
+
+
+def test_flagged_reply_with_malformed_pairs_caches_nothing():
+    index = _index()
+    reply = {
+        "has_issue": True,
+        "interactions": [{"pair": "lisinopril + ibuprofen", "severity": "moderate"}],
+        "raw": {"has_issue": True, "interactions": [{"pair": "lisinopril + ibuprofen"}]},
+    }
+    out = _check(index, reply)
+    assert out["has_issue"] is True
+    assert index.lookup("lisinopril", "ibuprofen") == (False, None)
+
+
+def test_clean_no_issue_reply_is_cached_as_safe():
+    index = _index()
+    _check(index, {"has_issue": False, "interactions": [], "raw": {"has_issue": False, "interactions": []}})
+    assert index.lookup("lisinopril", "ibuprofen") == (True, None)
+
+
+def test_safe_verdicts_expire():
+    index = _index(negative_ttl=0)
+    _check(index, {"has_issue": False, "interactions": [], "raw": {"has_issue": False, "interactions": []}})
+    assert index.lookup("lisinopril", "ibuprofen") == (False, None)
+
+
+def test_reported_interaction_is_cached():
+    index = _index(negative_ttl=0)
+    reply = {
+        "has_issue": True,
+        "interactions": [{"pair": ["Lisinopril", "Ibuprofen"], "severity": "moderate", "note": "kidney"}],
+        "raw": {"has_issue": True},
+    }
+    _check(index, reply)
+    assert index.lookup("ibuprofen", "lisinopril") == (True, {"severity": "moderate", "note": "kidney"})
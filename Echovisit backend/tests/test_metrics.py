@@ -0,0 +1,105 @@
+import re
+
+import pytest
+
+import metrics
+from metrics import Counter, Histogram
+
+# name{label="value",...} value
+SAMPLE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*"'
+                    r'(?:,[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*")*\})? (?:[-+]?[0-9.eE+-]+|\+Inf|NaN)$')
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    # metrics made here stay out of the process-wide registry
+    monkeypatch.setattr(metrics, "_registry", [])
+    monkeypatch.setattr(metrics, "_collectors", [])
+
+
+@pytest.fixture
+def timings():
+    token = metrics._request_timings.set([])
+    yield
+    metrics._request_timings.reset(token)
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    h = Histogram("test_seconds", "Test latency.", ["route"], buckets=(0.1, 1))
+    for v in (0.05, 0.5, 5):
+        h.observe(v, route="/qa")
+    assert metrics.render().splitlines() == [
+        "# HELP test_seconds Test latency.",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{route="/qa",le="0.1"} 1',
+        'test_seconds_bucket{route="/qa",le="1"} 2',
+        'test_seconds_bucket{route="/qa",le="+Inf"} 3',
+        'test_seconds_sum{route="/qa"} 5.55',
+        'test_seconds_count{route="/qa"} 3',
+    ]
+
+
+def test_counter_labels_are_escaped(registry):
+    c = Counter("test_total", "Test counter.", ["agent"])
+    c.inc(agent='say "hi"\\\n')
+    c.inc(2, agent="qa")
+    lines = metrics.render().splitlines()
+    assert lines[1] == "# TYPE test_total counter"
+    assert 'test_total{agent="qa"} 2' in lines
+    assert 'test_total{agent="say \\"hi\\"\\\\\\n"} 1' in lines
+    assert all(SAMPLE.match(line) for line in lines if not line.startswith("#"))
+
+
+def test_collectors_are_rendered_and_a_failing_one_is_skipped(registry):
+    metrics.register_collector(lambda: 1 / 0)
+    metrics.register_collector(lambda: [("test_breaker_open", "gauge", "Breaker state.", [({"agent": "qa"}, 1)])])
+    assert metrics.render().splitlines() == [
+        "# HELP test_breaker_open Breaker state.",
+        "# TYPE test_breaker_open gauge",
+        'test_breaker_open{agent="qa"} 1',
+    ]
+
+
+def test_metrics_endpoint_serves_prometheus_text(api_server):
+    client = api_server.app.test_client()
+    client.get("/metrics")
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/plain"
+    assert "version=0.0.4" in resp.content_type
+
+    body = resp.get_data(as_text=True)
+    assert body.endswith("\n")
+    lines = body.splitlines()
+    assert "# TYPE echovisit_request_duration_seconds histogram" in lines
+    assert "# TYPE echovisit_agent_fallbacks_total counter" in lines
+    # the first scrape is counted by the second
+    assert any(line.startswith('echovisit_request_duration_seconds_count{method="GET",endpoint="/metrics",status="200"}')
+               for line in lines)
+    for line in lines:
+        assert line.startswith("# HELP ") or line.startswith("# TYPE ") or SAMPLE.match(line), line
+
+
+def test_server_timing_lists_stages_then_total(timings):
+    metrics.record_stage("whisper", 0.8124)
+    with metrics.timed("agent", "qa/visit 1"):
+        pass
+    header = metrics.server_timing_header(0.95)
+    assert re.fullmatch(r"whisper;dur=812\.4, agent_qa_visit_1;dur=\d+\.\d, total;dur=950\.0", header)
+
+
+def test_server_timing_header_on_responses(api_server, monkeypatch):
+    def simplify_summary(prompt, **kwargs):
+        with metrics.timed("agent", "simplify"):
+            return "not json"
+    monkeypatch.setattr(api_server, "simplify_summary", simplify_summary)
+    client = api_server.app.test_client()
+
+    header = client.post("/simplify_all", json={"transcript": "Rest.", "summary": {}}).headers["Server-Timing"]
+    names = [entry.split(";")[0] for entry in header.split(", ")]
+    assert "agent_simplify" in names
+    assert names[-1] == "total"
+    assert all(re.fullmatch(r"[\w-]+;dur=\d+\.\d", entry) for entry in header.split(", "))
+
+    # timings belong to one request only
+    assert client.get("/metrics").headers["Server-Timing"].startswith("total;dur=")
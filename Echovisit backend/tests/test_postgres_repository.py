@@ -0,0 +1,137 @@
+import json
+import os
+import uuid
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+from connections import run_migrations
+from models import MIGRATIONS
+from visit_export import export_chunks
+from visit_repository import PostgresRepository
+
+# e.g. DB_TEST_DSN=postgresql://postgres@127.0.0.1:5432/postgres; every test
+# run migrates a throwaway schema there and drops it afterwards
+DSN = os.getenv("DB_TEST_DSN")
+pytestmark = pytest.mark.skipif(not DSN, reason="DB_TEST_DSN not set")
+
+
+@pytest.fixture
+def schema():
+    name = f"echovisit_test_{uuid.uuid4().hex[:8]}"
+    conn = psycopg2.connect(DSN)
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA {name}")
+    conn.commit()
+    yield name
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA {name} CASCADE")
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def connect_kwargs(schema):
+    return {"dsn": DSN, "options": f"-c search_path={schema}"}
+
+
+@pytest.fixture
+def migrated(connect_kwargs):
+    conn = psycopg2.connect(**connect_kwargs)
+    run_migrations(conn)
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO doctors (name, email) VALUES ('Dr. Lee', 'lee@example.com') RETURNING id")
+        doctor_id = cur.fetchone()[0]
+        cur.execute("INSERT INTO patients (name, email, birthday) VALUES "
+                    "('Ana', 'Ana@Example.com', '1990-04-02') RETURNING id")
+        patient_id = cur.fetchone()[0]
+    conn.commit()
+    yield conn, doctor_id, patient_id
+    conn.close()
+
+
+@pytest.fixture
+def repo(connect_kwargs, migrated):
+    repository = PostgresRepository(connect_kwargs, minconn=1, maxconn=2)
+    yield repository
+    repository.close()
+
+
+def _visit(doctor_id, patient_id, name):
+    return {"doctor_id": doctor_id, "patient_id": patient_id, "name of visit": name,
+            "allergies": ["penicillin"], "BMI": 22.5, "systolic": 120}
+
+
+def _set_date(conn, visit_id, date):
+    with conn.cursor() as cur:
+        cur.execute("UPDATE visits SET visit_date = %s WHERE id = %s", (date, visit_id))
+    conn.commit()
+
+
+def test_migrations_run_on_plain_postgres(connect_kwargs, migrated):
+    conn, _, _ = migrated
+    with conn.cursor() as cur:
+        cur.execute("SELECT version FROM schema_migrations ORDER BY version")
+        assert [r[0] for r in cur.fetchall()] == [v for v, _, _ in sorted(MIGRATIONS)]
+        # no auth.users here, so no foreign key to it
+        cur.execute("SELECT count(*) FROM pg_constraint WHERE conname = 'doctors_user_id_fkey' "
+                    "AND connamespace = current_schema()::regnamespace")
+        assert cur.fetchone()[0] == 0
+    assert run_migrations(conn) == []
+
+
+def test_insert_then_read_back(repo, migrated):
+    conn, doctor_id, patient_id = migrated
+    assert repo.find_patient_id("ana@example.com", "1990-04-02") == patient_id
+    assert repo.find_patient_id("ana@example.com", "1990-04-03") is None
+
+    visit_id = repo.insert_visit(_visit(doctor_id, patient_id, "Checkup"))
+    detail = repo.get_visit(visit_id)
+    assert detail["name of visit"] == "Checkup"
+    assert json.loads(detail["allergies"]) == ["penicillin"]
+    assert detail["BMI"] == 22.5
+    assert (detail["doctor_name"], detail["patient_name"]) == ("Dr. Lee", "Ana")
+
+    narrowed = repo.get_visit(visit_id, ["systolic"])
+    assert set(narrowed) == {"id", "visit_date", "systolic", "doctor_name", "patient_name"}
+
+
+def test_history_pages_newest_first(repo, migrated):
+    conn, doctor_id, patient_id = migrated
+    ids = [repo.insert_visit(_visit(doctor_id, patient_id, f"v{i}")) for i in range(5)]
+    for i, visit_id in enumerate(ids):
+        _set_date(conn, visit_id, f"2024-01-0{1 + i // 2}T09:00:00")    # pairs share a timestamp
+
+    list_fields = ["id", "visit_date", "name of visit", "doctor_id", "patient_id"]
+    seen, after = [], None
+    while True:
+        page = repo.visit_history(patient_id, list_fields, after=after, limit=2)
+        if not page:
+            break
+        seen += [row["id"] for row in page]
+        after = page[-1]["visit_date"], page[-1]["id"]
+    assert seen == list(reversed(ids))
+
+    projected = repo.visit_history(patient_id, ["systolic"], limit=1)
+    assert set(projected[0]) == {"id", "visit_date", "systolic"}
+
+
+def test_update_and_export(repo, migrated):
+    conn, doctor_id, patient_id = migrated
+    first = repo.insert_visit(_visit(doctor_id, patient_id, "Old"))
+    second = repo.insert_visit(_visit(doctor_id, patient_id, "New"))
+    _set_date(conn, first, "2024-03-01T10:00:00")
+    _set_date(conn, second, "2024-03-02T10:00:00")
+
+    assert repo.update_visit(first, {"diagnosis": "Flu", "allergies": ["none"]})
+    assert not repo.update_visit(first + 1000, {"diagnosis": "x"})
+    assert repo.get_visit(first)["diagnosis"] == "Flu"
+
+    rows = [json.loads(line) for chunk in export_chunks(repo, "ndjson", batch_size=1)
+            for line in chunk.decode("utf-8").splitlines()]
+    assert [r["id"] for r in rows] == [first, second]
+    assert rows[0]["diagnosis"] == "Flu"
+
+    only_second = list(repo.export_visits(since="2024-03-02T00:00:00", doctor_id=doctor_id))
+    assert [r["id"] for batch in only_second for r in batch] == [second]
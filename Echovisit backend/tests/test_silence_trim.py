@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+import silence_trim
+from silence_trim import SAMPLE_RATE, TimeMap, trim_silence
+
+
+def _tone(seconds, freq=220.0):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (0.5 * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+
+def _room(seconds, seed=0):
+    return (np.random.default_rng(seed).standard_normal(int(seconds * SAMPLE_RATE)) * 0.001).astype(np.float32)
+
+
+@pytest.fixture
+def consultation():
+    # speech 0-1 s, a 3 s pause, speech 4-5 s, a 0.4 s breath, speech 5.4-6.4 s
+    return np.concatenate([_tone(1), _room(3), _tone(1, 330), _room(0.4, 1), _tone(1, 440)])
+
+
+def test_long_pause_is_removed_and_short_one_kept(consultation):
+    trimmed, _ = trim_silence(consultation)
+    cut = (len(consultation) - len(trimmed)) / SAMPLE_RATE
+    # the 3 s pause goes, less VAD_PAD_MS kept on each side of it
+    assert 3 - 2 * silence_trim.VAD_PAD_MS / 1000 - 0.1 < cut <= 3
+    # the 0.4 s breath between the last two phrases is shorter than VAD_MIN_SILENCE_MS
+    assert len(trimmed) / SAMPLE_RATE > 3.4
+
+
+def test_speech_is_kept_whole(consultation):
+    trimmed, _ = trim_silence(consultation)
+    speech = np.sum(consultation.astype(np.float64) ** 2)
+    assert np.sum(trimmed.astype(np.float64) ** 2) == pytest.approx(speech, rel=1e-4)
+
+
+def test_times_map_back_to_the_recording(consultation):
+    trimmed, time_map = trim_silence(consultation)
+    # every trimmed sample is the recording's sample at the mapped time
+    t = np.arange(len(trimmed)) / SAMPLE_RATE
+    original = np.rint(time_map.to_original(t) * SAMPLE_RATE).astype(int)
+    assert np.array_equal(trimmed, consultation[original])
+
+    # the second phrase starts at 4 s in the recording, whatever its trimmed time
+    onset = np.flatnonzero(np.abs(trimmed[int(1.5 * SAMPLE_RATE):]) > 0.1)[0] / SAMPLE_RATE + 1.5
+    assert time_map.to_original(onset) == pytest.approx(4.0, abs=1 / SAMPLE_RATE * 30)
+
+
+def test_segments_are_rewritten_in_recording_time(consultation):
+    _, time_map = trim_silence(consultation)
+    start = time_map.to_original(0.5)
+    later = float(time_map.trimmed[1]) + 0.5
+    segments = [{"start": 0.5, "end": later, "words": [{"start": later, "end": later + 0.1}]}]
+    time_map.remap_segments(segments)
+    assert segments[0]["start"] == pytest.approx(start, abs=1e-3)
+    assert segments[0]["end"] == pytest.approx(float(time_map.original[1]) + 0.5, abs=1e-3)
+    assert segments[0]["words"][0]["end"] == pytest.approx(segments[0]["end"] + 0.1, abs=1e-3)
+
+
+def test_silence_only_and_disabled_audio_are_untouched(monkeypatch):
+    quiet = _room(5)
+    trimmed, time_map = trim_silence(quiet)
+    assert trimmed is quiet or np.array_equal(trimmed, quiet)
+    assert time_map.to_original(2.0) == 2.0
+
+    monkeypatch.setattr(silence_trim, "VAD_ENABLED", False)
+    speech = np.concatenate([_tone(1), _room(3), _tone(1)])
+    assert silence_trim.prepare_for_whisper(speech)[0] is speech
+    assert isinstance(TimeMap.identity().to_original(np.array([1.0, 2.0])), np.ndarray)
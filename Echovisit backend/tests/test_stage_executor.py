@@ -0,0 +1,140 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import metrics
+from stage_executor import Stage, iter_stages, run_stages
+
+
+@pytest.fixture
+def executor():
+    pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="test-stage")
+    yield pool
+    pool.shutdown(wait=True)
+
+
+class Log:
+    """Records when each stage starts and finishes, across worker threads."""
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def stage(self, name, fn):
+        def run(*args):
+            with self._lock:
+                self.events.append(("start", name))
+            result = fn(*args)
+            with self._lock:
+                self.events.append(("end", name))
+            return result
+        return run
+
+    def index(self, kind, name):
+        return self.events.index((kind, name))
+
+
+def test_stages_start_after_their_inputs(executor):
+    log = Log()
+    # b and c only meet at the barrier if they run at the same time
+    both = threading.Barrier(2, timeout=5)
+
+    def side(tag):
+        def fn(a):
+            both.wait()
+            return f"{a}+{tag}"
+        return fn
+
+    stages = [
+        Stage("d", log.stage("d", lambda b, c: (b, c)), ["b", "c"]),
+        Stage("b", log.stage("b", side("b")), ["a"]),
+        Stage("c", log.stage("c", side("c")), ["a"]),
+        Stage("a", log.stage("a", lambda t: t.upper()), ["transcript"]),
+    ]
+    results = run_stages(stages, {"transcript": "visit"}, executor)
+
+    assert results["transcript"] == "visit"
+    assert results["d"] == ("VISIT+b", "VISIT+c")    # inputs arrive in declared order
+    for stage in stages:
+        for dep in stage.inputs:
+            if dep != "transcript":
+                assert log.index("end", dep) < log.index("start", stage.name)
+
+
+def test_results_are_yielded_as_stages_finish(executor):
+    release_slow = threading.Event()
+
+    def slow(t):
+        assert release_slow.wait(5)
+        return "slow"
+
+    def fast(t):
+        return "fast"
+
+    stages = [Stage("slow", slow, ["t"]), Stage("fast", fast, ["t"]),
+              Stage("after_fast", lambda f: f + "!", ["fast"])]
+    names = []
+    for name, _ in iter_stages(stages, {"t": ""}, executor):
+        names.append(name)
+        if name == "after_fast":
+            release_slow.set()
+    assert names == ["fast", "after_fast", "slow"]
+
+
+def test_failure_propagates_and_nothing_downstream_runs(executor):
+    ran = []
+
+    def boom(t):
+        raise RuntimeError("agent down")
+
+    stages = [
+        Stage("boom", boom, ["t"]),
+        Stage("downstream", lambda b: ran.append("downstream"), ["boom"]),
+    ]
+    with pytest.raises(RuntimeError, match="agent down"):
+        run_stages(stages, {"t": ""}, executor)
+    assert ran == []
+
+
+def test_failure_does_not_wait_for_running_siblings(executor):
+    slow_started, release_slow = threading.Event(), threading.Event()
+    ran = []
+
+    def boom(t):
+        assert slow_started.wait(5)
+        raise RuntimeError("agent down")
+
+    def slow(t):
+        slow_started.set()
+        assert release_slow.wait(5)
+
+    stages = [Stage("boom", boom, ["t"]), Stage("slow", slow, ["t"]),
+              Stage("after_slow", lambda s: ran.append("after_slow"), ["slow"])]
+    try:
+        with pytest.raises(RuntimeError):
+            run_stages(stages, {"t": ""}, executor)
+        # raised while slow was still running, and nothing was queued behind it
+        assert not release_slow.is_set()
+    finally:
+        release_slow.set()
+    assert ran == []
+
+
+def test_unknown_inputs_and_cycles_are_rejected(executor):
+    with pytest.raises(ValueError, match="unknown inputs"):
+        run_stages([Stage("a", lambda x: x, ["missing"])], executor=executor)
+    with pytest.raises(ValueError, match="Cycle"):
+        run_stages([Stage("a", lambda b: b, ["b"]), Stage("b", lambda a: a, ["a"])], executor=executor)
+
+
+def test_stage_timings_reach_the_request(executor):
+    token = metrics._request_timings.set([])
+    try:
+        def timed_stage(t):
+            metrics.record_stage("agent", 0.25, "summarize")
+            return t
+        run_stages([Stage("summary", timed_stage, ["t"])], {"t": ""}, executor)
+        assert metrics.server_timing_header() == "agent_summarize;dur=250.0"
+    finally:
+        metrics._request_timings.reset(token)
@@ -0,0 +1,133 @@
+import io
+import os
+import shutil
+import threading
+import wave
+
+import numpy as np
+import pytest
+
+import audio_decode
+from streaming_transcription import SAMPLE_RATE, STREAM_HOLDBACK_SECONDS, STREAM_MIN_NEW_SECONDS, StreamingSession
+
+RECORDING_SECONDS = 60
+
+
+class _FakeRecording:
+    """decode_fn over a silent recording: returns the samples from `start` on and logs each call."""
+
+    def __init__(self, seconds=RECORDING_SECONDS):
+        self.total = seconds * SAMPLE_RATE
+        self.starts = []
+
+    def __call__(self, path, start=0.0):
+        self.starts.append(start)
+        return np.zeros(self.total - int(round(start * SAMPLE_RATE)), dtype=np.float32)
+
+
+def _one_second_segments(audio, initial_prompt=None):
+    n = len(audio) // SAMPLE_RATE
+    return {"text": "tail", "segments": [{"start": i, "end": i + 1, "text": f"s{i}"} for i in range(n)]}
+
+
+@pytest.fixture
+def session(tmp_path):
+    recording = _FakeRecording()
+    s = StreamingSession(_one_second_segments, recording, temp_dir=str(tmp_path))
+    yield s, recording
+    s.close()
+
+
+def test_each_pass_decodes_from_the_committed_point(session):
+    s, recording = session
+    s.add_chunk(0, b"webm")
+    s.advance()
+    first = RECORDING_SECONDS - STREAM_HOLDBACK_SECONDS
+    assert s.transcribed_seconds() == first
+
+    s.advance(final=True)
+    assert recording.starts == [0.0, first]
+    assert s.transcribed_seconds() == RECORDING_SECONDS
+    assert s.transcript().endswith("tail")
+
+
+def test_short_pending_audio_waits_for_more(tmp_path):
+    s = StreamingSession(_one_second_segments, _FakeRecording(int(STREAM_MIN_NEW_SECONDS)), temp_dir=str(tmp_path))
+    s.add_chunk(0, b"webm")
+    s.advance()
+    assert s.committed == 0
+    s.close()
+
+
+def test_chunks_are_accepted_while_a_pass_runs(tmp_path):
+    entered, release = threading.Event(), threading.Event()
+
+    def slow_transcribe(audio, initial_prompt=None):
+        entered.set()
+        release.wait(5)
+        return _one_second_segments(audio)
+
+    s = StreamingSession(slow_transcribe, _FakeRecording(), temp_dir=str(tmp_path))
+    s.add_chunk(0, b"a")
+    worker = threading.Thread(target=s.advance)
+    worker.start()
+    assert entered.wait(5)
+
+    uploader = threading.Thread(target=s.add_chunk, args=(1, b"b"))
+    uploader.start()
+    uploader.join(1)
+    assert not uploader.is_alive()      # did not wait for Whisper
+    assert s.next_seq == 2
+
+    release.set()
+    worker.join(5)
+    with open(s.path, "rb") as f:
+        assert f.read() == b"ab"
+    s.close()
+
+
+def test_out_of_order_chunks_are_appended_in_sequence(session):
+    s, _ = session
+    s.add_chunk(1, b"b")
+    s.add_chunk(0, b"a")
+    s.add_chunk(0, b"a")
+    assert s.size == 2
+    with open(s.path, "rb") as f:
+        assert f.read() == b"ab"
+
+
+@pytest.mark.skipif(not shutil.which(audio_decode.FFMPEG), reason="ffmpeg not available")
+def test_decode_file_skips_to_start(tmp_path):
+    path = os.path.join(tmp_path, "tone.wav")
+    samples = (np.arange(4 * SAMPLE_RATE) // SAMPLE_RATE * 8000).astype(np.int16)  # a 1 s step per level
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes(samples.tobytes())
+
+    whole = audio_decode.decode_file(path)
+    tail = audio_decode.decode_file(path, 2.5)
+    assert len(whole) == 4 * SAMPLE_RATE
+    assert abs(len(tail) - int(1.5 * SAMPLE_RATE)) <= SAMPLE_RATE // 100
+    # starts half way through the third level, not at the beginning of the file
+    assert np.allclose(tail[100:SAMPLE_RATE // 4], 16000 / 32768, atol=1e-3)
+    assert np.allclose(tail[-SAMPLE_RATE // 4:-100], 24000 / 32768, atol=1e-3)
+
+
+def test_missing_ffmpeg_is_reported(tmp_path, monkeypatch):
+    monkeypatch.setattr(audio_decode, "FFMPEG", os.path.join(tmp_path, "no-ffmpeg"))
+    with pytest.raises(audio_decode.FFmpegNotFound):
+        audio_decode.decode_file(os.path.join(tmp_path, "x.webm"))
+
+    # not retried through the seekable (temp file) fallback
+    monkeypatch.setattr(audio_decode, "decode_seekable", lambda stream: pytest.fail("fallback used"))
+    with pytest.raises(audio_decode.FFmpegNotFound):
+        audio_decode.decode_upload(io.BytesIO(b"webm"))
+
+
+@pytest.mark.skipif(not shutil.which(audio_decode.FFMPEG), reason="ffmpeg not available")
+def test_undecodable_audio_is_not_a_missing_ffmpeg():
+    with pytest.raises(audio_decode.AudioDecodeError) as err:
+        audio_decode.decode_upload(io.BytesIO(b"not audio at all"))
+    assert not isinstance(err.value, audio_decode.FFmpegNotFound)
@@ -0,0 +1,82 @@
+import io
+import shutil
+import wave
+
+import numpy as np
+import pytest
+
+import audio_decode
+import transcription_jobs
+from silence_trim import SAMPLE_RATE
+
+
+class _FakeModel:
+    def __init__(self):
+        self.audio = None
+
+    def transcribe(self, audio, **kwargs):
+        self.audio = audio
+        return {"text": "ok"}
+
+
+def _wav_bytes(samples):
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes((samples * 32767).astype(np.int16).tobytes())
+    return buf.getvalue()
+
+
+@pytest.mark.skipif(not shutil.which(audio_decode.FFMPEG), reason="ffmpeg not available")
+def test_worker_decodes_and_trims_like_transcribe(monkeypatch):
+    model = _FakeModel()
+    monkeypatch.setattr(transcription_jobs, "_worker_model", model)
+    t = np.arange(2 * SAMPLE_RATE) / SAMPLE_RATE
+    tone = (0.5 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+    silence = np.zeros(5 * SAMPLE_RATE, dtype=np.float32)
+
+    text = transcription_jobs._transcribe_in_worker(_wav_bytes(np.concatenate([tone, silence, tone])))
+    assert text == "ok"
+    assert isinstance(model.audio, np.ndarray) and model.audio.dtype == np.float32
+    # the five-second pause is cut before Whisper sees the audio
+    assert len(model.audio) < 6 * SAMPLE_RATE
+
+
+def test_undecodable_upload_fails_the_job(monkeypatch, tmp_path):
+    monkeypatch.setattr(transcription_jobs, "_worker_model", _FakeModel())
+    if not shutil.which(audio_decode.FFMPEG):
+        monkeypatch.setattr(audio_decode, "FFMPEG", str(tmp_path / "no-ffmpeg"))
+    with pytest.raises(audio_decode.AudioDecodeError):
+        transcription_jobs._transcribe_in_worker(b"not audio at all")
+
+
+class _BrokenPool:
+    """ProcessPoolExecutor stand-in that accepts the warm-up calls and fails every job."""
+
+    def __init__(self, **kwargs):
+        pass
+
+    def submit(self, fn, *args):
+        if fn is transcription_jobs._warm_worker:
+            return None
+        raise RuntimeError("pool is broken")
+
+
+class _BrokenUpload:
+    def read(self):
+        raise OSError("client went away")
+
+
+def test_failed_submit_gives_its_queue_slot_back(monkeypatch):
+    monkeypatch.setattr(transcription_jobs, "ProcessPoolExecutor", _BrokenPool)
+    jobs = transcription_jobs.TranscriptionJobs(postprocess=lambda transcript, form: {}, workers=1, queue_depth=1)
+
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            jobs.submit(io.BytesIO(b"webm"), {})
+        with pytest.raises(OSError):
+            jobs.submit(_BrokenUpload(), {})
+    assert jobs._active == 0
+    assert jobs._jobs == {}
@@ -0,0 +1,72 @@
+import pytest
+
+from visit_repository import SupabaseRepository, _quote_column
+
+
+class _Query:
+    """Records the PostgREST builder calls instead of sending them."""
+
+    def __init__(self, calls):
+        self.calls = calls
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((name, args))
+            return self
+        return call
+
+    def execute(self):
+        return type("Result", (), {"data": []})()
+
+
+class _Client:
+    def __init__(self):
+        self.calls = []
+
+    def table(self, name):
+        self.calls.append(("table", (name,)))
+        return _Query(self.calls)
+
+
+@pytest.fixture
+def repo():
+    admin = _Client()
+    return SupabaseRepository(_Client(), admin), admin.calls
+
+
+def _arg(calls, name):
+    return next(args[0] for n, args in calls if n == name)
+
+
+def test_known_fields_are_selected(repo):
+    repository, calls = repo
+    repository.visit_history(1, ["name of visit", "allergies"])
+    assert _arg(calls, "select") == 'id,visit_date,"name of visit",allergies'
+
+
+@pytest.mark.parametrize("field", [
+    'name of visit",doctors(password),"x',
+    "doctors(password)",
+    "patients(*)",
+    "password",
+])
+def test_unknown_fields_are_rejected(repo, field):
+    repository, calls = repo
+    with pytest.raises(ValueError):
+        repository.visit_history(1, [field])
+    with pytest.raises(ValueError):
+        repository.get_visit(1, [field])
+    assert not any(n == "select" for n, _ in calls)
+
+
+def test_quoted_names_cannot_close_the_quote():
+    assert _quote_column('a",b') == '"a\\",b"'
+
+
+def test_cursor_date_must_be_a_timestamp(repo):
+    repository, calls = repo
+    repository.visit_history(1, ["id"], after=("2024-05-01T10:30:00", 7))
+    assert _arg(calls, "or_") == ('visit_date.lt."2024-05-01T10:30:00",'
+                                  'and(visit_date.eq."2024-05-01T10:30:00",id.lt.7)')
+    with pytest.raises(ValueError):
+        repository.visit_history(1, ["id"], after=('2024-05-01",patient_id.neq.0,"', 7))
@@ -0,0 +1,63 @@
+import pytest
+
+import visit_retrieval
+from visit_retrieval import VisitIndex, get_index, qa_context
+
+SUMMARY = {
+    "allergies": "Penicillin (hives)",
+    "symptoms": "Cough for two weeks",
+    "diagnosis": "Acute bronchitis",
+    "medications": "Benzonatate 100 mg three times daily",
+    "instructions": "Rest, fluids, return if fever",
+    "notes": "",
+}
+
+
+def _transcript(topics, words_per_topic=200):
+    """One block of filler words per topic, so each topic lands in its own chunks."""
+    return " ".join(" ".join([topic] + [f"filler{i}" for i in range(words_per_topic - 1)]) for topic in topics)
+
+
+@pytest.fixture
+def long_visit():
+    return {"transcript": _transcript(["parking", "weather", "insurance", "holiday", "football", "garden", "traffic"]),
+            "summary": dict(SUMMARY)}
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(visit_retrieval, "_indexes", visit_retrieval.LRUCache(
+        maxsize=visit_retrieval.INDEX_CACHE_BYTES, getsizeof=lambda index: index.nbytes))
+
+
+def test_transcript_is_trimmed_to_the_matching_chunks(long_visit):
+    out = qa_context("Where do I find parking?", long_visit, k=2)
+    assert "parking" in out["transcript"]
+    assert "football" not in out["transcript"]
+    assert len(out["transcript"]) < len(long_visit["transcript"])
+
+
+def test_allergies_and_medications_survive_an_unrelated_question(long_visit):
+    out = qa_context("Is there traffic on the way home?", long_visit, k=2)
+    assert "traffic" in out["transcript"]
+    assert out["summary"] == SUMMARY
+    assert out["summary"]["allergies"] == "Penicillin (hives)"
+    assert out["summary"]["medications"] == "Benzonatate 100 mg three times daily"
+
+
+def test_short_transcripts_and_unmatched_questions_go_out_whole(long_visit):
+    short = {"transcript": "parking is out back", "summary": SUMMARY}
+    assert qa_context("parking?", short) is short
+    assert qa_context("zebra?", long_visit) is long_visit
+
+
+def test_cache_is_bounded_by_memory(long_visit, monkeypatch):
+    one = VisitIndex(long_visit).nbytes
+    monkeypatch.setattr(visit_retrieval, "_indexes", visit_retrieval.LRUCache(
+        maxsize=int(one * 2.5), getsizeof=lambda index: index.nbytes))
+    for visit_id in range(5):
+        get_index(long_visit, visit_id)
+    assert len(visit_retrieval._indexes) == 2
+    assert visit_retrieval._indexes.currsize <= one * 2.5
+    # the most recent ones are kept
+    assert get_index(long_visit, 4) is get_index(long_visit, 4)
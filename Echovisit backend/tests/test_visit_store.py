@@ -0,0 +1,99 @@
+import json
+import sqlite3
+
+import pytest
+
+import visit_store
+from visit_store import VisitStore, content_hash
+
+VISIT = {"transcript": "Take one tablet daily.", "summary": {"medications": "Lisinopril 10 mg daily"}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return VisitStore(str(tmp_path / "visit_store.sqlite3"))
+
+
+def test_round_trip_survives_a_reopen(store):
+    key = (42, "es", "original", content_hash(VISIT))
+    store.put(*key, {"transcript": "Tome una tableta al día.", "summary": {}})
+    assert VisitStore(store.path).get(*key) == {"transcript": "Tome una tableta al día.", "summary": {}}
+
+
+def test_edited_visits_and_invalidated_visits_miss(store):
+    store.put(42, "es", "original", content_hash(VISIT), {"transcript": "x"})
+    edited = {**VISIT, "transcript": "Take two tablets daily."}
+    assert store.get(42, "es", "original", content_hash(edited)) is None
+    store.invalidate(42)
+    assert store.get(42, "es", "original", content_hash(VISIT)) is None
+
+
+def test_outputs_with_a_ttl_expire(store, monkeypatch):
+    chash = content_hash(VISIT)
+    store.put(42, "en", "simplified", chash, {"source": "glossary"}, ttl=60)
+    assert store.get(42, "en", "simplified", chash) == {"source": "glossary"}
+    now = visit_store.time.time()
+    monkeypatch.setattr(visit_store.time, "time", lambda: now + 61)
+    assert store.get(42, "en", "simplified", chash) is None
+
+
+def test_store_files_without_expiry_are_upgraded(tmp_path):
+    path = str(tmp_path / "old.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE visit_outputs(visit_id TEXT NOT NULL, lang TEXT NOT NULL, mode TEXT NOT NULL, "
+                     "content_hash TEXT NOT NULL, result TEXT NOT NULL, created_at REAL NOT NULL, "
+                     "PRIMARY KEY (visit_id, lang, mode, content_hash))")
+        conn.execute("INSERT INTO visit_outputs VALUES ('7', 'es', 'original', 'h', '{\"a\": 1}', 0)")
+    store = VisitStore(path)
+    assert store.get(7, "es", "original", "h") == {"a": 1}
+
+
+def test_default_path_is_next_to_the_code():
+    assert visit_store.VISIT_STORE_PATH.startswith(visit_store.os.path.dirname(visit_store.__file__))
+
+
+@pytest.fixture
+def client(api_server, store, monkeypatch):
+    monkeypatch.setattr(api_server, "visit_store", store)
+    return api_server.app.test_client()
+
+
+def _agent(monkeypatch, api_server, name, reply):
+    calls = []
+
+    def agent(prompt, **kwargs):
+        calls.append(prompt)
+        return reply
+    monkeypatch.setattr(api_server, name, agent)
+    return calls
+
+
+def test_second_view_is_served_from_the_store(client, api_server, monkeypatch):
+    translated = {"transcript": "Tome una tableta al día.", "summary": {"medications": "Lisinopril 10 mg al día"}}
+    calls = _agent(monkeypatch, api_server, "translation_summary", json.dumps(translated))
+    body = {**VISIT, "lang": "es", "visit_id": 42}
+
+    first = client.post("/translate_all", json=body).get_json()
+    second = client.post("/translate_all", json=body).get_json()
+    assert len(calls) == 1
+    assert second == first
+    assert second["transcript"] == "Tome una tableta al día."
+
+    # without a visit_id nothing is stored
+    client.post("/translate_all", json={**VISIT, "lang": "es"})
+    assert len(calls) == 2
+
+
+def test_glossary_fallback_is_stored_briefly(client, api_server, monkeypatch):
+    calls = _agent(monkeypatch, api_server, "simplify_summary", "not json")
+    body = {**VISIT, "visit_id": 43}
+
+    first = client.post("/simplify_all", json=body).get_json()
+    assert first["source"] == "glossary"
+    assert client.post("/simplify_all", json=body).get_json() == first
+    assert len(calls) == 1
+
+    now = visit_store.time.time()
+    monkeypatch.setattr(visit_store.time, "time", lambda: now + visit_store.VISIT_STORE_FALLBACK_TTL + 1)
+    client.post("/simplify_all", json=body)
+    assert len(calls) == 2
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+import watsonx_client
+import watsonx_resilience as resilience
+from watsonx_client import close_async_http_client, get_async_http_client, post_agent_async
+
+
+@pytest.fixture
+def endpoint(stub, monkeypatch):
+    server, _, _ = stub
+    monkeypatch.setattr(watsonx_client, "ENDPOINT", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(resilience, "_health", {})
+    monkeypatch.setattr(resilience, "RETRY_BASE_DELAY", 0.001)
+    watsonx_client.clear_cache()
+    yield server
+    watsonx_client.clear_cache()
+
+
+def _run(coro_fn):
+    async def main():
+        try:
+            return await coro_fn()
+        finally:
+            await close_async_http_client()
+    return asyncio.run(main())
+
+
+def test_concurrent_calls_share_one_client(endpoint):
+    async def calls():
+        first = get_async_http_client()
+        resps = await asyncio.gather(*[
+            post_agent_async("dep", {"messages": [{"role": "user", "content": str(i)}]}, "token")
+            for i in range(5)])
+        assert get_async_http_client() is first
+        return resps
+
+    resps = _run(calls)
+    assert [r.status_code for r in resps] == [200] * 5
+    assert endpoint.hits == 5
+
+
+def test_async_retries_until_healthy(endpoint):
+    endpoint.script = [(0, 503, {}), (0, 200, {})]
+    resp = _run(lambda: post_agent_async("dep", {"messages": []}, "token", use_cache=False))
+    assert resp.status_code == 200
+    assert endpoint.hits == 2
+    assert resilience.get_health("dep").counters["retries"] == 1
+
+
+def test_identical_async_requests_hit_the_cache(endpoint, monkeypatch):
+    monkeypatch.setattr(watsonx_client, "AGENT_CACHE_AGENTS", frozenset({"dep"}))
+    payload = {"messages": [{"role": "user", "content": "same"}]}
+
+    async def twice():
+        await post_agent_async("dep", payload, "token")
+        return await post_agent_async("dep", payload, "token")
+
+    assert _run(twice).status_code == 200
+    assert endpoint.hits == 1
+
+
+def test_client_is_bound_to_its_event_loop():
+    async def open_client():
+        get_async_http_client()
+
+    asyncio.run(open_client())
+    try:
+        with pytest.raises(RuntimeError):
+            asyncio.run(open_client())
+    finally:
+        asyncio.run(close_async_http_client())
@@ -0,0 +1,160 @@
+import json
+import threading
+import time
+
+import pytest
+
+import watsonx_client
+import watsonx_resilience as resilience
+from watsonx_client import stream_agent
+
+
+def _sse(*pieces):
+    lines = [f"data: {json.dumps({'choices': [{'delta': {'content': p}}]})}\n\n" for p in pieces]
+    return ("".join(lines) + "data: [DONE]\n\n").encode("utf-8")
+
+
+SSE = {"Content-Type": "text/event-stream"}
+
+
+@pytest.fixture
+def endpoint(stub, monkeypatch):
+    server, _, _ = stub
+    monkeypatch.setattr(watsonx_client, "ENDPOINT", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(watsonx_client, "_inflight", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(resilience, "_health", {})
+    watsonx_client.clear_cache()
+    yield server
+    watsonx_client.clear_cache()
+
+
+def _slot_free(timeout=2):
+    if watsonx_client._inflight.acquire(timeout=timeout):
+        watsonx_client._inflight.release()
+        return True
+    return False
+
+
+def test_stream_frees_its_slot_while_the_caller_is_still_reading(endpoint):
+    endpoint.script = [(0, 200, SSE, _sse("Take ", "it ", "with food."))]
+    pieces = stream_agent("dep", {"messages": []}, "token", use_cache=False)
+    assert next(pieces) == "Take "
+    # upstream is done; a slow consumer no longer holds the concurrency slot
+    assert _slot_free()
+    assert list(pieces) == ["it ", "with food."]
+
+
+def test_abandoned_stream_frees_its_slot(endpoint):
+    endpoint.script = [(0, 200, SSE, _sse("a", "b", "c"))]
+    pieces = stream_agent("dep", {"messages": []}, "token", use_cache=False)
+    next(pieces)
+    pieces.close()
+    assert _slot_free()
+
+
+def test_slot_is_free_during_backoff(endpoint, monkeypatch):
+    endpoint.script = [(0, 503, {}), (0, 200, SSE, _sse("ok"))]
+    during_backoff = []
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt, resp=None: 0)
+    real_sleep = time.sleep
+
+    def sleep(seconds):
+        if threading.current_thread() is threading.main_thread():    # not the stub server's
+            during_backoff.append(_slot_free(0))
+        real_sleep(seconds)
+
+    monkeypatch.setattr(resilience.time, "sleep", sleep)
+
+    assert list(stream_agent("dep", {"messages": []}, "token", use_cache=False)) == ["ok"]
+    assert during_backoff == [True]
+    assert _slot_free()
+
+
+def test_stream_that_cannot_open_raises_and_frees_its_slot(endpoint, monkeypatch):
+    monkeypatch.setattr(resilience, "RETRY_MAX_ATTEMPTS", 1)
+    endpoint.script = [(0, 400, {})]
+    with pytest.raises(Exception):
+        list(stream_agent("dep", {"messages": []}, "token", use_cache=False))
+    assert _slot_free()
+
+
+def test_completed_stream_is_cached(endpoint, monkeypatch):
+    monkeypatch.setattr(watsonx_client, "AGENT_CACHE_AGENTS", frozenset({"dep"}))
+    endpoint.script = [(0, 200, SSE, _sse("cached ", "answer"))]
+    payload = {"messages": [{"role": "user", "content": "q"}]}
+    assert "".join(stream_agent("dep", payload, "token")) == "cached answer"
+    assert list(stream_agent("dep", payload, "token")) == ["cached answer"]
+    assert endpoint.hits == 1
+
+
+@pytest.fixture
+def named_deployments(monkeypatch):
+    for agent in ("SIMPLIFY", "QA", "DRUG"):
+        monkeypatch.setenv(f"{agent}_DEPLOYMENT_ID", f"{agent.lower()}-dep")
+    watsonx_client.agent_name.cache_clear()
+    yield
+    watsonx_client.agent_name.cache_clear()
+
+
+def test_only_allowlisted_agents_are_cached(endpoint, named_deployments):
+    payload = {"messages": [{"role": "user", "content": "same"}]}
+    for _ in range(2):
+        watsonx_client.post_agent("simplify-dep", payload, "token")
+    assert endpoint.hits == 1
+
+
+@pytest.mark.parametrize("deployment", ["qa-dep", "drug-dep"])
+def test_qa_and_drug_checks_always_reach_upstream(endpoint, named_deployments, deployment):
+    payload = {"messages": [{"role": "user", "content": "same"}]}
+    for _ in range(3):
+        assert watsonx_client.post_agent(deployment, payload, "token").status_code == 200
+    assert endpoint.hits == 3
+
+
+@pytest.fixture
+def provider(endpoint, monkeypatch):
+    issuer = watsonx_client.IAMTokenProvider("key", token_url=f"http://127.0.0.1:{endpoint.server_port}/identity/token")
+    issuer._token, issuer._expires_at = "old", time.time() + 3600
+    monkeypatch.setattr(watsonx_client, "_providers", {"key": issuer})
+    yield issuer
+    if issuer._timer is not None:
+        issuer._timer.cancel()
+
+
+NEW_TOKEN = (0, 200, {}, json.dumps({"access_token": "new", "expires_in": 3600}).encode("utf-8"))
+
+
+def test_401_renews_the_token_and_retries_once(endpoint, provider):
+    endpoint.script = [(0, 401, {}), NEW_TOKEN, (0, 200, {})]
+    resp = watsonx_client.post_agent("dep", {"messages": []}, "old", use_cache=False)
+    assert resp.status_code == 200
+    assert endpoint.auth == ["Bearer old", None, "Bearer new"]
+    assert provider.peek() == "new"
+
+
+def test_second_401_is_returned(endpoint, provider):
+    endpoint.script = [(0, 401, {}), NEW_TOKEN, (0, 401, {})]
+    resp = watsonx_client.post_agent("dep", {"messages": []}, "old", use_cache=False)
+    assert resp.status_code == 401
+    assert endpoint.hits == 3
+
+
+def test_401_for_a_token_no_provider_issued_is_returned(endpoint, provider):
+    endpoint.script = [(0, 401, {})]
+    assert watsonx_client.post_agent("dep", {"messages": []}, "foreign", use_cache=False).status_code == 401
+    assert endpoint.hits == 1
+    assert provider.peek() == "old"
+
+
+def test_callers_rejected_with_the_same_token_share_one_renewal(endpoint, provider):
+    endpoint.script = [NEW_TOKEN]
+    assert watsonx_client.renewed_token("old") == "new"
+    assert watsonx_client.renewed_token("old") == "new"
+    assert endpoint.hits == 1
+
+
+def test_stream_renews_the_token_after_401(endpoint, provider):
+    endpoint.script = [(0, 401, {}), NEW_TOKEN, (0, 200, SSE, _sse("hi"))]
+    assert list(stream_agent("dep", {"messages": []}, "old", use_cache=False)) == ["hi"]
+    assert endpoint.auth[-1] == "Bearer new"
+    assert _slot_free()
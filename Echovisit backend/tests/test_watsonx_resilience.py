@@ -0,0 +1,124 @@
+import email.utils
+import time
+import types
+
+import httpx
+import pytest
+
+import watsonx_resilience as resilience
+from watsonx_resilience import CircuitBreaker, backoff_delay, call_with_resilience, retry_after_seconds
+
+
+@pytest.fixture(autouse=True)
+def fresh_health(monkeypatch):
+    monkeypatch.setattr(resilience, "_health", {})
+    # retries record their backoff instead of sleeping (the stub server still sleeps for real)
+    sleeps = []
+    monkeypatch.setattr(resilience, "time", types.SimpleNamespace(
+        monotonic=time.monotonic, time=time.time, sleep=sleeps.append))
+    return sleeps
+
+
+def test_retry_after_header_is_honoured(stub, fresh_health, monkeypatch):
+    server, url, send = stub
+    monkeypatch.setattr(resilience, "RETRY_BASE_DELAY", 0.001)
+    server.script = [(0, 429, {"Retry-After": "2"}), (0, 200, {})]
+    resp = call_with_resilience("retry-after", url, send, hedge=False)
+    assert resp.status_code == 200
+    assert server.hits == 2
+    assert fresh_health == [2.0]
+
+
+def test_retry_after_forms():
+    date = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert retry_after_seconds(httpx.Response(429, headers={"Retry-After": "7"})) == 7.0
+    assert 25 <= retry_after_seconds(httpx.Response(429, headers={"Retry-After": date})) <= 30
+    assert retry_after_seconds(httpx.Response(429, headers={"Retry-After": "soon"})) is None
+    assert retry_after_seconds(httpx.Response(429)) is None
+
+
+def test_retry_after_is_capped(monkeypatch):
+    monkeypatch.setattr(resilience, "RETRY_MAX_DELAY", 5)
+    assert backoff_delay(0, httpx.Response(429, headers={"Retry-After": "600"})) == 5
+
+
+def test_full_jitter_backoff_limits(monkeypatch):
+    monkeypatch.setattr(resilience, "RETRY_BASE_DELAY", 0.5)
+    monkeypatch.setattr(resilience, "RETRY_MAX_DELAY", 3)
+    for attempt, ceiling in [(0, 0.5), (1, 1.0), (2, 2.0), (3, 3.0), (8, 3.0)]:
+        delays = [backoff_delay(attempt) for _ in range(500)]
+        assert all(0 <= d <= ceiling for d in delays)
+        # full jitter spreads over the whole range, not just near the ceiling
+        assert min(delays) < ceiling * 0.2 and max(delays) > ceiling * 0.8
+
+
+def test_retries_stop_after_max_attempts(stub, monkeypatch):
+    server, url, send = stub
+    monkeypatch.setattr(resilience, "RETRY_MAX_ATTEMPTS", 3)
+    server.script = [(0, 503, {})] * 5
+    resp = call_with_resilience("max-attempts", url, send, hedge=False)
+    assert resp.status_code == 503
+    assert server.hits == 3
+
+
+def test_hedge_wins_when_primary_is_slow(stub, monkeypatch):
+    server, url, send = stub
+    monkeypatch.setattr(resilience, "HEDGE_PERCENTILE", 95)
+    monkeypatch.setattr(resilience, "HEDGE_MIN_SAMPLES", 1)
+    monkeypatch.setattr(resilience, "HEDGE_MIN_DELAY", 0.05)
+    health = resilience.get_health("hedge")
+    health.latency.add(0.05)
+
+    server.script = [(1.0, 200, {}), (0, 200, {})]
+    start = time.monotonic()
+    resp = call_with_resilience("hedge", url, send)
+    assert resp.status_code == 200
+    assert time.monotonic() - start < 0.9
+    assert health.counters["hedges"] == 1
+    assert health.counters["hedge_wins"] == 1
+
+
+def test_breaker_open_half_open_closed():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.05)
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    trial = breaker.allow()
+    assert trial
+    assert not breaker.allow()          # one trial at a time
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.02)
+    breaker.record_failure()
+    time.sleep(0.03)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_trial_that_raises_frees_the_half_open_slot(stub):
+    server, url, send = stub
+    health = resilience.get_health("raises")
+    health.breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.02)
+    health.breaker.record_failure()
+    time.sleep(0.03)
+
+    def broken():
+        raise ValueError("bad payload")
+
+    with pytest.raises(ValueError):
+        call_with_resilience("raises", url, broken, hedge=False)
+    # the next request becomes the trial instead of being short-circuited forever
+    resp = call_with_resilience("raises", url, send, hedge=False)
+    assert resp.status_code == 200
+    assert health.breaker.state == "closed"
@@ -0,0 +1,299 @@
+import io
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import metrics
+
+# Whisper is CPU-bound, so each worker is a separate process with its own model.
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")
+TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Jobs waiting or running at once; further submissions are rejected with 503.
+TRANSCRIBE_QUEUE_DEPTH = int(os.getenv("TRANSCRIBE_QUEUE_DEPTH", "32"))
+# Finished jobs are kept this long (seconds) for the client to collect.
+TRANSCRIBE_JOB_TTL = int(os.getenv("TRANSCRIBE_JOB_TTL", "3600"))
+# Items accepted in one batch (end-of-day backlogs). Batches don't count against
+# TRANSCRIBE_QUEUE_DEPTH; at most TRANSCRIBE_WORKERS batch recordings sit in the
+# Whisper pool at once, so live uploads never queue behind a whole backlog.
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "200"))
+# Workers start from a fresh interpreter and load Whisper themselves; forking the
+# server would copy torch's thread pools and locks mid-use. "forkserver" also works.
+TRANSCRIBE_MP_START = os.getenv("TRANSCRIBE_MP_START", "spawn")
+
+
+# ---- worker process side ----------------------------------------------------
+_worker_model = None
+
+def _init_worker(model_name):
+    global _worker_model
+    import whisper
+    _worker_model = whisper.load_model(model_name)
+
+def _warm_worker():
+    return os.getpid()
+
+def _transcribe_in_worker(data):
+    # same path as /transcribe: piped ffmpeg decode, then silence trimming
+    from audio_decode import decode_upload
+    from silence_trim import prepare_for_whisper
+
+    audio, _ = prepare_for_whisper(decode_upload(io.BytesIO(data)))
+    return _worker_model.transcribe(audio)["text"]
+
+
+# ---- server side ------------------------------------------------------------
+class TranscriptionJobs:
+    """
+    Queue of transcription jobs.
+
+    Whisper runs in a pool of worker processes (model preloaded in each);
+    `postprocess(transcript, form)` then runs the agent pipeline on a thread.
+    Batches are groups of jobs fed to the Whisper pool a few at a time.
+    """
+
+    def __init__(self, postprocess, workers=TRANSCRIBE_WORKERS, queue_depth=TRANSCRIBE_QUEUE_DEPTH,
+                 model_name=WHISPER_MODEL, job_ttl=TRANSCRIBE_JOB_TTL, batch_max_items=BATCH_MAX_ITEMS):
+        self.postprocess = postprocess
+        self.queue_depth = queue_depth
+        self.job_ttl = job_ttl
+        self.batch_max_items = batch_max_items
+
+        self._jobs = {}
+        self._batches = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._active = 0
+
+        self._backlog = deque()          # (job_id, audio bytes) of batch recordings waiting for Whisper
+        self._backlog_slots = workers
+
+        self._procs = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context(TRANSCRIBE_MP_START),
+            initializer=_init_worker,
+            initargs=(model_name,),
+        )
+        self._post = ThreadPoolExecutor(max_workers=workers * 2, thread_name_prefix="transcribe-post")
+
+        # Start every worker now so the first doctor upload doesn't pay for model loading.
+        # Not from inside a worker: spawn re-runs the main script there (`python api_server.py`).
+        if multiprocessing.current_process().name == "MainProcess":
+            for _ in range(workers):
+                self._procs.submit(_warm_worker)
+
+    def submit(self, audio, form):
+        """
+        Reads the upload into memory (it is decoded in the worker) and queues it.
+        Returns the job id, or None when the queue is full.
+        """
+        with self._lock:
+            self._prune()
+            if self._active >= self.queue_depth:
+                return None
+            self._active += 1
+
+        job_id = None
+        try:
+            data = audio.read()
+            job_id = self._new_job(form)
+            self._start_transcription(job_id, data)
+        except Exception:
+            # give the slot back, or every failed submit would shrink the queue for good
+            with self._lock:
+                self._active -= 1
+                if job_id is not None:
+                    self._jobs.pop(job_id, None)
+            raise
+        return job_id
+
+    def submit_batch(self, items):
+        """
+        Queues a batch. Each item is {"audio": FileStorage} or {"transcript": str},
+        plus optional "form" and "name"; transcripts skip Whisper.
+        Returns the batch id, or None when the batch is empty or too large.
+        """
+        if not items or len(items) > self.batch_max_items:
+            return None
+
+        batch_id = uuid.uuid4().hex
+        job_ids, to_transcribe, to_process = [], [], []
+        for i, item in enumerate(items):
+            form = item.get("form") or {}
+            if item.get("audio") is not None:
+                name = item.get("name") or item["audio"].filename or f"item-{i}"
+                data = item["audio"].read()
+                job_id = self._new_job(form, batch_id=batch_id, index=i, name=name)
+                to_transcribe.append((job_id, data))
+            else:
+                transcript = item.get("transcript") or ""
+                job_id = self._new_job(form, batch_id=batch_id, index=i, name=item.get("name") or f"item-{i}",
+                                       status="processing", transcript=transcript)
+                to_process.append((job_id, transcript, form))
+            job_ids.append(job_id)
+
+        with self._lock:
+            self._prune()
+            self._batches[batch_id] = {"created": time.time(), "job_ids": job_ids}
+            self._backlog.extend(to_transcribe)
+
+        for job_id, transcript, form in to_process:
+            self._post.submit(self._run_postprocess, job_id, transcript, form)
+        self._pump()
+        return batch_id
+
+    def _new_job(self, form, batch_id=None, status="queued", **fields):
+        job_id = uuid.uuid4().hex
+        job = {"status": status, "created": time.time(), "form": dict(form), **fields}
+        if batch_id:
+            job["batch_id"] = batch_id
+        with self._lock:
+            self._jobs[job_id] = job
+        return job_id
+
+    def _start_transcription(self, job_id, data):
+        started = time.perf_counter()
+        fut = self._procs.submit(_transcribe_in_worker, data)
+        with self._lock:
+            self._jobs[job_id]["future"] = fut
+        fut.add_done_callback(lambda f: self._on_transcribed(job_id, f, started))
+
+    def _pump(self):
+        """Moves waiting batch recordings into free Whisper slots."""
+        with self._lock:
+            ready = []
+            while self._backlog and self._backlog_slots > 0:
+                ready.append(self._backlog.popleft())
+                self._backlog_slots -= 1
+        for job_id, data in ready:
+            self._start_transcription(job_id, data)
+
+    def _on_transcribed(self, job_id, fut, started):
+        # includes time waiting for a free worker
+        metrics.record_stage("whisper", time.perf_counter() - started, "job")
+        with self._lock:
+            from_batch = "batch_id" in self._jobs[job_id]
+            if from_batch:
+                self._backlog_slots += 1
+        if from_batch:
+            # not from this (executor) thread: submitting to the pool is done from a post thread
+            self._post.submit(self._pump)
+
+        try:
+            transcript = fut.result()
+        except Exception as e:
+            self._finish(job_id, error=f"Transcription failed: {e}")
+            return
+
+        with self._lock:
+            job = self._jobs[job_id]
+            job["status"] = "processing"
+            job["transcript"] = transcript
+        self._post.submit(self._run_postprocess, job_id, transcript, job["form"])
+
+    def _run_postprocess(self, job_id, transcript, form):
+        try:
+            result = self.postprocess(transcript, form)
+        except Exception as e:
+            self._finish(job_id, error=str(e))
+            return
+        self._finish(job_id, result=result)
+
+    def _finish(self, job_id, result=None, error=None):
+        with self._lock:
+            job = self._jobs[job_id]
+            job["status"] = "error" if error else "done"
+            job["finished"] = time.time()
+            if error:
+                job["error"] = error
+            else:
+                job["result"] = result
+            job.pop("future", None)
+            if "batch_id" not in job:
+                self._active -= 1
+            self._changed.notify_all()
+
+    def _prune(self):
+        """Drop finished jobs older than job_ttl, and batches with none left. Caller holds the lock."""
+        cutoff = time.time() - self.job_ttl
+        stale = [jid for jid, j in self._jobs.items() if j.get("finished", cutoff + 1) < cutoff]
+        for jid in stale:
+            del self._jobs[jid]
+        gone = [bid for bid, b in self._batches.items() if not any(j in self._jobs for j in b["job_ids"])]
+        for bid in gone:
+            del self._batches[bid]
+
+    def _view(self, job_id):
+        """Public view of a job. Caller holds the lock."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+
+        status = job["status"]
+        fut = job.get("future")
+        if status == "queued" and fut is not None and fut.running():
+            status = "transcribing"
+
+        out = {"job_id": job_id, "status": status}
+        for field in ("index", "name", "transcript", "result", "error"):
+            if field in job:
+                out[field] = job[field]
+        return out
+
+    def status(self, job_id):
+        with self._lock:
+            return self._view(job_id)
+
+    def batch_status(self, batch_id):
+        """
+        { batch_id, status: running|done, total, done, failed, pending, items: [job view] }
+        or None for an unknown batch.
+        """
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is None:
+                return None
+            items = [self._view(jid) or {"job_id": jid, "status": "expired"} for jid in batch["job_ids"]]
+
+        done = sum(1 for i in items if i["status"] == "done")
+        failed = sum(1 for i in items if i["status"] in ("error", "expired"))
+        pending = len(items) - done - failed
+        return {
+            "batch_id": batch_id,
+            "status": "running" if pending else "done",
+            "total": len(items),
+            "done": done,
+            "failed": failed,
+            "pending": pending,
+            "items": items,
+        }
+
+    def iter_batch(self, batch_id, poll=30):
+        """
+        Yields each finished item of a batch (job view) in completion order,
+        blocking until the next one finishes. Ends once every item was yielded.
+        """
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            job_ids = list(batch["job_ids"]) if batch else []
+
+        remaining = set(job_ids)
+        while remaining:
+            with self._changed:
+                # a job that was already pruned counts as finished (reported as expired)
+                ready = [jid for jid in job_ids if jid in remaining
+                         and (jid not in self._jobs or "finished" in self._jobs[jid])]
+                if not ready:
+                    self._changed.wait(timeout=poll)
+                    continue
+                views = [self._view(jid) or {"job_id": jid, "status": "expired"} for jid in ready]
+            for jid, view in zip(ready, views):
+                remaining.discard(jid)
+                yield view
+
+    def shutdown(self):
+        self._procs.shutdown(wait=False, cancel_futures=True)
+        self._post.shutdown(wait=False)
@@ -0,0 +1,145 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+
+from visit_repository import EXPORT_COLUMNS
+
+# Rows fetched per database round trip, and per Parquet row group
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+
+EXPORT_FORMATS = ("ndjson", "parquet")
+EXPORT_MIMETYPES = {"ndjson": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+
+
+def date_range(since=None, until=None):
+    """
+    "YYYY-MM-DD" bounds (both inclusive, either may be empty) -> the
+    (since, until) ISO timestamps repository.export_visits takes, with until
+    moved to the start of the next day. ValueError if a date is malformed.
+    """
+    start = datetime.datetime.strptime(since, "%Y-%m-%d") if since else None
+    end = datetime.datetime.strptime(until, "%Y-%m-%d") + datetime.timedelta(days=1) if until else None
+    return (start.isoformat() if start else None), (end.isoformat() if end else None)
+
+
+def ndjson_chunks(batches):
+    """One JSON object per line; yields one bytes chunk per batch."""
+    for rows in batches:
+        yield "".join(json.dumps(row, ensure_ascii=False, default=str) + "\n" for row in rows).encode("utf-8")
+
+
+# Parquet needs the optional `pyarrow` package (pip install pyarrow)
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        print("Parquet export needs `pyarrow` (pip install pyarrow); only ndjson is available")
+        return False
+
+
+def _parquet_schema():
+    import pyarrow as pa
+
+    types = {
+        "id": pa.int64(), "doctor_id": pa.int64(), "patient_id": pa.int64(),
+        "visit_date": pa.timestamp("us"),
+        "height_in": pa.int32(), "weight_lb": pa.int32(), "systolic": pa.int32(), "diastolic": pa.int32(),
+        "BMI": pa.float64(),
+    }
+    return pa.schema([(name, types.get(name, pa.string())) for name in EXPORT_COLUMNS])
+
+
+def _parquet_value(name, value):
+    if value is None:
+        return None
+    if name == "visit_date":
+        # ISO text from either backend; stored without a zone like the column itself
+        return datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00")).replace(tzinfo=None)
+    if name == "BMI":
+        return float(value)
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+class _Chunks:
+    """Write-only file for pyarrow: collects what the writer emits so it can be yielded."""
+
+    def __init__(self):
+        self.parts = []
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        out = b"".join(self.parts)
+        self.parts = []
+        return out
+
+
+def parquet_chunks(batches):
+    """
+    A Parquet file, one row group per batch, yielded as bytes while it is
+    written: nothing larger than one batch is kept in memory.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema()
+    sink = _Chunks()
+    with pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd") as writer:
+        for rows in batches:
+            columns = {name: [_parquet_value(name, row.get(name)) for row in rows] for name in EXPORT_COLUMNS}
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            yield sink.drain()
+    yield sink.drain()  # footer
+
+
+def export_chunks(repository, fmt="ndjson", since=None, until=None, doctor_id=None, batch_size=EXPORT_BATCH_SIZE):
+    """Bytes of the export file, produced batch by batch (see the /export/visits endpoint)."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    batches = repository.export_visits(since, until, doctor_id, batch_size)
+    return parquet_chunks(batches) if fmt == "parquet" else ndjson_chunks(batches)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export visits to NDJSON or Parquet, streaming in batches.")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+    parser.add_argument("--from", dest="since", help="first visit date, YYYY-MM-DD (inclusive)")
+    parser.add_argument("--to", dest="until", help="last visit date, YYYY-MM-DD (inclusive)")
+    parser.add_argument("--doctor", type=int, help="only this doctor_id's visits")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    parser.add_argument("-o", "--output", help="file to write (default: stdout)")
+    args = parser.parse_args()
+
+    if args.format == "parquet" and not parquet_available():
+        sys.exit(1)
+    try:
+        since, until = date_range(args.since, args.until)
+    except ValueError:
+        parser.error("dates must be YYYY-MM-DD")
+
+    from supa_client import supabase, supabase_admin
+    from visit_repository import create_repository
+
+    repository = create_repository(supabase, supabase_admin)
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in export_chunks(repository, args.format, since, until, args.doctor, args.batch_size):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
@@ -0,0 +1,379 @@
+import datetime
+import decimal
+import json
+import os
+import re
+import threading
+
+import metrics
+
+# Postgres connection pool bounds, and how long a request waits for a free connection
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+# Columns of a visit row written by /save_visit (the prepared INSERT binds all of them)
+VISIT_INSERT_COLUMNS = (
+    "doctor_id", "patient_id", "transcription", "allergies", "symptoms", "diagnosis",
+    "medications", "current medications", "instructions", "additional notes", "name of visit",
+    "height_in", "weight_lb", "BMI", "systolic", "diastolic",
+)
+
+# Columns of a bulk export row (visit_export.py), in file order
+EXPORT_COLUMNS = ("id", "visit_date") + VISIT_INSERT_COLUMNS
+
+# Every column of the visits table (models.py); the only names ?fields= may ask for
+VISIT_COLUMNS = frozenset(EXPORT_COLUMNS + ("summary", "transcript", "audio_url"))
+
+
+def _quote_column(name):
+    # column names with spaces ("name of visit") have to be quoted
+    return name if re.fullmatch(r"\w+", name) else '"' + name.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _pg_column(name):
+    # raw SQL also folds unquoted capitals ("BMI")
+    return name if re.fullmatch(r"[a-z_][a-z0-9_]*", name) else '"' + name.replace('"', '""') + '"'
+
+
+def _with_cursor_columns(columns):
+    """
+    Projection for a history page; visit_date and id are always kept for the
+    cursor. ValueError for anything that is not a visits column.
+    """
+    columns = list(columns)
+    if "*" in columns:
+        return ["*"]
+    unknown = [c for c in columns if c not in VISIT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown visit field(s): {', '.join(unknown)}")
+    for required in ("visit_date", "id"):
+        if required not in columns:
+            columns.insert(0, required)
+    return columns
+
+
+class SupabaseRepository:
+    """Hot patient/visit queries through the Supabase REST (PostgREST) clients."""
+
+    name = "supabase"
+
+    def __init__(self, client, admin_client):
+        self.client = client            # anon key: the calls /save_visit always made
+        self.admin = admin_client       # service key: visit reads
+
+    def find_patient_id(self, email, birthday):
+        with metrics.timed(self.name, "patients_select"):
+            result = (
+                self.client.table("patients")
+                .select("id")
+                .ilike("email", email)
+                .eq("birthday", birthday)
+                .limit(1)
+                .execute()
+            )
+        return result.data[0]["id"] if result.data else None
+
+    def insert_visit(self, visit_data):
+        """Inserts a visit (None values left out); returns its id or None."""
+        row = {k: v for k, v in visit_data.items() if v is not None}
+        with metrics.timed(self.name, "visits_insert"):
+            result = self.client.table("visits").insert(row).execute()
+        return result.data[0]["id"] if result.data else None
+
+    def update_visit(self, visit_id, changes):
+        """Sets `changes` ({column: value}) on a visit; False if there is no such visit."""
+        with metrics.timed(self.name, "visits_update"):
+            result = self.admin.table("visits").update(changes).eq("id", visit_id).execute()
+        return bool(result.data)
+
+    def visit_history(self, patient_id, columns, after=None, limit=20):
+        """
+        One page of a patient's visits, newest first. `after` is the
+        (visit_date, id) of the previous page's last row; returns up to `limit` rows.
+        """
+        select = ",".join(map(_quote_column, _with_cursor_columns(columns)))
+        query = self.admin.table("visits").select(select).eq("patient_id", patient_id)
+        if after:
+            # both go into the filter string as text, so they must be exactly a timestamp and an int
+            visit_date, visit_id = datetime.datetime.fromisoformat(str(after[0])).isoformat(), int(after[1])
+            query = query.or_(f'visit_date.lt."{visit_date}",and(visit_date.eq."{visit_date}",id.lt.{visit_id})')
+        query = query.order("visit_date", desc=True).order("id", desc=True).limit(limit)
+        with metrics.timed(self.name, "visits_select"):
+            return query.execute().data
+
+    def get_visit(self, visit_id, columns=("*",)):
+        """A visit (`columns`, plus visit_date and id) with doctor_name / patient_name, or None."""
+        select = ",".join(map(_quote_column, _with_cursor_columns(columns)))
+        with metrics.timed(self.name, "visit_select"):
+            res = self.admin.table("visits").select(select).eq("id", visit_id).limit(1).execute()
+        if not res.data:
+            return None
+        visit = res.data[0]
+
+        for table, key, out in (("doctors", "doctor_id", "doctor_name"), ("patients", "patient_id", "patient_name")):
+            if visit.get(key) is None:
+                continue
+            with metrics.timed(self.name, f"{table}_select"):
+                person = self.admin.table(table).select("name").eq("id", visit[key]).limit(1).execute()
+            if person.data:
+                visit[out] = person.data[0].get("name")
+        return visit
+
+    def export_visits(self, since=None, until=None, doctor_id=None, batch_size=1000):
+        """
+        Every visit with since <= visit_date < until (ISO strings, either may be
+        None), optionally for one doctor, oldest first. Yields lists of up to
+        `batch_size` rows; pages are keyset-filtered on (visit_date, id), so only
+        one page is ever held in memory.
+        """
+        select = ",".join(map(_quote_column, EXPORT_COLUMNS))
+        after = None
+        while True:
+            query = self.admin.table("visits").select(select)
+            if since:
+                query = query.gte("visit_date", since)
+            if until:
+                query = query.lt("visit_date", until)
+            if doctor_id is not None:
+                query = query.eq("doctor_id", doctor_id)
+            if after:
+                visit_date, visit_id = after
+                query = query.or_(f'visit_date.gt."{visit_date}",and(visit_date.eq."{visit_date}",id.gt.{visit_id})')
+            query = query.order("visit_date").order("id").limit(batch_size)
+            with metrics.timed(self.name, "visits_export"):
+                rows = query.execute().data
+            if rows:
+                yield rows
+            if len(rows) < batch_size:
+                return
+            after = rows[-1]["visit_date"], rows[-1]["id"]
+
+
+# ---- direct Postgres -----------------------------------------------------------
+# Statements PREPAREd once per pooled connection; EXECUTE skips parsing and planning.
+_VISIT_LIST_SELECT = 'id, visit_date, "name of visit", doctor_id, patient_id'
+
+PREPARED_STATEMENTS = {
+    "find_patient": (
+        "(text, date)",
+        "SELECT id FROM patients WHERE lower(email) = lower($1) AND birthday = $2 LIMIT 1",
+    ),
+    "insert_visit": (
+        "(" + ", ".join(["int", "int"] + ["text"] * 9 + ["int", "int", "numeric", "int", "int"]) + ")",
+        "INSERT INTO visits (" + ", ".join(map(_pg_column, VISIT_INSERT_COLUMNS)) + ") VALUES ("
+        + ", ".join(f"${i}" for i in range(1, len(VISIT_INSERT_COLUMNS) + 1)) + ") RETURNING id",
+    ),
+    "visit_history_first": (
+        "(int, int)",
+        f"SELECT {_VISIT_LIST_SELECT} FROM visits WHERE patient_id = $1 "
+        "ORDER BY visit_date DESC, id DESC LIMIT $2",
+    ),
+    "visit_history_after": (
+        "(int, timestamp, int, int)",
+        f"SELECT {_VISIT_LIST_SELECT} FROM visits WHERE patient_id = $1 AND (visit_date, id) < ($2, $3) "
+        "ORDER BY visit_date DESC, id DESC LIMIT $4",
+    ),
+    "visit_detail": (
+        "(int)",
+        "SELECT v.*, d.name AS doctor_name, p.name AS patient_name FROM visits v "
+        "LEFT JOIN doctors d ON d.id = v.doctor_id LEFT JOIN patients p ON p.id = v.patient_id "
+        "WHERE v.id = $1",
+    ),
+}
+
+
+def _json_value(value):
+    # same shapes PostgREST returns: ISO timestamps, plain numbers
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return value
+
+
+class PostgresRepository:
+    """
+    The same queries over a bounded psycopg2 pool. Callers beyond DB_POOL_MAX
+    wait up to DB_POOL_TIMEOUT seconds for a connection instead of failing.
+    """
+
+    name = "postgres"
+
+    def __init__(self, connect_kwargs, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT):
+        import psycopg2.extensions
+        from psycopg2.pool import ThreadedConnectionPool
+
+        class _Connection(psycopg2.extensions.connection):
+            prepared = False
+
+        self._pool = ThreadedConnectionPool(minconn, maxconn, connection_factory=_Connection, **connect_kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._timeout = timeout
+
+    def close(self):
+        self._pool.closeall()
+
+    def _borrow(self):
+        if not self._slots.acquire(timeout=self._timeout):
+            raise TimeoutError(f"No database connection free after {self._timeout}s")
+        try:
+            return self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _give_back(self, conn):
+        self._pool.putconn(conn, close=bool(conn.closed))
+        self._slots.release()
+
+    def _run(self, fn):
+        """fn(cursor) on a pooled connection, committed; the connection is dropped if it broke."""
+        conn = self._borrow()
+        try:
+            if not conn.prepared:
+                with conn.cursor() as cur:
+                    for statement, (types, sql) in PREPARED_STATEMENTS.items():
+                        cur.execute(f"PREPARE {statement} {types} AS {sql}")
+                conn.prepared = True
+            with conn.cursor() as cur:
+                result = fn(cur)
+            conn.commit()
+            return result
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self._give_back(conn)
+
+    @staticmethod
+    def _rows(cur):
+        names = [d.name for d in cur.description]
+        return [{n: _json_value(v) for n, v in zip(names, row)} for row in cur.fetchall()]
+
+    def find_patient_id(self, email, birthday):
+        def query(cur):
+            cur.execute("EXECUTE find_patient (%s, %s)", (email, birthday))
+            row = cur.fetchone()
+            return row[0] if row else None
+        with metrics.timed(self.name, "patients_select"):
+            return self._run(query)
+
+    def insert_visit(self, visit_data):
+        # lists/objects go into the text columns as JSON, as PostgREST stores them
+        values = tuple(json.dumps(v) if isinstance(v, (list, dict)) else v
+                       for v in (visit_data.get(c) for c in VISIT_INSERT_COLUMNS))
+
+        def query(cur):
+            cur.execute("EXECUTE insert_visit (" + ", ".join(["%s"] * len(values)) + ")", values)
+            return cur.fetchone()[0]
+        with metrics.timed(self.name, "visits_insert"):
+            return self._run(query)
+
+    def update_visit(self, visit_id, changes):
+        from psycopg2 import sql
+
+        columns = list(changes)
+        values = tuple(json.dumps(v) if isinstance(v, (list, dict)) else v for v in changes.values())
+        statement = sql.SQL("UPDATE visits SET {} WHERE id = %s RETURNING id").format(
+            sql.SQL(", ").join(sql.SQL("{} = %s").format(sql.Identifier(c)) for c in columns))
+
+        def query(cur):
+            cur.execute(statement, (*values, visit_id))
+            return cur.fetchone() is not None
+        with metrics.timed(self.name, "visits_update"):
+            return self._run(query)
+
+    def visit_history(self, patient_id, columns, after=None, limit=20):
+        from psycopg2 import sql
+
+        columns = _with_cursor_columns(columns)
+        if set(columns) == {"id", "visit_date", "name of visit", "doctor_id", "patient_id"}:
+            # the list view's projection: prepared
+            def query(cur):
+                if after:
+                    cur.execute("EXECUTE visit_history_after (%s, %s, %s, %s)", (patient_id, after[0], after[1], limit))
+                else:
+                    cur.execute("EXECUTE visit_history_first (%s, %s)", (patient_id, limit))
+                return self._rows(cur)
+        else:
+            select = sql.SQL("*") if columns == ["*"] else sql.SQL(", ").join(map(sql.Identifier, columns))
+            where = sql.SQL("patient_id = %s AND (visit_date, id) < (%s, %s)" if after else "patient_id = %s")
+            statement = sql.SQL("SELECT {} FROM visits WHERE {} ORDER BY visit_date DESC, id DESC LIMIT %s").format(
+                select, where)
+            params = (patient_id, *after, limit) if after else (patient_id, limit)
+
+            def query(cur):
+                cur.execute(statement, params)
+                return self._rows(cur)
+        with metrics.timed(self.name, "visits_select"):
+            return self._run(query)
+
+    def export_visits(self, since=None, until=None, doctor_id=None, batch_size=1000):
+        """
+        Same contract as SupabaseRepository.export_visits, read through one
+        server-side (named) cursor: Postgres keeps the result set and sends
+        `batch_size` rows per round trip. Holds a pooled connection until the
+        generator is exhausted or closed.
+        """
+        from psycopg2 import sql
+
+        where, params = [], []
+        for clause, value in (("visit_date >= %s", since), ("visit_date < %s", until), ("doctor_id = %s", doctor_id)):
+            if value is not None and value != "":
+                where.append(sql.SQL(clause))
+                params.append(value)
+        statement = sql.SQL("SELECT {} FROM visits{} ORDER BY visit_date, id").format(
+            sql.SQL(", ").join(map(sql.Identifier, EXPORT_COLUMNS)),
+            sql.SQL(" WHERE ") + sql.SQL(" AND ").join(where) if where else sql.SQL(""),
+        )
+
+        conn = self._borrow()
+        try:
+            # named cursors only live inside a transaction; it is rolled back at the end
+            with conn.cursor(name=f"visit_export_{id(conn)}") as cur:
+                cur.itersize = batch_size
+                with metrics.timed(self.name, "visits_export"):
+                    cur.execute(statement, params)
+                names = None
+                while True:
+                    with metrics.timed(self.name, "visits_export"):
+                        rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    names = names or [d.name for d in cur.description]
+                    yield [{n: _json_value(v) for n, v in zip(names, row)} for row in rows]
+        finally:
+            if not conn.closed:
+                conn.rollback()
+            self._give_back(conn)
+
+    def get_visit(self, visit_id, columns=("*",)):
+        def query(cur):
+            cur.execute("EXECUTE visit_detail (%s)", (visit_id,))
+            rows = self._rows(cur)
+            return rows[0] if rows else None
+        with metrics.timed(self.name, "visit_select"):
+            visit = self._run(query)
+        columns = _with_cursor_columns(columns)
+        if visit is None or columns == ["*"]:
+            return visit
+        keep = set(columns) | {"doctor_name", "patient_name"}
+        return {k: v for k, v in visit.items() if k in keep}
+
+
+def create_repository(supabase_client, supabase_admin, backend=None):
+    """
+    Repository for DB_BACKEND: "supabase" (PostgREST over HTTP, the default)
+    or "postgres" (pooled connections straight to the database; see
+    connections.connection_kwargs for DATABASE_URL / DB_*). Read at call time,
+    after the app has loaded its .env.
+    """
+    backend = (backend or os.getenv("DB_BACKEND", "supabase")).strip().lower()
+    if backend == "postgres":
+        from connections import connection_kwargs
+        return PostgresRepository(connection_kwargs())
+    if backend != "supabase":
+        print(f"Unknown DB_BACKEND={backend!r}; using supabase")
+    return SupabaseRepository(supabase_client, supabase_admin)
@@ -0,0 +1,152 @@
+import os
+import re
+import threading
+
+import numpy as np
+from cachetools import LRUCache
+
+from visit_store import content_hash
+
+# Per-visit BM25 index over transcript chunks, so /qa only sends the parts of
+# a long transcript relevant to the question. The structured summary
+# (allergies, medications, diagnosis, ...) is short and always sent whole.
+RETRIEVAL_TOP_K = int(os.getenv("QA_RETRIEVAL_TOP_K", "5"))
+# Transcripts shorter than this (characters) go out whole
+RETRIEVAL_MIN_CHARS = int(os.getenv("QA_RETRIEVAL_MIN_CHARS", "4000"))
+# Transcript chunking: words per passage, and words shared with the previous one
+CHUNK_WORDS = int(os.getenv("QA_RETRIEVAL_CHUNK_WORDS", "80"))
+CHUNK_OVERLAP = int(os.getenv("QA_RETRIEVAL_CHUNK_OVERLAP", "20"))
+# Built indexes kept in memory (one per visit id + content), bounded by count
+# and by the approximate bytes of their term-weight matrices and text
+INDEX_CACHE_SIZE = int(os.getenv("QA_RETRIEVAL_CACHE_SIZE", "256"))
+INDEX_CACHE_BYTES = int(float(os.getenv("QA_RETRIEVAL_CACHE_MB", "64")) * 1024 * 1024)
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from had has have he her his how i if in is it its
+me my of on or our she so that the their them then there they this to was we were what when where
+which who why will with you your yeah okay ok um uh just like
+""".split())
+
+
+def tokenize(text):
+    return [t for t in re.findall(r"[a-z0-9]+", str(text or "").lower()) if t not in _STOPWORDS]
+
+
+def chunk_transcript(transcript, size=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    """Overlapping word windows; returns [(start_word, text)]."""
+    words = str(transcript or "").split()
+    if not words:
+        return []
+    step = max(size - overlap, 1)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append((start, " ".join(words[start:start + size])))
+        if start + size >= len(words):
+            break
+    return chunks
+
+
+class VisitIndex:
+    """
+    BM25 over one visit's transcript chunks. The term weights are computed
+    once at build time, so a question costs a column sum over the terms it
+    contains.
+    """
+
+    def __init__(self, context):
+        self.words = str(context.get("transcript") or "").split()
+        # (start_word, text)
+        self.passages = chunk_transcript(context.get("transcript"))
+
+        docs = [tokenize(text) for _, text in self.passages]
+        self.vocab = {}
+        for doc in docs:
+            for term in doc:
+                self.vocab.setdefault(term, len(self.vocab))
+
+        tf = np.zeros((len(docs), len(self.vocab)), dtype=np.float32)
+        for i, doc in enumerate(docs):
+            for term in doc:
+                tf[i, self.vocab[term]] += 1
+
+        lengths = tf.sum(axis=1, keepdims=True)
+        avg = float(lengths.mean()) if len(docs) else 0.0
+        df = (tf > 0).sum(axis=0)
+        idf = np.log1p((len(docs) - df + 0.5) / (df + 0.5)).astype(np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / (avg or 1.0))
+        self.weights = idf * tf * (BM25_K1 + 1) / (tf + norm)
+        # what this index holds on to, for the cache's memory bound
+        self.nbytes = (self.weights.nbytes + sum(len(w) for w in self.words)
+                       + sum(len(text) for _, text in self.passages) + 64 * len(self.vocab))
+
+    def __len__(self):
+        return len(self.passages)
+
+    def scores(self, question):
+        cols = [self.vocab[t] for t in tokenize(question) if t in self.vocab]
+        if not cols:
+            return np.zeros(len(self.passages), dtype=np.float32)
+        return self.weights[:, cols].sum(axis=1)
+
+    def top(self, question, k=RETRIEVAL_TOP_K):
+        """Indexes of the k best-matching passages (score > 0), best first."""
+        scores = self.scores(question)
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [int(i) for i in best if scores[i] > 0]
+
+    def transcript_excerpt(self, picked):
+        """Picked transcript chunks in spoken order; overlapping neighbours are merged, gaps marked with "…"."""
+        spans = sorted((self.passages[i][0], self.passages[i][0] + CHUNK_WORDS) for i in picked)
+        merged = []
+        for start, end in spans:
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return " … ".join(" ".join(self.words[a:b]) for a, b in merged)
+
+
+_indexes = LRUCache(maxsize=INDEX_CACHE_BYTES, getsizeof=lambda index: index.nbytes)
+_indexes_lock = threading.Lock()
+
+
+def get_index(context, visit_id=None):
+    """Index for a visit, built on first use. Keyed on the content too, so an edited visit is re-indexed."""
+    key = (str(visit_id or ""), content_hash(context))
+    with _indexes_lock:
+        index = _indexes.get(key)
+    if index is None:
+        index = VisitIndex(context)
+        if index.nbytes <= INDEX_CACHE_BYTES:   # larger ones are used once, not cached
+            with _indexes_lock:
+                _indexes[key] = index
+                while len(_indexes) > INDEX_CACHE_SIZE:
+                    _indexes.popitem()
+    return index
+
+
+def qa_context(question, context, visit_id=None, k=RETRIEVAL_TOP_K):
+    """
+    The part of `context` ({"transcript", "summary"}) worth sending with
+    `question`, in the same shape: the whole summary, and the top-k
+    transcript chunks rejoined in spoken order. Short transcripts, and
+    questions that match none of the chunks, get the full context.
+    """
+    if not isinstance(context, dict) or len(str(context.get("transcript") or "")) < RETRIEVAL_MIN_CHARS:
+        return context
+
+    index = get_index(context, visit_id)
+    if len(index) <= k:
+        return context
+    picked = index.top(question, k)
+    if not picked:
+        return context
+
+    return {**context, "transcript": index.transcript_excerpt(picked)}
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Local SQLite file holding agent outputs (translations / simplifications) per visit.
+# A relative path is taken from this directory, not from wherever the server was started.
+VISIT_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.getenv("VISIT_STORE_PATH", "visit_store.sqlite3"))
+# Fallback results (the agent failed: a glossary-annotated or untranslated visit) are
+# served for this many seconds, then the agent is tried again
+VISIT_STORE_FALLBACK_TTL = int(os.getenv("VISIT_STORE_FALLBACK_TTL", "300"))
+
+CREATE_VISIT_OUTPUTS_TABLE = """
+CREATE TABLE IF NOT EXISTS visit_outputs(
+visit_id TEXT NOT NULL,
+lang TEXT NOT NULL,
+mode TEXT NOT NULL,
+content_hash TEXT NOT NULL,
+result TEXT NOT NULL,
+created_at REAL NOT NULL,
+expires_at REAL,
+PRIMARY KEY (visit_id, lang, mode, content_hash)
+);
+"""
+
+
+def content_hash(payload):
+    """Stable hash of the visit content an output was produced from."""
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class VisitStore:
+    """
+    Persistent cache of per-visit agent outputs keyed by
+    (visit id, language, mode, content hash).
+
+    The content hash means an edited visit never matches an old output;
+    invalidate() additionally deletes everything stored for the visit.
+    Outputs put() with a ttl are only returned until they expire.
+    """
+
+    def __init__(self, path=VISIT_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(CREATE_VISIT_OUTPUTS_TABLE)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(visit_outputs)")}
+            if "expires_at" not in columns:  # a store file from before expiring outputs
+                conn.execute("ALTER TABLE visit_outputs ADD COLUMN expires_at REAL")
+
+    def _conn(self):
+        # sqlite3 connections can't be shared across threads; one per Flask worker thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, visit_id, lang, mode, chash):
+        row = self._conn().execute(
+            "SELECT result FROM visit_outputs WHERE visit_id=? AND lang=? AND mode=? AND content_hash=? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (str(visit_id), lang, mode, chash, time.time()),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, visit_id, lang, mode, chash, result, ttl=None):
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO visit_outputs "
+                "(visit_id, lang, mode, content_hash, result, created_at, expires_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (str(visit_id), lang, mode, chash, json.dumps(result, ensure_ascii=False), now,
+                 now + ttl if ttl is not None else None),
+            )
+
+    def invalidate(self, visit_id):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM visit_outputs WHERE visit_id=?", (str(visit_id),))
@@ -1,51 +1,44 @@
-import requests
 import os
 import json
 from dotenv import load_dotenv
 import re
+import metrics
+from watsonx_client import get_token_provider, post_agent, stream_agent
+from glossary import glossary_prepass, glossary_fallback
+from stage_executor import Stage, iter_stages, run_stages
 
 load_dotenv()
 
-def get_access_token(api_key):
-    response = requests.post(
-        "https://iam.cloud.ibm.com/identity/token",
-        data={
-            "grant_type": "urn:ibm:params:oauth:grant-type:apikey",
-            "apikey": api_key
-        },
-        headers={"Content-Type": "application/x-www-form-urlencoded"}
-    )
+# Agent calls go through watsonx_client.post_agent, which serves byte-identical
+# requests from an in-memory LRU+TTL cache. Pass use_cache=False for a fresh answer.
 
-    return response.json().get("access_token")
+def get_access_token(api_key):
+    """
+    Returns a cached IAM token for `api_key` (shared across the process),
+    or None if IAM could not issue one.
+    """
+    try:
+        return get_token_provider(api_key).token()
+    except Exception as e:
+        print("IAM auth failed:", repr(e))
+        metrics.FALLBACKS.inc(agent="iam", reason="auth_failed")
+        return None
 
-def summarize_transcript(transcript):
+def summarize_transcript(transcript, use_cache=True):
     API_KEY = os.getenv("WATSONX_API_KEY")
-    ENDPOINT = "https://us-south.ml.cloud.ibm.com"
     DEPLOYMENT_ID = os.getenv("SUMMARIZE_DEPLOYMENT_ID")
-    VERSION = "2021-05-01"
 
-    # 1) Get IAM token
-    token_resp = requests.post(
-        "https://iam.cloud.ibm.com/identity/token",
-        data={
-            "grant_type": "urn:ibm:params:oauth:grant-type:apikey",
-            "apikey": API_KEY
-        },
-        headers={"Content-Type": "application/x-www-form-urlencoded"}
-    )
-    token_resp.raise_for_status()
-    token = token_resp.json()["access_token"]
+    # 1) Get IAM token (cached process-wide; raises if IAM is unreachable)
+    token = get_token_provider(API_KEY).token()
 
     # 2) Call the agent
-    url = f"{ENDPOINT}/ml/v4/deployments/{DEPLOYMENT_ID}/ai_service?version={VERSION}"
     payload = {"messages": [{"role": "user", "content": transcript}]}
 
-    resp = requests.post(
-        url,
-        headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
-        json=payload,
-        timeout=90,
-    )
+    resp = post_agent(DEPLOYMENT_ID, payload, token, timeout=90, use_cache=use_cache)
+    return _summary_result(resp)
+
+
+def _summary_result(resp):
     resp.raise_for_status()
     data = resp.json()
 
@@ -56,50 +49,53 @@ def summarize_transcript(transcript):
         return json.loads(content_str)
     except Exception as e:
         print("Failed to parse agent content:", e)
+        metrics.FALLBACKS.inc(agent="summarize", reason="parse_error")
         return {"raw_output": data}
 
 
-def simplify_summary(transcript):
+def simplify_summary(transcript, use_cache=True):
     """
     Calls the EchoVisit_Simplification_Agent and returns the simplified plain‑language text.
     `text` can be the raw transcript or the JSON summary string—whatever you trained the agent for.
     """
     API_KEY = os.getenv("WATSONX_API_KEY")
-    ENDPOINT = "https://us-south.ml.cloud.ibm.com"
     DEPLOYMENT_ID = os.getenv("SIMPLIFY_DEPLOYMENT_ID")
-    VERSION = "2021-05-01"
 
     # 1) Get IAM token
-    token_resp = requests.post(
-        "https://iam.cloud.ibm.com/identity/token",
-        data={
-            "grant_type": "urn:ibm:params:oauth:grant-type:apikey",
-            "apikey": API_KEY
-        },
-        headers={"Content-Type": "application/x-www-form-urlencoded"},
-        timeout=30,
-    )
-    if token_resp.status_code != 200:
-        print("IAM auth failed:", token_resp.status_code, token_resp.text)
+    token = get_access_token(API_KEY)
+    if not token:
         return "Could not authenticate"
-    token = token_resp.json()["access_token"]
 
     # 2) Call the agent (non‑streaming endpoint)
-    url = f"{ENDPOINT}/ml/v4/deployments/{DEPLOYMENT_ID}/ai_service?version={VERSION}"
     payload = {"messages": [{"role": "user", "content": transcript}]}
-    resp = requests.post(
-        url,
-        headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
-        json=payload,
-        timeout=90,
-    )
+    resp = post_agent(DEPLOYMENT_ID, payload, token, timeout=90, use_cache=use_cache)
+    return _simplify_result(resp)
+
 
+# What simplify_summary() returns when it has no simplification
+SIMPLIFY_FAILED = ("Could not authenticate", "Could not simplify summary")
+
+
+def simplify_transcript(transcript, use_cache=True):
+    """
+    Glossary pre-pass, then the Simplification agent. If the agent is
+    unavailable the glossary-annotated transcript is returned instead.
+    """
+    simplified = simplify_summary(glossary_prepass(transcript), use_cache=use_cache)
+    if simplified in SIMPLIFY_FAILED:
+        metrics.FALLBACKS.inc(agent="simplify", reason="glossary")
+        return glossary_fallback(transcript)
+    return simplified
+
+
+def _simplify_result(resp):
     if resp.status_code != 200:
         print("Simplification agent call failed:", resp.status_code)
         try:
             print("Response JSON:", resp.json())
         except Exception:
             print("Response text:", resp.text)
+        metrics.FALLBACKS.inc(agent="simplify", reason="http_error")
         return "Could not simplify summary"
 
     # 3) Extract the assistant’s content from the choices structure
@@ -115,40 +111,33 @@ def simplify_summary(transcript):
     except Exception as e:
         print("Failed to extract simplification content:", e)
         print("Raw response:", resp.text[:2000])
+        metrics.FALLBACKS.inc(agent="simplify", reason="parse_error")
         return "Could not simplify summary"
 
 
 
-def translation_summary(text, target_lang="spanish"):
+def translation_summary(text, target_lang="spanish", use_cache=True):
     """
     Calls the EchoVisit_Translation_Agent to translate the simplified text.
     `text` should be the output from simplify_summary().
     """
     API_KEY = os.getenv("WATSONX_API_KEY")
-    ENDPOINT = "https://us-south.ml.cloud.ibm.com"
-    # <- from your screenshot
     DEPLOYMENT_ID = os.getenv("TRANSLATION_DEPLOYMENT_ID")
-    VERSION = "2021-05-01"
 
     # 1) IAM token
-    tok = requests.post(
-        "https://iam.cloud.ibm.com/identity/token",
-        data={
-            "grant_type": "urn:ibm:params:oauth:grant-type:apikey",
-            "apikey": API_KEY,
-        },
-        headers={"Content-Type": "application/x-www-form-urlencoded"},
-        timeout=30,
-    )
-    if tok.status_code != 200:
-        print("IAM auth failed:", tok.status_code, tok.text)
+    token = get_access_token(API_KEY)
+    if not token:
         return "Authentication failed"
-    token = tok.json()["access_token"]
 
     # 2) Call the translation agent (non‑streaming)
-    url = f"{ENDPOINT}/ml/v4/deployments/{DEPLOYMENT_ID}/ai_service?version={VERSION}"
+    payload = _translation_payload(text, target_lang)
+    resp = post_agent(DEPLOYMENT_ID, payload, token, timeout=90, use_cache=use_cache)
+    return _translation_result(resp)
+
+
+def _translation_payload(text, target_lang):
     # Keep the instruction light; your agent already knows how to translate.
-    payload = {
+    return {
         "messages": [
             {
                 "role": "user",
@@ -160,19 +149,16 @@ def translation_summary(text, target_lang="spanish"):
             }
         ]
     }
-    resp = requests.post(
-        url,
-        headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
-        json=payload,
-        timeout=90,
-    )
 
+
+def _translation_result(resp):
     if resp.status_code != 200:
         print("Translation agent call failed:", resp.status_code)
         try:
             print("Response JSON:", resp.json())
         except Exception:
             print("Response text:", resp.text)
+        metrics.FALLBACKS.inc(agent="translation", reason="http_error")
         return "Watsonx failed to translate"
 
     # 3) Extract assistant content
@@ -188,42 +174,39 @@ def translation_summary(text, target_lang="spanish"):
     except Exception as e:
         print("Failed to extract translation:", e)
         print("Raw response:", resp.text[:2000])
+        metrics.FALLBACKS.inc(agent="translation", reason="parse_error")
         return "Translation error"
 
 
-def questions_suggestions(summary):
+def questions_suggestions(summary, use_cache=True):
     """
     Calls EchoVisit_FollowUpQuestions_Agent and returns 3 follow‑up questions.
     On errors, returns a single-item list with a helpful message and embeds
     the server error in a 'debug' field when possible.
     """
     API_KEY = os.getenv("WATSONX_API_KEY")
-    ENDPOINT = "https://us-south.ml.cloud.ibm.com"
     DEPLOYMENT_ID = os.getenv("FOLLOWUP_DEPLOYMENT_ID")
-    VERSION = "2021-05-01"
 
     # 1) IAM token
-    tok = requests.post(
-        "https://iam.cloud.ibm.com/identity/token",
-        data={"grant_type": "urn:ibm:params:oauth:grant-type:apikey", "apikey": API_KEY},
-        headers={"Content-Type": "application/x-www-form-urlencoded"},
-        timeout=30,
-    )
-    if tok.status_code != 200:
-        return [f"IAM auth failed: {tok.status_code}"], {"error": tok.text}
+    try:
+        token = get_token_provider(API_KEY).token()
+    except Exception as e:
+        return ["IAM auth failed"], {"error": repr(e)}
+
+    # 2) Call the agent
+    resp = post_agent(DEPLOYMENT_ID, _followup_payload(summary), token, timeout=90, use_cache=use_cache)
+    return _followup_result(resp)
 
-    token = tok.json().get("access_token")
 
-    # 2) Normalize the input summary to a compact string
+def _followup_payload(summary):
+    # Normalize the input summary to a compact string
     if isinstance(summary, (dict, list)):
         # compact, no ASCII escaping
         summary_text = json.dumps(summary, ensure_ascii=False, separators=(",", ":"))
     else:
         summary_text = str(summary)
 
-    # 3) Call the agent
-    url = f"{ENDPOINT}/ml/v4/deployments/{DEPLOYMENT_ID}/ai_service?version={VERSION}"
-    payload = {
+    return {
         "messages": [
             {
                 "role": "user",
@@ -237,13 +220,8 @@ def questions_suggestions(summary):
         ]
     }
 
-    resp = requests.post(
-        url,
-        headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
-        json=payload,
-        timeout=90,
-    )
 
+def _followup_result(resp):
     # If not 200, show the real error so we can fix the root cause
     if resp.status_code != 200:
         try:
@@ -251,9 +229,10 @@ def questions_suggestions(summary):
         except Exception:
             err_json = {"raw": resp.text}
         # Return a helpful message + debug for visibility
+        metrics.FALLBACKS.inc(agent="followup", reason="http_error")
         return [f"Follow‑up agent error: HTTP {resp.status_code}"], {"debug": err_json}
 
-    # 4) Parse the output
+    # Parse the output
     try:
         data = resp.json()
 
@@ -281,88 +260,200 @@ def questions_suggestions(summary):
 
     except Exception as e:
         # Surface parse issues with debug context
+        metrics.FALLBACKS.inc(agent="followup", reason="parse_error")
         return [f"Failed to parse follow‑up output: {e}"], {"debug": resp.text[:2000]}
 
 
 # Keep your existing translation_summary as-is if you prefer.
 # Add this safe wrapper and call THIS from Flask.
 
-def translation_summary_safe(text: str, target_lang: str = "Spanish") -> str:
+LANG_NAMES = {"en":"English","es":"Spanish","fr":"French","de":"German","zh":"Chinese","ar":"Arabic","hi":"Hindi"}
+
+def translation_summary_safe(text: str, target_lang: str = "Spanish", use_cache=True) -> str:
     try:
         # Map codes to names (handles 'de' -> 'German')
-        m = {"en":"English","es":"Spanish","fr":"French","de":"German","zh":"Chinese","ar":"Arabic","hi":"Hindi"}
-        target = m.get((target_lang or "").lower(), target_lang)
+        target = LANG_NAMES.get((target_lang or "").lower(), target_lang)
 
         # Call your existing translator exactly how it worked before:
-        out = translation_summary(text, target_lang=target)  # <-- your original function
-        if not isinstance(out, str) or not out.strip():
-            return text
-        # light cleanup only; keep newlines
-        out = out.replace("```"," ").strip()
-        return out
+        out = translation_summary(text, target_lang=target, use_cache=use_cache)  # <-- your original function
+        return _translation_safe_result(out, text)
     except Exception as e:
         print("translation_summary_safe error:", repr(e))
+        metrics.FALLBACKS.inc(agent="translation", reason="original_text")
+        return text
+
+
+def _translation_safe_result(out, text):
+    if not isinstance(out, str) or not out.strip():
+        metrics.FALLBACKS.inc(agent="translation", reason="original_text")
         return text
+    # light cleanup only; keep newlines
+    out = out.replace("```"," ").strip()
+    return out
 
-def interactive_qa(question: str, context: dict):
+def interactive_qa(question: str, context: dict, use_cache=True):
     """
     Calls your deployed Interactive Q&A agent.
     Returns: {"answer": str, "followups": [..]}
     """
     API_KEY = os.getenv("WATSONX_API_KEY")
-    ENDPOINT = "https://us-south.ml.cloud.ibm.com"
     DEPLOYMENT_ID = os.getenv("QA_DEPLOYMENT_ID")
-    VERSION = "2021-05-01"
 
     token = get_access_token(API_KEY)
     if not token:
         return {"answer": "Auth failed.", "followups": []}
 
-    url = f"{ENDPOINT}/ml/v4/deployments/{DEPLOYMENT_ID}/ai_service?version={VERSION}"
 
+    resp = None
+    try:
+        resp = post_agent(DEPLOYMENT_ID, _qa_payload(question, context), token, timeout=90, use_cache=use_cache)
+        return _qa_result(resp)
+    except Exception as e:
+        return _qa_error(e, resp)
+
+
+def _qa_payload(question, context):
     # Keep payload in the same "messages" style you use elsewhere.
     # We pass both the question and the visit context as one user message.
     user_content = json.dumps(
         {"question": question, "context": context},
         ensure_ascii=False, separators=(",", ":")
     )
-    payload = {"messages": [{"role": "user", "content": user_content}]}
+    return {"messages": [{"role": "user", "content": user_content}]}
+
+
+def _qa_answer(content):
+    content = (content or "").strip()
 
+    # Try to parse structured output first: {"answer": "...", "followups": ["..",".."]}
     try:
-        resp = requests.post(
-            url,
-            headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
-            json=payload,
-            timeout=90,
-        )
-        resp.raise_for_status()
-        data = resp.json()
+        j = json.loads(content)
+        answer = (j.get("answer") or "").strip()
+        follows = j.get("followups") or []
+        if answer:
+            return {"answer": answer, "followups": follows if isinstance(follows, list) else []}
+    except Exception:
+        pass
 
-        content = (data["choices"][0]["message"]["content"] or "").strip()
+    # Fallback: model returned plain text
+    return {"answer": content, "followups": []}
 
-        # Try to parse structured output first: {"answer": "...", "followups": ["..",".."]}
-        try:
-            j = json.loads(content)
-            answer = (j.get("answer") or "").strip()
-            follows = j.get("followups") or []
-            if answer:
-                return {"answer": answer, "followups": follows if isinstance(follows, list) else []}
-        except Exception:
-            pass
 
-        # Fallback: model returned plain text
-        return {"answer": content, "followups": []}
+def _qa_result(resp):
+    resp.raise_for_status()
+    data = resp.json()
+    return _qa_answer(data["choices"][0]["message"]["content"])
+
+
+def _qa_error(e, resp):
+    print("Interactive Q&A error:", repr(e))
+    metrics.FALLBACKS.inc(agent="qa", reason="error")
+    if resp is not None:
+        print("RAW:", resp.text[:1200])
+    return {"answer": "Sorry, I ran into an issue answering that.", "followups": []}
+
+
+_ANSWER_START = re.compile(r'"answer"\s*:\s*"')
+
+
+class _AnswerDeltas:
+    """
+    Turns the streamed model output into answer text as it arrives. The agent
+    answers either in plain text or as {"answer": "...", "followups": [...]};
+    for the JSON form only the decoded "answer" string is passed on.
+    """
+
+    def __init__(self):
+        self.text = ""      # raw model output so far
+        self.answer = ""    # answer text emitted so far
+        self._json = None   # unknown until the first non-blank character
+        self._pos = None    # next unread index inside the JSON answer string
+        self._closed = False
+
+    def feed(self, delta):
+        self.text += delta
+        if self._json is None:
+            head = self.text.lstrip()
+            if not head:
+                return ""
+            self._json = head[0] == "{"
+            if not self._json:
+                delta = head
+        out = self._json_answer() if self._json else delta
+        self.answer += out
+        return out
+
+    def _json_answer(self):
+        if self._closed:
+            return ""
+        if self._pos is None:
+            m = _ANSWER_START.search(self.text)
+            if not m:
+                return ""
+            self._pos = m.end()
+
+        s, i, out = self.text, self._pos, []
+        while i < len(s):
+            c = s[i]
+            if c == '"':
+                self._closed = True
+                break
+            if c != "\\":
+                out.append(c)
+                i += 1
+                continue
+            # escapes: wait until the whole sequence (incl. a surrogate pair) has arrived
+            end = i + 2
+            if s[i + 1:i + 2] == "u":
+                end = i + 6
+                if "d800" <= s[i + 2:i + 6].lower() < "dc00":
+                    end = i + 12
+            if end > len(s):
+                break
+            try:
+                out.append(json.loads('"' + s[i:end] + '"'))
+            except ValueError:
+                out.append(s[i:end])
+            i = end
+        self._pos = i
+        return "".join(out)
+
+
+def interactive_qa_stream(question: str, context: dict, use_cache=True):
+    """
+    Streaming variant of interactive_qa(). Yields ("delta", text) while the
+    answer is generated, then ("done", {"answer", "followups"}) once the full
+    output can be parsed for followups. Falls back to the non-streaming call
+    when the stream can't be opened.
+    """
+    API_KEY = os.getenv("WATSONX_API_KEY")
+    DEPLOYMENT_ID = os.getenv("QA_DEPLOYMENT_ID")
 
+    token = get_access_token(API_KEY)
+    if not token:
+        yield "done", {"answer": "Auth failed.", "followups": []}
+        return
+
+    deltas = _AnswerDeltas()
+    try:
+        for piece in stream_agent(DEPLOYMENT_ID, _qa_payload(question, context), token, use_cache=use_cache):
+            out = deltas.feed(piece)
+            if out:
+                yield "delta", out
     except Exception as e:
-        print("Interactive Q&A error:", repr(e))
-        try:
-            print("RAW:", resp.text[:1200])
-        except Exception:
-            pass
-        return {"answer": "Sorry, I ran into an issue answering that.", "followups": []}
+        if not deltas.text:
+            print("Interactive Q&A stream unavailable, answering without streaming:", repr(e))
+            yield "done", interactive_qa(question, context, use_cache=use_cache)
+            return
+        print("Interactive Q&A stream broke off:", repr(e))
+        metrics.FALLBACKS.inc(agent="qa", reason="stream_interrupted")
+        yield "done", {"answer": deltas.answer, "followups": []}
+        return
+
+    yield "done", _qa_answer(deltas.text)
 
 
-def drug_interactions(current_meds: list[str], new_meds: list[str]) -> dict:
+def drug_interactions(current_meds: list[str], new_meds: list[str], use_cache=True) -> dict:
     """
     Calls the deployed Drug-Interaction agent with the current and new meds.
     Expects the agent to already know how to compare and return:
@@ -374,8 +465,6 @@ def drug_interactions(current_meds: list[str], new_meds: list[str]) -> dict:
       }
     """
     API_KEY = os.getenv("WATSONX_API_KEY")
-    ENDPOINT = "https://us-south.ml.cloud.ibm.com"
-    VERSION = "2021-05-01"
     DEPLOYMENT_ID = os.getenv("DRUG_DEPLOYMENT_ID")
        
 
@@ -383,10 +472,18 @@ def drug_interactions(current_meds: list[str], new_meds: list[str]) -> dict:
     if not token:
         return {"has_issue": False, "interactions": [], "raw": {"error": "auth_failed"}}
     
-    url = f"{ENDPOINT}/ml/v4/deployments/{DEPLOYMENT_ID}/ai_service?version={VERSION}"
 
+    try:
+        resp = post_agent(DEPLOYMENT_ID, _drug_payload(current_meds, new_meds), token, timeout=90, use_cache=use_cache)
+        return _drug_result(resp)
+    except Exception as e:
+        metrics.FALLBACKS.inc(agent="drug", reason="error")
+        return {"has_issue": False, "interactions": [], "raw": {"error": repr(e)}}
+
+
+def _drug_payload(current_meds, new_meds):
     # Send only the data — agent prompt logic is pre-configured
-    payload = {
+    return {
         "messages": [
             {
                 "role": "user",
@@ -398,85 +495,87 @@ def drug_interactions(current_meds: list[str], new_meds: list[str]) -> dict:
         ]
     }
 
-    try:
-        resp = requests.post(
-            url,
-            headers={
-                "Authorization": f"Bearer {token}",
-                "Content-Type": "application/json"
-            },
-            json=payload,
-            timeout=90,
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        content = (data["choices"][0]["message"]["content"] or "").strip()
-
-        # Remove code fences if present
-        content = re.sub(r"^```(?:json)?\s*|\s*```$", "", content)
 
-        # Parse to Python object
-        try:
-            parsed = json.loads(content)
-        except Exception:
-            start, end = content.find("{"), content.rfind("}")
-            parsed = json.loads(content[start:end+1]) if start != -1 and end != -1 else {"raw": content}
+def _drug_result(resp):
+    resp.raise_for_status()
+    data = resp.json()
+    content = (data["choices"][0]["message"]["content"] or "").strip()
 
-        # === Normalization ===
-        interactions = []
-        has_issue = False
+    # Remove code fences if present
+    content = re.sub(r"^```(?:json)?\s*|\s*```$", "", content)
 
-        if isinstance(parsed, dict):
-            # Top-level has_issue
-            if parsed.get("has_issue") is True:
+    # Parse to Python object
+    try:
+        parsed = json.loads(content)
+    except Exception:
+        start, end = content.find("{"), content.rfind("}")
+        parsed = json.loads(content[start:end+1]) if start != -1 and end != -1 else {"raw": content}
+
+    # === Normalization ===
+    interactions = []
+    has_issue = False
+
+    if isinstance(parsed, dict):
+        # Top-level has_issue
+        if parsed.get("has_issue") is True:
+            has_issue = True
+
+        # Nested structure from your agent
+        if "DrugInteractions" in parsed:
+            di = parsed["DrugInteractions"]
+            if di.get("interactions_found") is True:
                 has_issue = True
-
-            # Nested structure from your agent
-            if "DrugInteractions" in parsed:
-                di = parsed["DrugInteractions"]
-                if di.get("interactions_found") is True:
-                    has_issue = True
-                cand = di.get("interactions", [])
-                if isinstance(cand, list):
-                    for i in cand:
-                        if isinstance(i, dict):
-                            interactions.append({
-                                "pair": i.get("pair", []),
-                                "severity": i.get("severity", "unknown"),
-                                "note": i.get("note") or i.get("description") or ""
-                            })
-
-            # Flat interactions
-            elif "interactions" in parsed and isinstance(parsed["interactions"], list):
-                for i in parsed["interactions"]:
+            cand = di.get("interactions", [])
+            if isinstance(cand, list):
+                for i in cand:
                     if isinstance(i, dict):
                         interactions.append({
                             "pair": i.get("pair", []),
                             "severity": i.get("severity", "unknown"),
                             "note": i.get("note") or i.get("description") or ""
                         })
-                if interactions:
-                    has_issue = True
-
-        return {"has_issue": has_issue, "interactions": interactions, "raw": parsed}
-
-    except Exception as e:
-        return {"has_issue": False, "interactions": [], "raw": {"error": repr(e)}}
-
 
+        # Flat interactions
+        elif "interactions" in parsed and isinstance(parsed["interactions"], list):
+            for i in parsed["interactions"]:
+                if isinstance(i, dict):
+                    interactions.append({
+                        "pair": i.get("pair", []),
+                        "severity": i.get("severity", "unknown"),
+                        "note": i.get("note") or i.get("description") or ""
+                    })
+            if interactions:
+                has_issue = True
 
+    return {"has_issue": has_issue, "interactions": interactions, "raw": parsed}
 
 
 # Final pipeline
+# summarize -> questions and simplify -> translate are independent chains,
+# so the run takes roughly the longer chain instead of the sum of all four.
+PIPELINE_STAGES = [
+    Stage("summary", summarize_transcript, inputs=["transcript"]),
+    Stage("simplified", simplify_transcript, inputs=["transcript"]),
+    Stage("translated", lambda simplified: translation_summary(simplified, target_lang="spanish"),
+          inputs=["simplified"]),
+    Stage("questions", questions_suggestions, inputs=["summary"]),
+]
+
 def process_transcript(transcript):
-    summary = summarize_transcript(transcript)
-    simplified = simplify_summary(transcript)
-    translated = translation_summary(simplified, target_lang="spanish")
-    questions = questions_suggestions(summary)
+    results = run_stages(PIPELINE_STAGES, {"transcript": transcript})
+    summary = results["summary"]
+    simplified = results["simplified"]
+    translated = results["translated"]
+    questions = results["questions"]
 
     return {
         "summary": summary,
         "simplified": simplified,
         "translated": translated,
         "questions": questions
-    }
\ No newline at end of file
+    }
+
+
+def iter_process_transcript(transcript):
+    """Yields (stage name, result) as each pipeline stage finishes."""
+    yield from iter_stages(PIPELINE_STAGES, {"transcript": transcript})
@@ -0,0 +1,113 @@
+import os
+
+import metrics
+from watsonx_client import get_token_async, post_agent_async
+from watsonx_agent import (
+    LANG_NAMES,
+    _summary_result, _simplify_result,
+    _translation_payload, _translation_result, _translation_safe_result,
+    _followup_payload, _followup_result,
+    _qa_payload, _qa_result, _qa_error,
+    _drug_payload, _drug_result,
+)
+
+# asyncio counterparts of the functions in watsonx_agent.py, for the routes
+# asgi_server.py serves on the event loop. Payloads, parsing and fallback
+# values are shared with the sync module, so both paths return the same shapes.
+
+
+async def get_access_token(api_key):
+    try:
+        return await get_token_async(api_key)
+    except Exception as e:
+        print("IAM auth failed:", repr(e))
+        metrics.FALLBACKS.inc(agent="iam", reason="auth_failed")
+        return None
+
+
+async def summarize_transcript(transcript, use_cache=True):
+    DEPLOYMENT_ID = os.getenv("SUMMARIZE_DEPLOYMENT_ID")
+
+    token = await get_token_async(os.getenv("WATSONX_API_KEY"))
+    payload = {"messages": [{"role": "user", "content": transcript}]}
+    resp = await post_agent_async(DEPLOYMENT_ID, payload, token, timeout=90, use_cache=use_cache)
+    return _summary_result(resp)
+
+
+async def simplify_summary(transcript, use_cache=True):
+    DEPLOYMENT_ID = os.getenv("SIMPLIFY_DEPLOYMENT_ID")
+
+    token = await get_access_token(os.getenv("WATSONX_API_KEY"))
+    if not token:
+        return "Could not authenticate"
+
+    payload = {"messages": [{"role": "user", "content": transcript}]}
+    resp = await post_agent_async(DEPLOYMENT_ID, payload, token, timeout=90, use_cache=use_cache)
+    return _simplify_result(resp)
+
+
+async def translation_summary(text, target_lang="spanish", use_cache=True):
+    DEPLOYMENT_ID = os.getenv("TRANSLATION_DEPLOYMENT_ID")
+
+    token = await get_access_token(os.getenv("WATSONX_API_KEY"))
+    if not token:
+        return "Authentication failed"
+
+    resp = await post_agent_async(DEPLOYMENT_ID, _translation_payload(text, target_lang), token,
+                                  timeout=90, use_cache=use_cache)
+    return _translation_result(resp)
+
+
+async def translation_summary_safe(text: str, target_lang: str = "Spanish", use_cache=True) -> str:
+    try:
+        target = LANG_NAMES.get((target_lang or "").lower(), target_lang)
+        out = await translation_summary(text, target_lang=target, use_cache=use_cache)
+        return _translation_safe_result(out, text)
+    except Exception as e:
+        print("translation_summary_safe error:", repr(e))
+        metrics.FALLBACKS.inc(agent="translation", reason="original_text")
+        return text
+
+
+async def questions_suggestions(summary, use_cache=True):
+    DEPLOYMENT_ID = os.getenv("FOLLOWUP_DEPLOYMENT_ID")
+
+    try:
+        token = await get_token_async(os.getenv("WATSONX_API_KEY"))
+    except Exception as e:
+        return ["IAM auth failed"], {"error": repr(e)}
+
+    resp = await post_agent_async(DEPLOYMENT_ID, _followup_payload(summary), token, timeout=90, use_cache=use_cache)
+    return _followup_result(resp)
+
+
+async def interactive_qa(question: str, context: dict, use_cache=True):
+    DEPLOYMENT_ID = os.getenv("QA_DEPLOYMENT_ID")
+
+    token = await get_access_token(os.getenv("WATSONX_API_KEY"))
+    if not token:
+        return {"answer": "Auth failed.", "followups": []}
+
+    resp = None
+    try:
+        resp = await post_agent_async(DEPLOYMENT_ID, _qa_payload(question, context), token,
+                                      timeout=90, use_cache=use_cache)
+        return _qa_result(resp)
+    except Exception as e:
+        return _qa_error(e, resp)
+
+
+async def drug_interactions(current_meds: list[str], new_meds: list[str], use_cache=True) -> dict:
+    DEPLOYMENT_ID = os.getenv("DRUG_DEPLOYMENT_ID")
+
+    token = await get_access_token(os.getenv("WATSONX_API_KEY"))
+    if not token:
+        return {"has_issue": False, "interactions": [], "raw": {"error": "auth_failed"}}
+
+    try:
+        resp = await post_agent_async(DEPLOYMENT_ID, _drug_payload(current_meds, new_meds), token,
+                                      timeout=90, use_cache=use_cache)
+        return _drug_result(resp)
+    except Exception as e:
+        metrics.FALLBACKS.inc(agent="drug", reason="error")
+        return {"has_issue": False, "interactions": [], "raw": {"error": repr(e)}}
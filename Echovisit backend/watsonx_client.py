@@ -0,0 +1,596 @@
+import asyncio
+import contextvars
+import functools
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+import httpx
+from cachetools import TTLCache
+from dotenv import load_dotenv
+
+import metrics
+from watsonx_resilience import call_with_resilience, call_with_resilience_async, resilience_stats
+
+load_dotenv()
+
+# Overridable so the load test can point the server at local stand-ins
+IAM_TOKEN_URL = os.getenv("WATSONX_IAM_URL", "https://iam.cloud.ibm.com/identity/token")
+ENDPOINT = os.getenv("WATSONX_ENDPOINT", "https://us-south.ml.cloud.ibm.com")
+VERSION = "2021-05-01"
+
+# Connection pool for every watsonx/IAM call made by this process
+POOL_MAX_CONNECTIONS = int(os.getenv("WATSONX_POOL_MAX_CONNECTIONS", "20"))
+POOL_MAX_KEEPALIVE = int(os.getenv("WATSONX_POOL_MAX_KEEPALIVE", "10"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("WATSONX_POOL_KEEPALIVE_EXPIRY", "60"))
+# HTTP/2 needs the optional `h2` package (pip install httpx[http2])
+USE_HTTP2 = os.getenv("WATSONX_HTTP2", "0").lower() in ("1", "true", "yes")
+
+# Agent response cache: LRU-bounded entries that also expire after a TTL (seconds)
+AGENT_CACHE_SIZE = int(os.getenv("WATSONX_CACHE_SIZE", "1024"))
+AGENT_CACHE_TTL = int(os.getenv("WATSONX_CACHE_TTL", "3600"))
+# Agents (names as in agent_name(): SIMPLIFY_DEPLOYMENT_ID -> "simplify") whose
+# answers may be replayed. Q&A and drug checks are left out: their answers
+# depend on the patient's visit and medication list, so they always go upstream.
+AGENT_CACHE_AGENTS = frozenset(
+    a.strip().lower() for a in os.getenv("WATSONX_CACHE_AGENTS", "summarize,simplify,translation,followup").split(",")
+    if a.strip()
+)
+
+# Agent requests in flight at once across all threads (set to the watsonx rate
+# limit); batch work beyond this waits here instead of failing with 429s.
+MAX_CONCURRENCY = int(os.getenv("WATSONX_MAX_CONCURRENCY", str(POOL_MAX_CONNECTIONS)))
+
+# Refresh this many seconds before the IAM token actually expires.
+TOKEN_REFRESH_MARGIN = int(os.getenv("WATSONX_TOKEN_REFRESH_MARGIN", "300"))
+
+
+_client = None
+_client_lock = threading.Lock()
+_inflight = threading.BoundedSemaphore(MAX_CONCURRENCY)
+
+
+def _http2_enabled():
+    if not USE_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        print("WATSONX_HTTP2 is set but `h2` is not installed; using HTTP/1.1")
+        return False
+
+
+def get_http_client():
+    """
+    Shared keep-alive client. httpx.Client is thread-safe, so every Flask
+    worker thread reuses the same pool of TCP+TLS connections.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(
+                    http2=_http2_enabled(),
+                    limits=httpx.Limits(
+                        max_connections=POOL_MAX_CONNECTIONS,
+                        max_keepalive_connections=POOL_MAX_KEEPALIVE,
+                        keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+                    ),
+                    timeout=httpx.Timeout(90.0, connect=10.0),
+                )
+    return _client
+
+
+def close_http_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def agent_url(deployment_id):
+    return f"{ENDPOINT}/ml/v4/deployments/{deployment_id}/ai_service?version={VERSION}"
+
+
+def agent_stream_url(deployment_id):
+    return f"{ENDPOINT}/ml/v4/deployments/{deployment_id}/ai_service_stream?version={VERSION}"
+
+
+@functools.lru_cache(maxsize=64)
+def agent_name(deployment_id):
+    """Metric label for a deployment: SIMPLIFY_DEPLOYMENT_ID=<id> -> "simplify"."""
+    for var, value in os.environ.items():
+        if var.endswith("_DEPLOYMENT_ID") and value == deployment_id:
+            return var[:-len("_DEPLOYMENT_ID")].lower()
+    return str(deployment_id)
+
+
+# ---- agent response cache ---------------------------------------------------
+# Keyed by deployment id + a hash of the canonical messages payload, so the
+# same translate/simplify/follow-up request is answered without a round trip.
+# Only the deployments in AGENT_CACHE_AGENTS are cached.
+_response_cache = TTLCache(maxsize=AGENT_CACHE_SIZE, ttl=AGENT_CACHE_TTL)
+_cache_lock = threading.Lock()
+_cache_counters = {"hits": 0, "misses": 0}
+
+
+def _cache_key(deployment_id, payload):
+    """None for deployments outside AGENT_CACHE_AGENTS, which are never cached."""
+    if agent_name(deployment_id) not in AGENT_CACHE_AGENTS:
+        return None
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return f"{deployment_id}:{hashlib.sha256(canonical.encode('utf-8')).hexdigest()}"
+
+
+def _cache_get(key, url):
+    with _cache_lock:
+        entry = _response_cache.get(key)
+        _cache_counters["hits" if entry is not None else "misses"] += 1
+    if entry is None:
+        return None
+    content, content_type = entry
+    return httpx.Response(
+        200,
+        content=content,
+        headers={"Content-Type": content_type},
+        request=httpx.Request("POST", url),
+    )
+
+
+def _cache_put(key, resp):
+    # Only successful answers are worth replaying
+    if resp.status_code != 200:
+        return
+    with _cache_lock:
+        _response_cache[key] = (resp.content, resp.headers.get("Content-Type", "application/json"))
+
+
+def cache_stats():
+    with _cache_lock:
+        return {
+            "hits": _cache_counters["hits"],
+            "misses": _cache_counters["misses"],
+            "size": len(_response_cache),
+            "maxsize": _response_cache.maxsize,
+            "ttl": _response_cache.ttl,
+        }
+
+
+def clear_cache():
+    with _cache_lock:
+        _response_cache.clear()
+
+
+@metrics.register_collector
+def _watsonx_metrics():
+    cache = cache_stats()
+    health = resilience_stats()
+    per_deployment = lambda field: [({"agent": agent_name(d)}, h[field]) for d, h in health.items()]
+    return [
+        ("echovisit_agent_cache_entries", "gauge", "Entries in the agent response cache.", [({}, cache["size"])]),
+        ("echovisit_agent_requests_total", "counter", "Agent calls that reached the resilience layer.",
+         per_deployment("requests")),
+        ("echovisit_agent_retries_total", "counter", "Agent request retries.", per_deployment("retries")),
+        ("echovisit_agent_hedges_total", "counter", "Hedged duplicate agent requests.", per_deployment("hedges")),
+        ("echovisit_agent_short_circuited_total", "counter", "Agent calls refused by an open circuit.",
+         per_deployment("short_circuited")),
+        ("echovisit_agent_circuit_open", "gauge", "1 while a deployment's circuit is open.",
+         [({"agent": agent_name(d)}, int(h["state"] == "open")) for d, h in health.items()]),
+    ]
+
+
+def post_agent(deployment_id, payload, token, timeout=90, use_cache=True):
+    """
+    POSTs a messages payload to a deployment's (non-streaming) ai_service endpoint.
+    Identical payloads are served from the response cache unless use_cache=False.
+    At most WATSONX_MAX_CONCURRENCY requests are sent at once; retries,
+    hedging and circuit breaking come from watsonx_resilience.
+    """
+    url = agent_url(deployment_id)
+    name = agent_name(deployment_id)
+    key = _cache_key(deployment_id, payload) if use_cache else None
+    if key:
+        cached = _cache_get(key, url)
+        metrics.AGENT_CACHE.inc(agent=name, result="miss" if cached is None else "hit")
+        if cached is not None:
+            return cached
+
+    def send():
+        with _inflight:
+            return get_http_client().post(
+                url,
+                headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
+                json=payload,
+                timeout=timeout,
+            )
+
+    with metrics.timed("agent", name):
+        resp = call_with_resilience(deployment_id, url, send)
+        if resp.status_code == 401:
+            # revoked or expired early: renew the token and try once more
+            token = renewed_token(token)
+            if token:
+                resp = call_with_resilience(deployment_id, url, send)
+    if key:
+        _cache_put(key, resp)
+    return resp
+
+
+def _stream_deltas(resp):
+    """Content deltas from an ai_service_stream SSE body (`data: {"choices": [{"delta": ...}]}`)."""
+    for line in resp.iter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if not data or data == "[DONE]":
+            continue
+        try:
+            chunk = json.loads(data)
+        except ValueError:
+            continue
+        for choice in chunk.get("choices") or []:
+            content = (choice.get("delta") or choice.get("message") or {}).get("content")
+            if content:
+                yield content
+
+
+_STREAM_END = object()
+
+
+def stream_agent(deployment_id, payload, token, timeout=90, use_cache=True):
+    """
+    Streams a deployment's ai_service_stream endpoint and yields the answer
+    text piece by piece as the model produces it.
+
+    Shares the response cache with post_agent(): a cached answer is replayed
+    as one piece, and a completed stream is stored in the non-streaming
+    response shape. Retries and the circuit breaker only apply until the
+    stream is open. Raises httpx.HTTPStatusError when it can't be opened.
+
+    The upstream body is read on its own thread into a buffer, so the
+    WATSONX_MAX_CONCURRENCY slot is held from connect until watsonx has sent
+    the last chunk, however slowly the caller consumes them, and not while
+    a failed attempt backs off.
+    """
+    url = agent_stream_url(deployment_id)
+    name = agent_name(deployment_id)
+    key = _cache_key(deployment_id, payload) if use_cache else None
+    if key:
+        cached = _cache_get(key, agent_url(deployment_id))
+        metrics.AGENT_CACHE.inc(agent=name, result="miss" if cached is None else "hit")
+        if cached is not None:
+            yield cached.json()["choices"][0]["message"]["content"]
+            return
+
+    client = get_http_client()
+
+    def send():
+        # an open stream keeps its slot (released by pump() below); a failed attempt gives it back
+        _inflight.acquire()
+        try:
+            request = client.build_request(
+                "POST", url,
+                headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json",
+                         "Accept": "text/event-stream"},
+                json=payload,
+                timeout=timeout,
+            )
+            resp = client.send(request, stream=True)
+            if resp.status_code != 200:
+                resp.read()  # error bodies are small; reading also releases the connection
+        except BaseException:
+            _inflight.release()
+            raise
+        if resp.status_code != 200:
+            _inflight.release()
+        return resp
+
+    started = time.perf_counter()
+    resp = call_with_resilience(deployment_id, url, send, hedge=False)
+    if resp.status_code == 401:
+        token = renewed_token(token)
+        if token:
+            resp = call_with_resilience(deployment_id, url, send, hedge=False)
+    if resp.status_code != 200:
+        metrics.record_stage("agent", time.perf_counter() - started, name)
+        resp.raise_for_status()
+        return
+
+    chunks = queue.Queue()
+    stop = threading.Event()
+
+    def pump():
+        try:
+            for delta in _stream_deltas(resp):
+                if stop.is_set():
+                    break
+                chunks.put(delta)
+        except Exception as e:
+            chunks.put(e)
+        finally:
+            resp.close()
+            _inflight.release()
+            metrics.record_stage("agent", time.perf_counter() - started, name)
+            chunks.put(_STREAM_END)
+
+    # the copied context keeps stage timings on this request's Server-Timing
+    threading.Thread(target=contextvars.copy_context().run, args=(pump,),
+                     name="agent-stream", daemon=True).start()
+
+    parts = []
+    try:
+        while True:
+            item = chunks.get()
+            if item is _STREAM_END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            if not parts:
+                metrics.record_stage("agent_first_token", time.perf_counter() - started, name)
+            parts.append(item)
+            yield item
+    finally:
+        stop.set()   # the caller went away: pump() stops at the next chunk and frees the slot
+
+    if key and parts:
+        _cache_put(key, httpx.Response(200, json={"choices": [{
+            "index": 0, "message": {"role": "assistant", "content": "".join(parts)}}]}))
+
+
+# ---- asyncio ------------------------------------------------------------------
+# One httpx.AsyncClient for the process, used by the ASGI server's event loop
+# (asgi_server.py): every awaiting request shares its connection pool.
+# httpx async clients are bound to one loop, so using it from another is an error.
+_async_client = None
+_async_loop = None
+_async_inflight = None
+
+
+def get_async_http_client():
+    global _async_client, _async_loop, _async_inflight
+    loop = asyncio.get_running_loop()
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            http2=_http2_enabled(),
+            limits=httpx.Limits(
+                max_connections=POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=POOL_MAX_KEEPALIVE,
+                keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(90.0, connect=10.0),
+        )
+        _async_loop = loop
+        _async_inflight = asyncio.Semaphore(MAX_CONCURRENCY)
+    elif _async_loop is not loop:
+        raise RuntimeError("the async watsonx client belongs to another event loop")
+    return _async_client
+
+
+async def close_async_http_client():
+    """Called when the ASGI server shuts down (lifespan)."""
+    global _async_client, _async_loop, _async_inflight
+    client, _async_client, _async_loop, _async_inflight = _async_client, None, None, None
+    if client is not None:
+        await client.aclose()
+
+
+async def post_agent_async(deployment_id, payload, token, timeout=90, use_cache=True):
+    """Async counterpart of post_agent(); same response cache, resilience and concurrency limit."""
+    url = agent_url(deployment_id)
+    name = agent_name(deployment_id)
+    key = _cache_key(deployment_id, payload) if use_cache else None
+    if key:
+        cached = _cache_get(key, url)
+        metrics.AGENT_CACHE.inc(agent=name, result="miss" if cached is None else "hit")
+        if cached is not None:
+            return cached
+
+    client = get_async_http_client()
+
+    async def send():
+        async with _async_inflight:
+            return await client.post(
+                url,
+                headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
+                json=payload,
+                timeout=timeout,
+            )
+
+    with metrics.timed("agent", name):
+        resp = await call_with_resilience_async(deployment_id, url, send)
+        if resp.status_code == 401:
+            token = await asyncio.to_thread(renewed_token, token)
+            if token:
+                resp = await call_with_resilience_async(deployment_id, url, send)
+    if key:
+        _cache_put(key, resp)
+    return resp
+
+
+async def get_token_async(api_key=None):
+    """
+    Same shared token cache as the sync path. A fresh token is returned
+    without blocking; an IAM round trip runs on a worker thread.
+    """
+    provider = get_token_provider(api_key)
+    token = provider.peek()
+    if token:
+        return token
+    return await asyncio.to_thread(provider.token)
+
+
+class IAMTokenProvider:
+    """
+    Caches one IBM Cloud IAM access token per API key.
+
+    - Reads `expires_in` from the IAM response and refreshes the token in a
+      background timer `refresh_margin` seconds before it expires.
+    - Single-flight: when the token is missing or expired, only one thread
+      calls the IAM endpoint; every other caller waits for that result.
+    """
+
+    def __init__(self, api_key, token_url=IAM_TOKEN_URL, refresh_margin=TOKEN_REFRESH_MARGIN):
+        self.api_key = api_key
+        self.token_url = token_url
+        self.refresh_margin = refresh_margin
+
+        self._token = None
+        self._expires_at = 0.0
+        self._cond = threading.Condition()
+        self._fetching = False
+        self._last_error = None
+        self._timer = None
+        self._previous = None   # the token before the last refresh, still in callers' hands
+
+    def _fresh(self):
+        return self._token is not None and time.time() < self._expires_at - self.refresh_margin
+
+    def _valid(self):
+        return self._token is not None and time.time() < self._expires_at
+
+    def _fetch(self):
+        resp = get_http_client().post(
+            self.token_url,
+            data={
+                "grant_type": "urn:ibm:params:oauth:grant-type:apikey",
+                "apikey": self.api_key
+            },
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            timeout=30,
+        )
+        resp.raise_for_status()
+        body = resp.json()
+        token = body["access_token"]
+        # IAM returns `expires_in` (seconds); fall back to `expiration` (epoch)
+        expires_in = body.get("expires_in")
+        if expires_in is None and body.get("expiration"):
+            expires_in = float(body["expiration"]) - time.time()
+        return token, float(expires_in or 3600)
+
+    def _refresh(self):
+        """Runs the IAM call outside the lock; caller must own `_fetching`."""
+        try:
+            token, expires_in = self._fetch()
+        except Exception as e:
+            with self._cond:
+                self._fetching = False
+                self._last_error = e
+                self._cond.notify_all()
+            print("IAM token refresh failed:", repr(e))
+            return
+
+        with self._cond:
+            self._previous, self._token = self._token or self._previous, token
+            self._expires_at = time.time() + expires_in
+            self._fetching = False
+            self._last_error = None
+            self._cond.notify_all()
+        self._schedule_refresh(expires_in)
+
+    def _schedule_refresh(self, expires_in):
+        delay = max(expires_in - self.refresh_margin, 1.0)
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self):
+        with self._cond:
+            if self._fetching:
+                return
+            self._fetching = True
+        self._refresh()
+
+    def token(self):
+        """
+        Returns a valid access token, fetching one if needed.
+        Raises the IAM error when no valid token can be obtained.
+        """
+        with self._cond:
+            if self._fresh():
+                return self._token
+
+            if self._valid() and not self._fetching:
+                # Still usable: hand it out and refresh behind the caller's back
+                self._fetching = True
+                threading.Thread(target=self._refresh, daemon=True).start()
+                return self._token
+            if self._valid():
+                return self._token
+
+            if self._fetching:
+                # Someone else is already talking to IAM; wait for their answer
+                while self._fetching:
+                    self._cond.wait()
+                if self._valid():
+                    return self._token
+                raise self._last_error or RuntimeError("IAM token unavailable")
+
+            self._fetching = True
+
+        self._refresh()
+
+        with self._cond:
+            if self._valid():
+                return self._token
+            raise self._last_error or RuntimeError("IAM token unavailable")
+
+    def peek(self):
+        """Cached token if it is not due for refresh, else None. Never blocks on IAM."""
+        with self._cond:
+            return self._token if self._fresh() else None
+
+    def issued(self, token):
+        """Whether `token` is this provider's current or previous token."""
+        with self._cond:
+            return token is not None and token in (self._token, self._previous)
+
+    def invalidate(self, token=None):
+        """
+        Drop the cached token (e.g. after a 401 from a deployment). With
+        `token`, only if that is still the cached one, so callers that were
+        all rejected with the same token trigger a single IAM refresh.
+        """
+        with self._cond:
+            if token is None or token == self._token:
+                self._previous, self._token = self._token, None
+                self._expires_at = 0.0
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_token_provider(api_key=None):
+    """Process-wide provider for `api_key` (defaults to WATSONX_API_KEY)."""
+    api_key = api_key or os.getenv("WATSONX_API_KEY")
+    with _providers_lock:
+        provider = _providers.get(api_key)
+        if provider is None:
+            provider = IAMTokenProvider(api_key)
+            _providers[api_key] = provider
+        return provider
+
+
+def renewed_token(token):
+    """
+    A deployment answered 401 to `token`: a new token from the provider that
+    issued it, or None when none did or IAM fails (the 401 then stands).
+    """
+    with _providers_lock:
+        providers = list(_providers.values())
+    for provider in providers:
+        if provider.issued(token):
+            provider.invalidate(token)
+            try:
+                return provider.token()
+            except Exception as e:
+                print("IAM token renewal after 401 failed:", repr(e))
+                return None
+    return None
@@ -0,0 +1,374 @@
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import httpx
+
+# Retries on 429/5xx and connection errors, with full-jitter exponential backoff.
+RETRY_MAX_ATTEMPTS = int(os.getenv("WATSONX_RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("WATSONX_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("WATSONX_RETRY_MAX_DELAY", "10"))
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Hedging: when a request is slower than this latency percentile of the
+# deployment's recent answers, send one duplicate and take whichever answers
+# first. 0 disables it.
+HEDGE_PERCENTILE = float(os.getenv("WATSONX_HEDGE_PERCENTILE", "0"))
+HEDGE_MIN_SAMPLES = int(os.getenv("WATSONX_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY = float(os.getenv("WATSONX_HEDGE_MIN_DELAY", "1"))
+LATENCY_WINDOW = int(os.getenv("WATSONX_LATENCY_WINDOW", "200"))
+
+# Circuit breaker: after this many consecutive failures (5xx / connection
+# errors) a deployment fails fast for BREAKER_RESET_SECONDS, then one trial
+# request decides whether it closes again.
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("WATSONX_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("WATSONX_BREAKER_RESET_SECONDS", "30"))
+
+
+def retry_after_seconds(resp):
+    """Seconds requested by a Retry-After header (delta or HTTP date), or None."""
+    value = resp.headers.get("Retry-After") if resp is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(when.timestamp() - time.time(), 0.0)
+
+
+def backoff_delay(attempt, resp=None):
+    """Delay before retry number `attempt + 1`; Retry-After wins when it asks for longer."""
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+    requested = retry_after_seconds(resp)
+    if requested is not None:
+        delay = max(delay, min(requested, RETRY_MAX_DELAY))
+    return delay
+
+
+def _retryable(resp):
+    return resp.status_code in RETRYABLE_STATUS
+
+
+def _unhealthy(resp):
+    # 429 means "slow down", not "broken": it doesn't trip the breaker
+    return resp.status_code >= 500
+
+
+class CircuitBreaker:
+    """closed -> (N consecutive failures) -> open -> (reset timeout) -> half-open -> closed/open"""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial = None        # token of the half-open trial request in flight
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        """
+        A truthy token if a request may be sent now, else None. In half-open
+        state only one trial goes through; pass its token to end_trial() once
+        the request is over, however it ended.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._trial is not None:
+                return None
+            self._trial = object()
+            return self._trial
+
+    def end_trial(self, token):
+        """Frees the half-open slot if `token`'s trial ended without a recorded outcome (e.g. it raised)."""
+        with self._lock:
+            if token is not True and self._trial is token:
+                self._trial = None
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    print(f"watsonx circuit opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+            self._trial = None
+
+
+class LatencyTracker:
+    """Latencies (seconds) of the last `window` successful calls."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        idx = min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))
+        return samples[idx]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._samples)
+
+
+class DeploymentHealth:
+    """Breaker, latency window and counters of one deployment."""
+
+    def __init__(self):
+        self.breaker = CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.counters = {"requests": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "short_circuited": 0}
+        self._lock = threading.Lock()
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def hedge_delay(self):
+        if HEDGE_PERCENTILE <= 0 or len(self.latency) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(self.latency.percentile(HEDGE_PERCENTILE), HEDGE_MIN_DELAY)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            "state": self.breaker.state,
+            "p50": self.latency.percentile(50),
+            "p95": self.latency.percentile(95),
+            **counters,
+        }
+
+
+_health = {}
+_health_lock = threading.Lock()
+
+
+def get_health(deployment_id):
+    with _health_lock:
+        health = _health.get(deployment_id)
+        if health is None:
+            health = _health[deployment_id] = DeploymentHealth()
+        return health
+
+
+def resilience_stats():
+    """Per-deployment breaker state, latency percentiles and retry/hedge counters."""
+    with _health_lock:
+        items = list(_health.items())
+    return {deployment_id: health.stats() for deployment_id, health in items}
+
+
+def _circuit_open_response(url):
+    # Same shape as a failed call, so the agent functions fall back as usual
+    return httpx.Response(
+        503,
+        json={"error": "circuit_open", "detail": "Deployment is failing; not sending requests for now"},
+        headers={"X-Circuit-Open": "1"},
+        request=httpx.Request("POST", url),
+    )
+
+
+# ---- sync -------------------------------------------------------------------
+# Hedged requests need a second thread; httpx can't cancel a sync request,
+# so the losing request runs to completion here and its answer is dropped.
+_hedge_executor = ThreadPoolExecutor(max_workers=int(os.getenv("WATSONX_HEDGE_WORKERS", "32")),
+                                     thread_name_prefix="watsonx-hedge")
+
+
+def _timed(health, send):
+    start = time.monotonic()
+    resp = send()
+    if not _retryable(resp):
+        health.latency.add(time.monotonic() - start)
+    return resp
+
+
+def _first_good(futures):
+    """First non-retryable response among `futures`; otherwise the last outcome."""
+    resp, error = None, None
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            try:
+                resp = fut.result()
+            except httpx.TransportError as e:
+                error = e
+                continue
+            if not _retryable(resp):
+                return fut, resp
+    if resp is not None:
+        return None, resp
+    raise error
+
+
+def _send_hedged(health, send):
+    delay = health.hedge_delay()
+    if delay is None:
+        return _timed(health, send)
+
+    primary = _hedge_executor.submit(_timed, health, send)
+    done, _ = wait([primary], timeout=delay)
+    if done:
+        return primary.result()
+
+    health.count("hedges")
+    hedge = _hedge_executor.submit(_timed, health, send)
+    winner, resp = _first_good([primary, hedge])
+    if winner is hedge:
+        health.count("hedge_wins")
+    return resp
+
+
+def call_with_resilience(deployment_id, url, send, hedge=True):
+    """
+    Calls `send()` (one HTTP attempt returning an httpx.Response) with
+    retries, optional hedging and the deployment's circuit breaker.
+    Returns the final response; raises the last connection error if every
+    attempt failed to connect.
+    hedge=False is for streamed responses: a losing duplicate would hold a
+    connection open, and time-to-headers is no latency sample for hedging.
+    """
+    health = get_health(deployment_id)
+    health.count("requests")
+    attempt = 0
+    while True:
+        token = health.breaker.allow()
+        if not token:
+            health.count("short_circuited")
+            return _circuit_open_response(url)
+
+        resp = None
+        try:
+            resp = _send_hedged(health, send) if hedge else send()
+        except httpx.TransportError:
+            health.breaker.record_failure()
+            if attempt + 1 >= RETRY_MAX_ATTEMPTS:
+                raise
+        else:
+            if _unhealthy(resp):
+                health.breaker.record_failure()
+            else:
+                health.breaker.record_success()
+            if not _retryable(resp) or attempt + 1 >= RETRY_MAX_ATTEMPTS:
+                return resp
+        finally:
+            health.breaker.end_trial(token)
+
+        time.sleep(backoff_delay(attempt, resp))
+        attempt += 1
+        health.count("retries")
+
+
+# ---- asyncio ------------------------------------------------------------------
+# Same policy for coroutine `send`s (watsonx_client.post_agent_async). A losing
+# hedge is cancelled here instead of running to completion on a thread.
+
+async def _timed_async(health, send):
+    start = time.monotonic()
+    resp = await send()
+    if not _retryable(resp):
+        health.latency.add(time.monotonic() - start)
+    return resp
+
+
+async def _send_hedged_async(health, send):
+    delay = health.hedge_delay()
+    if delay is None:
+        return await _timed_async(health, send)
+
+    primary = asyncio.ensure_future(_timed_async(health, send))
+    done, _ = await asyncio.wait([primary], timeout=delay)
+    if done:
+        return primary.result()
+
+    health.count("hedges")
+    hedge = asyncio.ensure_future(_timed_async(health, send))
+    pending = {primary, hedge}
+    resp, error = None, None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                try:
+                    resp = task.result()
+                except httpx.TransportError as e:
+                    error = e
+                    continue
+                if not _retryable(resp):
+                    if task is hedge:
+                        health.count("hedge_wins")
+                    return resp
+    finally:
+        for task in pending:
+            task.cancel()
+    if resp is not None:
+        return resp
+    raise error
+
+
+async def call_with_resilience_async(deployment_id, url, send):
+    """Async counterpart of call_with_resilience(); `send` is a coroutine function."""
+    health = get_health(deployment_id)
+    health.count("requests")
+    attempt = 0
+    while True:
+        token = health.breaker.allow()
+        if not token:
+            health.count("short_circuited")
+            return _circuit_open_response(url)
+
+        resp = None
+        try:
+            resp = await _send_hedged_async(health, send)
+        except httpx.TransportError:
+            health.breaker.record_failure()
+            if attempt + 1 >= RETRY_MAX_ATTEMPTS:
+                raise
+        else:
+            if _unhealthy(resp):
+                health.breaker.record_failure()
+            else:
+                health.breaker.record_success()
+            if not _retryable(resp) or attempt + 1 >= RETRY_MAX_ATTEMPTS:
+                return resp
+        finally:
+            health.breaker.end_trial(token)
+
+        await asyncio.sleep(backoff_delay(attempt, resp))
+        attempt += 1
+        health.count("retries")